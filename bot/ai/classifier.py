@@ -4,7 +4,7 @@ import re
 from typing import Any, Dict, List, Optional
 
 from ..config import Settings
-from ..db import get_active_prompt_config
+from ..db import get_active_prompt_config, run_db
 
 
 def _simple_rule_based(text: str) -> Dict[str, Any]:
@@ -290,7 +290,7 @@ async def classify_text_ai(
         # DB'dan active prompt_config ni olib ko'ramiz
         prompt_config: Optional[Dict[str, Any]] = None
         try:
-            prompt_config = get_active_prompt_config(settings)
+            prompt_config = await run_db(get_active_prompt_config, settings)
         except Exception as e:
             print("get_active_prompt_config xato:", repr(e))
             prompt_config = None
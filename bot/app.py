@@ -0,0 +1,97 @@
+# bot/app.py
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+
+from .config import Settings
+from .customers import CUSTOMERS
+from .duplicates import get_duplicate_index
+from .finalize_delay import FINALIZE_DELAYS
+from .handlers.admin_stats import register_admin_stats_handlers
+from .handlers.order_finalize import after_order_posted
+from .handlers.orders import register_order_handlers
+from .handlers.status_checker import router as status_router
+from .handlers.voice_stt import register_voice_handlers
+from .log_writer import start_log_writer
+from .handlers.order_outbox import start_outbox
+from .partitions import start_partition_maintenance
+from .prompt.admin_prompt import register_admin_prompt_handlers
+from .segmentation import ConversationSegmenter
+from .storage import set_segmenter
+
+logger = logging.getLogger(__name__)
+
+
+def create_bot(settings: Settings) -> Bot:
+    return Bot(
+        token=settings.tg_bot_token,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+
+
+def build_dispatcher(settings: Settings) -> Dispatcher:
+    """
+    Barcha handlerlar ulangan Dispatcher.
+    main.py (bitta process) va sharding worker'lari shu yerdan foydalanadi.
+    """
+    set_segmenter(
+        ConversationSegmenter(settings.max_diff_seconds) if settings.group_segmentation else None
+    )
+    FINALIZE_DELAYS.configure(settings)
+
+    dp = Dispatcher()
+    dp.include_router(status_router)
+    # /stats guruhda ham ishlaydi – guruhdagi barcha xabarlarni oladigan zakaz handleridan oldin
+    register_admin_stats_handlers(dp, settings)
+    register_voice_handlers(dp, settings)
+    register_order_handlers(dp, settings)
+    register_admin_prompt_handlers(dp, settings)
+
+    @dp.startup()
+    async def _start_log_writer():
+        if settings.db_dsn:
+            start_log_writer(settings)
+
+    @dp.startup()
+    async def _start_partition_maintenance():
+        if settings.db_dsn:
+            start_partition_maintenance(settings)
+
+    @dp.startup()
+    async def _start_outbox(bot: Bot):
+        if settings.db_dsn:
+            start_outbox(bot, settings, after_order_posted)
+
+    @dp.startup()
+    async def _load_customers():
+        if not settings.db_dsn or settings.customer_prefill_days <= 0:
+            return
+        try:
+            loaded = await CUSTOMERS.load(settings)
+            logger.info("Returning customer index: %s ta (guruh, telefon) yuklandi", loaded)
+        except Exception as e:
+            logger.error("Mijozlar indeksini yuklab bo'lmadi: %s", e)
+
+    @dp.startup()
+    async def _load_duplicate_window():
+        duplicates = get_duplicate_index(settings)
+        if not settings.db_dsn or duplicates is None:
+            return
+        try:
+            loaded = await duplicates.load(settings)
+            logger.info("Duplicate index: so'nggi %s daqiqadan %s ta zakaz", settings.duplicate_window_minutes, loaded)
+        except Exception as e:
+            logger.error("Dublikat oynasini tiklab bo'lmadi: %s", e)
+
+    @dp.startup()
+    async def _load_finalize_history():
+        if not settings.db_dsn:
+            return
+        try:
+            await FINALIZE_DELAYS.load_history(settings)
+        except Exception as e:
+            logger.error("Finalize delay tarixini yuklab bo'lmadi: %s", e)
+
+    return dp
@@ -19,9 +19,31 @@ class Settings:
     error_group_id: int | None
     ai_check_group_id: int | None  # AI_CHECK guruh
     db_dsn: str | None  # Postgres DSN
+    db_pool_min: int
+    db_pool_max: int
+    db_pool_timeout: float  # bo'sh connection kutish (soniya)
+    db_statement_timeout_ms: int
+    log_flush_seconds: float  # ai_check/error/voice loglari write-behind flush oralig'i
+    log_spill_dir: str  # DB ishlamasa loglar shu papkaga yoziladi
+    log_retention_months: int  # log partitsiyalari shuncha oydan keyin DROP (0 – o'chirilmaydi)
+    log_archive_dir: str | None  # berilsa: eski log partitsiyalari zstd arxivga ko'chadi
+    log_archive_after_months: int
+    customer_prefill_days: int  # qayta kelgan mijoz manzili shuncha kunlik zakazlardan (0 – o'chiq)
+    duplicate_window_minutes: int  # shu oynada bir xil (telefon, summa, manzil) – dublikat (0 – o'chiq)
+    duplicate_action: str  # "flag" – belgi bilan yuboriladi | "suppress" – yuborilmaydi
+    outbox_lease_seconds: float  # outbox qatori shuncha vaqt band (ko'rsatilgan urinish tugamasa – qayta)
 
     uzbekvoice_api_key: str | None  # <<< YANGI MAYDON
 
+    session_store: str | None  # "sqlite:sessions.db" | "postgres" | None
+    session_flush_seconds: float
+
+    workers: int  # >1 bo'lsa: ingress + N worker process (chat_id sharding)
+
+    shutdown_timeout_seconds: float  # SIGTERM dan keyin in-flight ishlarni kutish muddati
+
+    group_segmentation: bool  # xabarlarni (chat, user) emas, zakaz bo'yicha guruhlash
+
     @property
     def openai_enabled(self) -> bool:
         return bool(self.openai_api_key)
@@ -49,9 +71,33 @@ def load_settings() -> Settings:
     ai_check_raw = os.getenv("AI_CHECK")
 
     db_dsn = os.getenv("DB_DSN")
+    db_pool_min = int(os.getenv("DB_POOL_MIN", "1"))
+    db_pool_max = int(os.getenv("DB_POOL_MAX", "10"))
+    db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+    db_statement_timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+    log_flush_seconds = float(os.getenv("LOG_FLUSH_SECONDS", "2.0"))
+    log_spill_dir = os.getenv("LOG_SPILL_DIR", "data/log_spill")
+    log_retention_months = int(os.getenv("LOG_RETENTION_MONTHS", "6"))
+    log_archive_dir = os.getenv("LOG_ARCHIVE_DIR") or None
+    log_archive_after_months = int(os.getenv("LOG_ARCHIVE_AFTER_MONTHS", "1"))
+    customer_prefill_days = int(os.getenv("CUSTOMER_PREFILL_DAYS", "90"))
+    duplicate_window_minutes = int(os.getenv("DUPLICATE_WINDOW_MINUTES", "30"))
+    duplicate_action = os.getenv("DUPLICATE_ACTION", "flag").strip().lower()
+    if duplicate_action not in ("flag", "suppress"):
+        duplicate_action = "flag"
+    outbox_lease_seconds = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
 
     uzbekvoice_api_key = os.getenv("UZBEKVOICE_API_KEY")  # <<< .env dan olamiz
 
+    session_store = os.getenv("SESSION_STORE") or None
+    session_flush_seconds = float(os.getenv("SESSION_FLUSH_SECONDS", "1.0"))
+
+    workers = int(os.getenv("WORKERS", "1"))
+
+    shutdown_timeout_seconds = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "25"))
+
+    group_segmentation = os.getenv("GROUP_SEGMENTATION", "False").lower() == "true"
+
     def _to_int(value: str | None) -> int | None:
         if not value:
             return None
@@ -77,5 +123,23 @@ def load_settings() -> Settings:
         error_group_id=error_group_id,
         ai_check_group_id=ai_check_group_id,
         db_dsn=db_dsn,
+        db_pool_min=db_pool_min,
+        db_pool_max=db_pool_max,
+        db_pool_timeout=db_pool_timeout,
+        db_statement_timeout_ms=db_statement_timeout_ms,
+        log_flush_seconds=log_flush_seconds,
+        log_spill_dir=log_spill_dir,
+        log_retention_months=log_retention_months,
+        log_archive_dir=log_archive_dir,
+        log_archive_after_months=log_archive_after_months,
+        customer_prefill_days=customer_prefill_days,
+        duplicate_window_minutes=duplicate_window_minutes,
+        duplicate_action=duplicate_action,
+        outbox_lease_seconds=outbox_lease_seconds,
         uzbekvoice_api_key=uzbekvoice_api_key,  # <<< shu yerda
+        session_store=session_store,
+        session_flush_seconds=session_flush_seconds,
+        workers=workers,
+        shutdown_timeout_seconds=shutdown_timeout_seconds,
+        group_segmentation=group_segmentation,
     )
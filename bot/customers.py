@@ -0,0 +1,201 @@
+# bot/customers.py
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config import Settings
+from .db import load_last_orders_by_phone, run_db
+from .models import OrderSession
+from .utils.phones import normalize_phone_list_strict
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 50000  # startup'da shuncha eng yangi telefon yuklanadi
+MISS_CACHE_SIZE = 10000
+MISS_TTL_SECONDS = 600  # topilmagan telefon uchun DB ga qayta bormaslik muddati
+
+CustomerKey = Tuple[int, str]  # (group_id, telefon)
+
+
+@dataclass
+class CustomerInfo:
+    order_id: int
+    group_id: int
+    location: Dict[str, Any]
+    amount: Optional[int]
+    created_at: datetime
+
+
+class CustomerIndex:
+    """
+    (guruh, normalizatsiyalangan telefon +998...) -> mijozning shu guruhdagi oxirgi faol zakazi.
+    Kalitda guruh bor: bitta telefonning boshqa guruhdagi yangiroq zakazi bu guruhnikini
+    siqib chiqarmaydi va DB so'rovini to'xtatmaydi.
+
+    - load(): startup'da so'nggi CUSTOMER_PREFILL_DAYS kundagi eng yangi CACHE_SIZE (guruh, telefon)
+    - lookup(): avval xotira, bo'lmasa bitta SELECT (ai_orders_phones_gin, group_id bilan);
+      topilmagan (guruh, telefon) MISS_TTL_SECONDS davomida DB ga qayta so'ralmaydi
+    - remember(): finalize yangi zakazni yozgandan keyin
+    - forget_order(): zakaz bekor qilindi / manzili reply bilan o'zgardi
+    """
+
+    def __init__(self, capacity: int = CACHE_SIZE):
+        self._capacity = capacity
+        self._entries: "OrderedDict[CustomerKey, CustomerInfo]" = OrderedDict()
+        self._missing: "OrderedDict[CustomerKey, float]" = OrderedDict()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _put(self, phone: str, info: CustomerInfo) -> None:
+        key = (info.group_id, phone)
+        current = self._entries.get(key)
+        if current is not None and current.created_at > info.created_at:
+            return
+        self._entries[key] = info
+        self._entries.move_to_end(key)
+        self._missing.pop(key, None)
+        while len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+
+    def _mark_missing(self, key: CustomerKey) -> None:
+        self._missing[key] = time.monotonic() + MISS_TTL_SECONDS
+        self._missing.move_to_end(key)
+        while len(self._missing) > MISS_CACHE_SIZE:
+            self._missing.popitem(last=False)
+
+    def _known_missing(self, key: CustomerKey) -> bool:
+        until = self._missing.get(key)
+        if until is None:
+            return False
+        if until < time.monotonic():
+            del self._missing[key]
+            return False
+        return True
+
+    @staticmethod
+    def _info(row: Dict[str, Any]) -> CustomerInfo:
+        return CustomerInfo(
+            order_id=row["order_id"],
+            group_id=row["group_id"],
+            location=row["location"],
+            amount=row["amount"],
+            created_at=row["created_at"],
+        )
+
+    async def load(self, settings: Settings) -> int:
+        rows = await run_db(
+            load_last_orders_by_phone,
+            settings,
+            settings.customer_prefill_days,
+            limit=self._capacity,
+        )
+        # Eskisidan yangisiga – LRU oxirida eng yangilari qoladi
+        for row in reversed(rows):
+            self._put(row["phone"], self._info(row))
+        return len(rows)
+
+    def remember(self, phones: Iterable[str], info: CustomerInfo) -> None:
+        for phone in normalize_phone_list_strict(list(phones)):
+            self._put(phone, info)
+
+    def forget_order(self, order_id: int) -> None:
+        # Bekor qilish kam uchraydi – to'liq o'tish yetarli
+        for key in [k for k, info in self._entries.items() if info.order_id == order_id]:
+            del self._entries[key]
+
+    async def lookup(
+            self,
+            settings: Settings,
+            phones: Iterable[str],
+            group_id: int,
+    ) -> Optional[CustomerInfo]:
+        """
+        Telefonlardan birortasining shu guruhdagi eng yangi zakazi.
+        """
+        cutoff = datetime.now(timezone.utc).timestamp() - settings.customer_prefill_days * 86400
+        found: List[CustomerInfo] = []
+        to_fetch: List[str] = []
+        for phone in normalize_phone_list_strict(list(phones)):
+            key = (group_id, phone)
+            info = self._entries.get(key)
+            if info is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found.append(info)
+            elif not self._known_missing(key):
+                to_fetch.append(phone)
+
+        if to_fetch and settings.db_dsn:
+            rows = await run_db(
+                load_last_orders_by_phone,
+                settings,
+                settings.customer_prefill_days,
+                phones=to_fetch,
+                group_id=group_id,
+            )
+            fetched = {row["phone"]: self._info(row) for row in rows}
+            for phone in to_fetch:
+                info = fetched.get(phone)
+                if info is None:
+                    self.misses += 1
+                    self._mark_missing((group_id, phone))
+                else:
+                    self.db_hits += 1
+                    self._put(phone, info)
+                    found.append(info)
+
+        found = [info for info in found if info.created_at.timestamp() >= cutoff]
+        if not found:
+            return None
+        return max(found, key=lambda info: info.created_at)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+        }
+
+
+CUSTOMERS = CustomerIndex()
+
+
+async def prefill_returning_customer(
+        settings: Settings,
+        session: OrderSession,
+        group_id: int,
+) -> Optional[CustomerInfo]:
+    """
+    Sessiyada telefon bor, manzil yo'q: shu guruhdagi mijozning oxirgi zakazi
+    bo'lsa, manzil o'shandan olinadi (location so'ralmaydi). Keyin kelgan
+    location baribir uni almashtiradi.
+    """
+    if session.location is not None or not session.phones or settings.customer_prefill_days <= 0:
+        return None
+    try:
+        info = await CUSTOMERS.lookup(settings, session.phones, group_id=group_id)
+    except Exception as e:
+        logger.error("Returning customer lookup failed: %s", e)
+        return None
+    if info is None:
+        return None
+
+    session.location = {**info.location, "prefilled_from_order": info.order_id}
+    logger.info(
+        "Returning customer: phones=%s -> order_id=%s location prefilled",
+        sorted(session.phones),
+        info.order_id,
+    )
+    return info
+
+
+def prefill_notice(info: CustomerInfo) -> str:
+    return (
+        f"📍 Manzil mijozning oldingi zakazidan olindi (ID: {info.order_id}).\n"
+        "Boshqa manzil bo'lsa, location yuboring."
+    )
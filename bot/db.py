@@ -1,152 +1,178 @@
 # bot/db.py
-import json
-from typing import List, Optional, Dict, Any
+import asyncio
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
 
-import psycopg2
 from aiogram.types import Message
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 
 from .config import Settings
+from .db_pool import get_pool
+from .migrate import run_migrations
 
-_connection = None
+T = TypeVar("T")
 
 
-def _get_connection(settings: Settings):
+@contextmanager
+def db_cursor(settings: Settings) -> Iterator[Any]:
     """
-    Bitta global connection. Autocommit yoqilgan.
+    Pooldan connection olib cursor beradi (autocommit yoqilgan).
+    Blok tugashi bilan connection poolga qaytadi.
     """
-    global _connection
-    if _connection is None or _connection.closed:
-        if not settings.db_dsn:
-            raise RuntimeError("DB_DSN .env ichida ko'rsatilmagan, Postgresga ulana olmayman.")
-        _connection = psycopg2.connect(settings.db_dsn)
-        _connection.autocommit = True
-    return _connection
+    with get_pool(settings).connection() as conn:
+        with conn.cursor() as cur:
+            yield cur
 
 
-def init_db(settings: Settings) -> None:
+@contextmanager
+def db_transaction(settings: Settings) -> Iterator[Any]:
     """
-    Barcha jadval va kerakli ustunlarni yaratib beradi.
+    db_cursor kabi, lekin blok bitta tranzaksiya: xato bo'lsa hammasi rollback.
     """
-    conn = _get_connection(settings)
-    with conn.cursor() as cur:
-        # === ai_orders ===
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS ai_orders (
-                id              SERIAL PRIMARY KEY,
-                user_message_id BIGINT,
-                user_id         BIGINT NOT NULL,
-                username        TEXT,
-                full_name       TEXT,
-                group_id        BIGINT NOT NULL,
-                group_title     TEXT,
-                order_text      TEXT,
-                phones          TEXT[],
-                location        JSONB,
-                amount          BIGINT,
-                is_active       BOOLEAN NOT NULL DEFAULT TRUE,
-                cancelled_at    TIMESTAMPTZ,
-                created_at      TIMESTAMPTZ DEFAULT now()
-            );
-            """
-        )
-        # Eskidan qolgan bo'lishi mumkin, shuning uchun IF NOT EXISTS bilan yana bir marta tekshiramiz
-        cur.execute(
-            """
-            ALTER TABLE ai_orders
-            ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE;
-            """
-        )
-        cur.execute(
-            """
-            ALTER TABLE ai_orders
-            ADD COLUMN IF NOT EXISTS cancelled_at TIMESTAMPTZ;
-            """
-        )
-        cur.execute(
-            """
-            ALTER TABLE ai_orders
-            ADD COLUMN IF NOT EXISTS amount BIGINT;
-            """
-        )
-
-        # === ai_voice_logs ===
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS ai_voice_logs (
-                id              SERIAL PRIMARY KEY,
-                user_message_id BIGINT,
-                user_id         BIGINT NOT NULL,
-                username        TEXT,
-                full_name       TEXT,
-                group_id        BIGINT NOT NULL,
-                group_title     TEXT,
-                voice_file_id   TEXT,
-                stt_text        TEXT,
-                phones          TEXT[],
-                amount          BIGINT,
-                created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
-            """
-        )
-
-        # === ai_check_logs ===
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS ai_check_logs (
-                id              SERIAL PRIMARY KEY,
-                user_message_id BIGINT,
-                user_id         BIGINT,
-                username        TEXT,
-                full_name       TEXT,
-                group_id        BIGINT,
-                group_title     TEXT,
-                text            TEXT,
-                ai              JSONB,
-                created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
-            """
-        )
+    with get_pool(settings).connection() as conn:
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Sinxron DB funksiyasini thread'da bajaradi – async handlerlar event loop'ni bloklamaydi.
+    """
+    return await asyncio.to_thread(func, *args, **kwargs)
 
-        # === ai_error_logs ===
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS ai_error_logs (
-                id              SERIAL PRIMARY KEY,
-                user_message_id BIGINT,
-                user_id         BIGINT,
-                username        TEXT,
-                full_name       TEXT,
-                group_id        BIGINT,
-                group_title     TEXT,
-                text            TEXT,
-                created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
-            """
-        )
 
-        # === ai_prompt_configs ===
-        # qo'lda yoki optimizer orqali kiritiladigan prompt konfiguratsiyalar
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS ai_prompt_configs (
-                id          SERIAL PRIMARY KEY,
-                created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
-                source      TEXT NOT NULL,          -- 'manual' | 'optimizer'
-                version     INTEGER NOT NULL,       -- 1, 2, 3 ...
-                is_active   BOOLEAN NOT NULL DEFAULT FALSE,
-                payload     JSONB NOT NULL
-            );
-            """
-        )
-        # version ustuniga index xohlasa qo'shsa bo'ladi, hozir shart emas
+def init_db(settings: Settings) -> None:
+    """
+    Sxemani oxirgi versiyaga keltiradi (bot/migrations/*.sql, schema_version jadvali).
+    Baza allaqachon oxirgi versiyada bo'lsa – bitta SELECT, DDL yo'q.
+    """
+    run_migrations(settings)
 
 
 # ======================================================================
 # PROMPT DATASET UCHUN ORDERLARNI OQISH
 # ======================================================================
 
+ORDER_PAGE_SIZE = 1000
+
+
+def iter_orders(
+        settings: Settings,
+        *,
+        group_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        has_amount: Optional[bool] = None,
+        with_text: bool = False,
+        newest_first: bool = True,
+        limit: Optional[int] = None,
+        page_size: int = ORDER_PAGE_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """
+    ai_orders ni sahifalab (keyset: created_at, id) generator sifatida beradi.
+
+    - xotira: bir vaqtda faqat bitta sahifa (page_size qator)
+    - har sahifa alohida qisqa so'rov: connection sahifalar orasida poolga
+      qaytadi, iste'molchi sekin bo'lsa ham (LLM, fayl) pool band bo'lmaydi
+    - OFFSET yo'q: har sahifa (created_at, id) indeksidan davom etadi
+    - manzil SQL ichida olinadi (location->>'address' / 'raw'), JSON Pythonda parslanmaydi
+
+    Filtrlar: group_id, since <= created_at < until, has_amount (True/False),
+    with_text (order_text bo'sh emas). created_at NULL bo'lgan qatorlar kirmaydi.
+    """
+    conditions = ["created_at IS NOT NULL"]
+    params: List[Any] = []
+    if group_id is not None:
+        conditions.append("group_id = %s")
+        params.append(group_id)
+    if since is not None:
+        conditions.append("created_at >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("created_at < %s")
+        params.append(until)
+    if has_amount is True:
+        conditions.append("amount IS NOT NULL")
+    elif has_amount is False:
+        conditions.append("amount IS NULL")
+    if with_text:
+        conditions.append("order_text IS NOT NULL AND order_text <> ''")
+
+    cmp, direction = ("<", "DESC") if newest_first else (">", "ASC")
+    last: Optional[Tuple[datetime, int]] = None
+    remaining = limit
+
+    while remaining is None or remaining > 0:
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if last is not None:
+            page_conditions.append(f"(created_at, id) {cmp} (%s, %s)")
+            page_params.extend(last)
+        size = page_size if remaining is None else min(page_size, remaining)
+
+        with db_cursor(settings) as cur:
+            cur.execute(
+                f"""
+                SELECT
+                    id,
+                    created_at,
+                    group_id,
+                    user_id,
+                    order_text,
+                    phones,
+                    amount,
+                    COALESCE(NULLIF(location->>'address', ''), NULLIF(location->>'raw', '')) AS address,
+                    is_active
+                FROM ai_orders
+                WHERE {" AND ".join(page_conditions)}
+                ORDER BY created_at {direction}, id {direction}
+                LIMIT %s;
+                """,
+                (*page_params, size),
+            )
+            rows = cur.fetchall()
+
+        for order_id, created_at, gid, user_id, order_text, phones, amount, address, is_active in rows:
+            yield {
+                "id": order_id,
+                "created_at": created_at,
+                "group_id": gid,
+                "user_id": user_id,
+                "order_text": order_text,
+                "phones": phones or [],
+                "amount": int(amount) if amount is not None else None,
+                "address": address,
+                "is_active": is_active,
+            }
+
+        if len(rows) < size:
+            return
+        last = (rows[-1][1], rows[-1][0])
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+def order_dataset_record(order: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    iter_orders qatori -> prompt optimizer / evaluation misoli.
+    """
+    return {
+        "raw_text": order["order_text"],
+        "true_phones": order["phones"],
+        "true_amount": order["amount"],
+        "true_address": order["address"],
+    }
+
+
 def load_orders_for_prompt_dataset(
         settings: Settings,
         limit: int = 200,
@@ -159,62 +185,10 @@ def load_orders_for_prompt_dataset(
       - true_amount
       - true_address
     """
-    conn = _get_connection(settings)
-
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT
-                order_text,
-                phones,
-                amount,
-                location
-            FROM ai_orders
-            WHERE order_text IS NOT NULL
-            ORDER BY created_at DESC
-            LIMIT %s;
-            """,
-            (limit,),
-        )
-        rows = cur.fetchall()
-
-    records = []
-    for order_text, phones, amount, location in rows:
-        if not order_text:
-            continue
-
-        true_phones = phones or []
-        true_amount = int(amount) if amount is not None else None
-
-        true_address = None
-        if location is not None:
-            if isinstance(location, dict):
-                true_address = (
-                        location.get("address")
-                        or location.get("raw")
-                        or None
-                )
-            else:
-                try:
-                    loc_obj = json.loads(location)
-                    true_address = (
-                            loc_obj.get("address")
-                            or loc_obj.get("raw")
-                            or None
-                    )
-                except Exception:
-                    true_address = None
-
-        records.append(
-            {
-                "raw_text": order_text,
-                "true_phones": true_phones,
-                "true_amount": true_amount,
-                "true_address": true_address,
-            }
-        )
-
-    return records
+    return [
+        order_dataset_record(order)
+        for order in iter_orders(settings, with_text=True, limit=limit)
+    ]
 
 
 # ======================================================================
@@ -226,8 +200,7 @@ def get_active_prompt_config(settings: Settings) -> Optional[Dict[str, Any]]:
     Hozirda active bo'lgan prompt_config.payload ni qaytaradi (JSON sifatida).
     Agar topilmasa, None.
     """
-    conn = _get_connection(settings)
-    with conn.cursor() as cur:
+    with db_cursor(settings) as cur:
         cur.execute(
             """
             SELECT payload
@@ -253,8 +226,7 @@ def create_prompt_config(
     Yangi prompt_config yozadi va xohlasa active qiladi.
     version = oldingi max(version) + 1 bo'ladi.
     """
-    conn = _get_connection(settings)
-    with conn.cursor() as cur:
+    with db_cursor(settings) as cur:
         # Avvalgi version topamiz
         cur.execute("SELECT COALESCE(MAX(version), 0) FROM ai_prompt_configs;")
         (max_version,) = cur.fetchone()
@@ -288,61 +260,156 @@ def create_prompt_config(
 # ORDERS – SAQLASH / YANGILASH / CANCEL
 # ======================================================================
 
-def save_order_row(
+def save_finalized_order(
         settings: Settings,
         *,
         message: Message,
         phones: Optional[List[str]],
         order_text: str,
         location: Optional[dict],
-        amount: Optional[int] = None,
-) -> int:
-    conn = _get_connection(settings)
+        amount: Optional[int],
+        messages: List[str],
+        message_part: int = 0,
+        outbox_chat_ids: Sequence[int] = (),
+        card: Optional[Dict[str, Any]] = None,
+        outbox_lease_seconds: float = 0,
+) -> Tuple[int, bool]:
+    """
+    ai_orders + ai_order_dataset + ai_order_outbox ni BITTA statement (CTE)
+    bilan yozadi: hammasi yoziladi yoki hech biri.
+
+    Outbox qatorlari (har bir outbox_chat_ids uchun bittadan) outbox_lease_seconds
+    ga band qilingan holda yoziladi: birinchi yuborishni finalize o'zi qiladi,
+    u ulgurmasa (crash) – lease tugagach bot/handlers/order_outbox.py worker'i yuboradi.
+
+    Idempotent: (group_id, user_message_id, message_part) bo'yicha zakaz
+    allaqachon bo'lsa, hech narsa yozilmaydi va mavjud id qaytadi.
+    Qaytadi: (order_id, created)
+    """
     user = message.from_user
 
     username = user.username if user and user.username else None
     full_name = user.full_name if user and user.full_name else None
+    user_id = user.id if user else None
 
-    with conn.cursor() as cur:
+    with db_cursor(settings) as cur:
         cur.execute(
             """
-            INSERT INTO ai_orders (
-                user_message_id,
-                user_id,
-                username,
-                full_name,
-                group_id,
-                group_title,
-                order_text,
-                phones,
-                location,
-                amount,
-                is_active,
-                cancelled_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, NULL)
-            RETURNING id;
-            """,
-            (
-                message.message_id,
-                user.id if user else None,
-                username,
-                full_name,
-                message.chat.id,
-                message.chat.title,
-                order_text,
-                phones if phones else None,
-                Json(location) if location else None,
-                amount,
+            WITH new_order AS (
+                INSERT INTO ai_orders (
+                    user_message_id,
+                    user_id,
+                    username,
+                    full_name,
+                    group_id,
+                    group_title,
+                    order_text,
+                    phones,
+                    location,
+                    amount,
+                    message_part,
+                    is_active,
+                    cancelled_at
+                ) VALUES (
+                    %(user_message_id)s, %(user_id)s, %(username)s, %(full_name)s,
+                    %(group_id)s, %(group_title)s, %(order_text)s, %(phones)s,
+                    %(location)s, %(amount)s, %(message_part)s, TRUE, NULL
+                )
+                ON CONFLICT (group_id, user_message_id, message_part)
+                    WHERE message_part IS NOT NULL
+                    DO NOTHING
+                RETURNING id
             ),
+            new_dataset AS (
+                INSERT INTO ai_order_dataset (
+                    order_id,
+                    user_message_id,
+                    user_id,
+                    username,
+                    full_name,
+                    group_id,
+                    group_title,
+                    messages,
+                    phones,
+                    location,
+                    amount
+                )
+                SELECT
+                    id, %(user_message_id)s, %(user_id)s, %(username)s, %(full_name)s,
+                    %(group_id)s, %(group_title)s, %(messages)s, %(phones)s,
+                    %(location)s, %(amount)s
+                FROM new_order
+                RETURNING order_id
+            ),
+            new_outbox AS (
+                INSERT INTO ai_order_outbox (
+                    order_id,
+                    chat_id,
+                    fallback_chat_id,
+                    card,
+                    attempts,
+                    next_attempt_at
+                )
+                SELECT
+                    n.id, t.chat_id, %(group_id)s, %(card)s,
+                    1, now() + make_interval(secs => %(lease)s)
+                FROM new_order n
+                CROSS JOIN unnest(%(outbox_chat_ids)s::BIGINT[]) AS t(chat_id)
+                RETURNING id
+            )
+            SELECT id, TRUE FROM new_order
+            UNION ALL
+            SELECT id, FALSE
+            FROM ai_orders
+            WHERE group_id = %(group_id)s
+              AND user_message_id = %(user_message_id)s
+              AND message_part = %(message_part)s
+              AND NOT EXISTS (SELECT 1 FROM new_order)
+            LIMIT 1;
+            """,
+            {
+                "user_message_id": message.message_id,
+                "user_id": user_id,
+                "username": username,
+                "full_name": full_name,
+                "group_id": message.chat.id,
+                "group_title": message.chat.title,
+                "order_text": order_text,
+                "phones": phones if phones else None,
+                "location": Json(location) if location else None,
+                "amount": amount,
+                "message_part": message_part,
+                "messages": messages if messages else None,
+                "outbox_chat_ids": list(outbox_chat_ids),
+                "card": Json(card) if card is not None else None,
+                "lease": outbox_lease_seconds,
+            },
         )
-        new_id_row = cur.fetchone()
-        order_id = new_id_row[0]
-        return order_id
+        row = cur.fetchone()
+        if row is not None:
+            return row[0], row[1]
+
+        # Parallel tranzaksiya xuddi shu zakazni yozgan: ON CONFLICT uning commit'ini
+        # kutib DO NOTHING qildi, lekin statement snapshot'i u qatorni ko'rmaydi.
+        # Yangi statement (autocommit – yangi snapshot) uni ko'radi.
+        cur.execute(
+            """
+            SELECT id FROM ai_orders
+            WHERE group_id = %s AND user_message_id = %s AND message_part = %s;
+            """,
+            (message.chat.id, message.message_id, message_part),
+        )
+        row = cur.fetchone()
+        if row is None:
+            raise RuntimeError(
+                f"ai_orders: zakaz topilmadi (group_id={message.chat.id}, "
+                f"user_message_id={message.message_id}, message_part={message_part})"
+            )
+        return row[0], False
 
 
 def cancel_order_row(settings: Settings, order_id: int) -> bool:
-    conn = _get_connection(settings)
-    with conn.cursor() as cur:
+    with db_cursor(settings) as cur:
         cur.execute(
             """
             UPDATE ai_orders
@@ -364,6 +431,7 @@ def update_order_row(
         order_text: str,
         location: Optional[dict],
         amount: Optional[int],
+        card: Optional[Dict[str, Any]] = None,
 ) -> bool:
     """
     Mavjud ai_orders yozuvini yangilash.
@@ -373,169 +441,475 @@ def update_order_row(
       - location
       - amount
     ustunlari update qilinadi (faqat is_active = TRUE bo'lsa).
+    card berilsa – ai_order_messages va yuborilmagan ai_order_outbox qatorlaridagi
+    karta ham shu so'rovda yangilanadi.
     """
-    conn = _get_connection(settings)
+    params = {
+        "order_id": order_id,
+        "phones": phones if phones else None,
+        "order_text": order_text,
+        "location": Json(location) if location else None,
+        "amount": amount,
+        "card": Json(card) if card is not None else None,
+    }
+
+    with db_cursor(settings) as cur:
+        if card is None:
+            cur.execute(
+                """
+                UPDATE ai_orders
+                SET
+                    phones     = %(phones)s,
+                    order_text = %(order_text)s,
+                    location   = %(location)s,
+                    amount     = %(amount)s
+                WHERE id = %(order_id)s
+                  AND is_active = TRUE;
+                """,
+                params,
+            )
+            return cur.rowcount > 0
 
-    with conn.cursor() as cur:
         cur.execute(
             """
-            UPDATE ai_orders
-            SET
-                phones     = %s,
-                order_text = %s,
-                location   = %s,
-                amount     = %s
-            WHERE id = %s
-              AND is_active = TRUE;
+            WITH updated AS (
+                UPDATE ai_orders
+                SET
+                    phones     = %(phones)s,
+                    order_text = %(order_text)s,
+                    location   = %(location)s,
+                    amount     = %(amount)s
+                WHERE id = %(order_id)s
+                  AND is_active = TRUE
+                RETURNING id
+            ), cards AS (
+                UPDATE ai_order_messages
+                SET card = %(card)s
+                WHERE order_id IN (SELECT id FROM updated)
+            ), outbox_cards AS (
+                -- Hali yuborilmagan outbox qatorlari ham yangi karta bilan ketsin
+                UPDATE ai_order_outbox
+                SET card = %(card)s
+                WHERE order_id IN (SELECT id FROM updated)
+                  AND status = 'pending'
+            )
+            SELECT COUNT(*) FROM updated;
             """,
-            (
-                phones if phones else None,
-                order_text,
-                Json(location) if location else None,
-                amount,
-                order_id,
-            ),
+            params,
         )
-        return cur.rowcount > 0
+        return cur.fetchone()[0] > 0
 
 
 # ======================================================================
-# VOICE STT LOGS
+# ZAKAZ XABARLARI (chat_id, message_id) -> order_id + karta
 # ======================================================================
 
-def save_voice_stt_row(
+def save_order_messages(
         settings: Settings,
-        *,
-        message: Message,
-        text: str,
-        phones: Optional[List[str]] = None,
-        amount: Optional[int] = None,
-) -> int:
-    conn = _get_connection(settings)
-    user = message.from_user
+        order_id: int,
+        card: Dict[str, Any],
+        messages: Sequence[Tuple[int, int]],
+) -> None:
+    if not messages:
+        return
+    with db_cursor(settings) as cur:
+        execute_values(
+            cur,
+            """
+            INSERT INTO ai_order_messages (chat_id, message_id, order_id, card)
+            VALUES %s
+            ON CONFLICT (chat_id, message_id)
+            DO UPDATE SET order_id = EXCLUDED.order_id, card = EXCLUDED.card
+            """,
+            [(chat_id, message_id, order_id, Json(card)) for chat_id, message_id in messages],
+        )
 
-    username = user.username if user and user.username else None
-    full_name = user.full_name if user and user.full_name else None
 
-    with conn.cursor() as cur:
+def get_order_message(
+        settings: Settings,
+        chat_id: int,
+        message_id: int,
+) -> Optional[Tuple[int, Dict[str, Any]]]:
+    with db_cursor(settings) as cur:
         cur.execute(
-            """
-            INSERT INTO ai_voice_logs (
-                user_message_id,
-                user_id,
-                username,
-                full_name,
-                group_id,
-                group_title,
-                voice_file_id,
-                stt_text,
-                phones,
-                amount
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id;
+            "SELECT order_id, card FROM ai_order_messages WHERE chat_id = %s AND message_id = %s;",
+            (chat_id, message_id),
+        )
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return row[0], row[1]
+
+
+# ======================================================================
+# QAYTA KELGAN MIJOZLAR: telefon -> oxirgi zakaz (bot/customers.py)
+# ======================================================================
+
+CUSTOMER_COLUMNS = ("phone", "order_id", "group_id", "location", "amount", "created_at")
+
+
+def load_last_orders_by_phone(
+        settings: Settings,
+        days: int,
+        *,
+        phones: Optional[Sequence[str]] = None,
+        group_id: Optional[int] = None,
+        limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Har bir (guruh, telefon) uchun oxirgi faol, manzilli zakaz (so'nggi `days` kun).
+    phones berilsa – faqat shular (phones && ... ai_orders_phones_gin indeksidan),
+    aks holda – eng yangi `limit` ta juftlik (startup'da keshni isitish).
+    group_id berilsa – faqat shu guruh zakazlari.
+    """
+    where = [
+        "o.is_active",
+        "o.location IS NOT NULL",
+        "o.created_at >= now() - make_interval(days => %(days)s)",
+    ]
+    params: Dict[str, Any] = {"days": days, "phones": list(phones or ()), "group_id": group_id, "limit": limit}
+    if phones is not None:
+        where.append("o.phones && %(phones)s::TEXT[]")
+        where.append("p.phone = ANY(%(phones)s::TEXT[])")
+    if group_id is not None:
+        where.append("o.group_id = %(group_id)s")
+
+    with db_cursor(settings) as cur:
+        cur.execute(
+            f"""
+            SELECT phone, order_id, group_id, location, amount, created_at
+            FROM (
+                SELECT DISTINCT ON (o.group_id, p.phone)
+                    p.phone, o.id AS order_id, o.group_id, o.location, o.amount, o.created_at
+                FROM ai_orders o
+                CROSS JOIN LATERAL unnest(o.phones) AS p(phone)
+                WHERE {" AND ".join(where)}
+                ORDER BY o.group_id, p.phone, o.created_at DESC
+            ) last_orders
+            ORDER BY created_at DESC
+            {"LIMIT %(limit)s" if limit is not None else ""};
             """,
-            (
-                message.message_id,
-                user.id if user else None,
-                username,
-                full_name,
-                message.chat.id,
-                message.chat.title,
-                message.voice.file_id if message.voice else None,
-                text,
-                phones if phones else None,
-                amount,
-            ),
+            params,
         )
-        new_id_row = cur.fetchone()
-        voice_id = new_id_row[0]
-        return voice_id
+        rows = cur.fetchall()
+    return [dict(zip(CUSTOMER_COLUMNS, row)) for row in rows]
 
 
 # ======================================================================
-# AI CHECK / ERROR LOGS
+# DUBLIKAT ZAKAZLAR: sliding window (bot/duplicates.py)
 # ======================================================================
 
-def save_ai_check_row(
+RECENT_ORDER_COLUMNS = ("order_id", "group_id", "phones", "amount", "location", "created_at", "is_active")
+
+
+def load_recent_orders(
         settings: Settings,
+        window_seconds: float,
         *,
-        message: Message,
-        text: str,
-        ai_result: dict,
-) -> int:
-    conn = _get_connection(settings)
-    user = message.from_user
+        phones: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    So'nggi window_seconds ichidagi zakazlar (bekor qilinganlari ham).
+    phones berilsa – faqat shu telefonlilar (ai_orders_phones_gin),
+    aks holda – hammasi (restart'dan keyin oynani tiklash, ai_orders_created_id_idx).
+    """
+    where = "created_at >= now() - make_interval(secs => %(window)s)"
+    if phones is not None:
+        where += " AND phones && %(phones)s::TEXT[]"
+    with db_cursor(settings) as cur:
+        cur.execute(
+            f"""
+            SELECT id, group_id, phones, amount, location, created_at, is_active
+            FROM ai_orders
+            WHERE {where}
+            ORDER BY created_at, id;
+            """,
+            {"window": window_seconds, "phones": list(phones or ())},
+        )
+        rows = cur.fetchall()
+    return [dict(zip(RECENT_ORDER_COLUMNS, row)) for row in rows]
 
-    username = user.username if user and user.username else None
-    full_name = user.full_name if user and user.full_name else None
 
-    with conn.cursor() as cur:
+def load_group_message_counts(settings: Settings, days: int) -> Dict[int, float]:
+    """
+    ai_order_dataset dan guruhlar bo'yicha "bir zakazdagi xabarlar soni" o'rtachasi
+    (bot/finalize_delay.py).
+    """
+    with db_cursor(settings) as cur:
+        cur.execute(
+            """
+            SELECT group_id, AVG(COALESCE(array_length(messages, 1), 1))
+            FROM ai_order_dataset
+            WHERE created_at > now() - make_interval(days => %s)
+              AND group_id IS NOT NULL
+            GROUP BY group_id;
+            """,
+            (days,),
+        )
+        return {int(g): float(avg) for g, avg in cur.fetchall()}
+
+
+# ======================================================================
+# ZAKAZ OUTBOX (bot/handlers/order_outbox.py)
+# ======================================================================
+
+OUTBOX_COLUMNS = ("order_id", "chat_id", "fallback_chat_id", "card", "attempts")
+
+
+def claim_due_outbox(settings: Settings, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+    """
+    Vaqti kelgan pending qatorlarni band qiladi: attempts+1, next_attempt_at = lease tugashi.
+    SKIP LOCKED – bir nechta worker bitta qatorni olmaydi; lease tugamaguncha
+    qator boshqa claim'ga ko'rinmaydi.
+    """
+    with db_cursor(settings) as cur:
         cur.execute(
             """
-            INSERT INTO ai_check_logs (
-                user_message_id,
-                user_id,
-                username,
-                full_name,
-                group_id,
-                group_title,
-                text,
-                ai
+            UPDATE ai_order_outbox
+            SET attempts = attempts + 1,
+                next_attempt_at = now() + make_interval(secs => %s)
+            WHERE id IN (
+                SELECT id
+                FROM ai_order_outbox
+                WHERE status = 'pending'
+                  AND next_attempt_at <= now()
+                ORDER BY next_attempt_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING order_id, chat_id, fallback_chat_id, card, attempts;
+            """,
+            (lease_seconds, limit),
+        )
+        rows = cur.fetchall()
+    return [dict(zip(OUTBOX_COLUMNS, row)) for row in rows]
+
+
+def renew_outbox_lease(settings: Settings, order_id: int, chat_id: int, attempts: int, lease_seconds: float) -> bool:
+    """
+    Yuborishdan oldin lease'ni uzaytiradi. attempts – fencing token: qatorni boshqa worker
+    qayta claim qilgan bo'lsa (attempts oshgan) yoki u allaqachon yuborilgan bo'lsa – False.
+    """
+    with db_cursor(settings) as cur:
+        cur.execute(
+            """
+            UPDATE ai_order_outbox
+            SET next_attempt_at = now() + make_interval(secs => %s)
+            WHERE order_id = %s
+              AND chat_id = %s
+              AND attempts = %s
+              AND status = 'pending'
             RETURNING id;
             """,
-            (
-                message.message_id,
-                user.id if user else None,
-                username,
-                full_name,
-                message.chat.id,
-                message.chat.title,
-                text,
-                Json(ai_result) if ai_result is not None else None,
+            (lease_seconds, order_id, chat_id, attempts),
+        )
+        return cur.fetchone() is not None
+
+
+def mark_outbox_sent(settings: Settings, sent: Sequence[Tuple[int, int, int, int, int]]) -> int:
+    """
+    sent: [(order_id, chat_id, attempts, sent_chat_id, sent_message_id), ...]
+    Outbox qatori 'sent' bo'ladi va ai_order_messages ga o'sha statement'da yoziladi.
+    Faqat hali pending va o'sha claim'dagi (attempts) qatorlar – qayta chaqirish no-op,
+    lease'i boshqa worker'ga o'tgan qatorning natijasi yozilmaydi. Qaytadi: belgilangan qatorlar.
+    """
+    if not sent:
+        return 0
+    with db_cursor(settings) as cur:
+        rows = execute_values(
+            cur,
+            """
+            WITH sent (order_id, chat_id, attempts, sent_chat_id, sent_message_id) AS (VALUES %s),
+            done AS (
+                UPDATE ai_order_outbox o
+                SET status = 'sent',
+                    sent_chat_id = s.sent_chat_id,
+                    sent_message_id = s.sent_message_id,
+                    sent_at = now(),
+                    last_error = NULL
+                FROM sent s
+                WHERE o.order_id = s.order_id
+                  AND o.chat_id = s.chat_id
+                  AND o.attempts = s.attempts
+                  AND o.status = 'pending'
+                RETURNING o.order_id, o.card, s.sent_chat_id, s.sent_message_id
             ),
+            saved AS (
+                INSERT INTO ai_order_messages (chat_id, message_id, order_id, card)
+                SELECT sent_chat_id, sent_message_id, order_id, card FROM done
+                ON CONFLICT (chat_id, message_id)
+                DO UPDATE SET order_id = EXCLUDED.order_id, card = EXCLUDED.card
+            )
+            SELECT count(*) FROM done
+            """,
+            list(sent),
+            template="(%s::INTEGER, %s::BIGINT, %s::INTEGER, %s::BIGINT, %s::BIGINT)",
+            fetch=True,
         )
-        row = cur.fetchone()
-        return row[0]
+    return sum(count for (count,) in rows)
 
 
-def save_error_row(
+def mark_outbox_failed(
         settings: Settings,
-        *,
+        order_id: int,
+        chat_id: int,
+        attempts: int,
+        error: str,
+        retry_in_seconds: Optional[float],
+) -> None:
+    """
+    retry_in_seconds=None – urinishlar tugadi, qator 'failed' (worker boshqa olmaydi).
+    attempts – o'sha claim: qatorni boshqa worker qayta olgan bo'lsa, uning lease'i buzilmaydi.
+    """
+    with db_cursor(settings) as cur:
+        cur.execute(
+            """
+            UPDATE ai_order_outbox
+            SET last_error = %(error)s,
+                status = CASE WHEN %(retry)s IS NULL THEN 'failed' ELSE 'pending' END,
+                next_attempt_at = now() + make_interval(secs => COALESCE(%(retry)s, 0))
+            WHERE order_id = %(order_id)s
+              AND chat_id = %(chat_id)s
+              AND attempts = %(attempts)s
+              AND status = 'pending';
+            """,
+            {
+                "order_id": order_id,
+                "chat_id": chat_id,
+                "attempts": attempts,
+                "error": error[:1000],
+                "retry": retry_in_seconds,
+            },
+        )
+
+
+# ======================================================================
+# WRITE-BEHIND LOG QATORLARI (bot/log_writer.py)
+# ======================================================================
+
+LOG_TABLE_COLUMNS: Dict[str, Sequence[str]] = {
+    "ai_check_logs": (
+        "user_message_id", "user_id", "username", "full_name",
+        "group_id", "group_title", "text", "ai", "created_at",
+    ),
+    "ai_error_logs": (
+        "user_message_id", "user_id", "username", "full_name",
+        "group_id", "group_title", "text", "created_at",
+    ),
+    "ai_voice_logs": (
+        "user_message_id", "user_id", "username", "full_name",
+        "group_id", "group_title", "voice_file_id", "stt_text", "phones", "amount", "created_at",
+    ),
+}
+LOG_JSON_COLUMNS = {"ai"}
+
+
+def _message_log_fields(message: Message) -> Dict[str, Any]:
+    user = message.from_user
+    return {
+        "user_message_id": message.message_id,
+        "user_id": user.id if user else None,
+        "username": user.username if user and user.username else None,
+        "full_name": user.full_name if user and user.full_name else None,
+        "group_id": message.chat.id,
+        "group_title": message.chat.title,
+        # Buferda/diskda kutgan bo'lsa ham haqiqiy vaqt saqlansin
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def ai_check_log_row(message: Message, text: str, ai_result: Optional[dict]) -> Dict[str, Any]:
+    row = _message_log_fields(message)
+    row.update(text=text, ai=ai_result)
+    return row
+
+
+def error_log_row(message: Message, text: str) -> Dict[str, Any]:
+    row = _message_log_fields(message)
+    row.update(text=text)
+    return row
+
+
+def voice_log_row(
         message: Message,
         text: str,
-) -> int:
-    conn = _get_connection(settings)
-    user = message.from_user
+        phones: Optional[List[str]] = None,
+        amount: Optional[int] = None,
+) -> Dict[str, Any]:
+    row = _message_log_fields(message)
+    row.update(
+        voice_file_id=message.voice.file_id if message.voice else None,
+        stt_text=text,
+        phones=phones if phones else None,
+        amount=amount,
+    )
+    return row
 
-    username = user.username if user and user.username else None
-    full_name = user.full_name if user and user.full_name else None
 
-    with conn.cursor() as cur:
+def insert_log_rows(settings: Settings, table: str, rows: List[Dict[str, Any]]) -> int:
+    """
+    Bir nechta log qatorini multi-row INSERT bilan yozadi (RETURNING yo'q).
+    Sahifalar (page_size) bitta tranzaksiyada: xato bo'lsa hech biri yozilmaydi,
+    shuning uchun LogWriter butun batch'ni spill qilib, keyin qayta yozishi xavfsiz.
+    """
+    columns = LOG_TABLE_COLUMNS[table]
+    values = [
+        tuple(
+            Json(row.get(col)) if col in LOG_JSON_COLUMNS and row.get(col) is not None else row.get(col)
+            for col in columns
+        )
+        for row in rows
+    ]
+    with db_transaction(settings) as cur:
+        execute_values(
+            cur,
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s",
+            values,
+            page_size=1000,
+        )
+    return len(values)
+
+
+# ======================================================================
+# GURUH / KUN STATISTIKASI (ai_group_daily_stats – triggerlar yuritadi)
+# ======================================================================
+
+STATS_COLUMNS = (
+    "orders", "orders_with_amount", "amount_sum", "cancelled",
+    "check_logs", "error_logs", "voice_logs",
+)
+
+
+def load_group_stats(
+        settings: Settings,
+        since: date,
+        until: date,
+        *,
+        group_id: Optional[int] = None,
+        by_day: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    since <= day <= until oralig'idagi agregatlar (faqat rollup jadvali).
+    by_day=False – guruh bo'yicha jami; by_day=True – kun bo'yicha (group_id berilsa – shu guruh).
+    """
+    key = "day" if by_day else "group_id"
+    sums = ", ".join(f"SUM({col})::BIGINT AS {col}" for col in STATS_COLUMNS)
+    conditions = ["day BETWEEN %s AND %s"]
+    params: List[Any] = [since, until]
+    if group_id is not None:
+        conditions.append("group_id = %s")
+        params.append(group_id)
+
+    with db_cursor(settings) as cur:
         cur.execute(
-            """
-            INSERT INTO ai_error_logs (
-                user_message_id,
-                user_id,
-                username,
-                full_name,
-                group_id,
-                group_title,
-                text
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id;
+            f"""
+            SELECT {key}, {sums}
+            FROM ai_group_daily_stats
+            WHERE {" AND ".join(conditions)}
+            GROUP BY {key}
+            ORDER BY {"day" if by_day else "orders DESC"};
             """,
-            (
-                message.message_id,
-                user.id if user else None,
-                username,
-                full_name,
-                message.chat.id,
-                message.chat.title,
-                text,
-            ),
+            params,
         )
-        row = cur.fetchone()
-        return row[0]
+        rows = cur.fetchall()
+    return [dict(zip((key,) + STATS_COLUMNS, row)) for row in rows]
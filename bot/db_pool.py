@@ -0,0 +1,246 @@
+# bot/db_pool.py
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+
+from .config import Settings
+
+logger = logging.getLogger(__name__)
+
+# Shuncha vaqt ishlatilmagan connection olishdan oldin SELECT 1 bilan tekshiriladi
+HEALTH_CHECK_IDLE_SECONDS = 30.0
+# Pool kutish shundan oshsa – warning (pool kichik yoki so'rovlar sekin)
+SLOW_WAIT_SECONDS = 0.1
+
+_DISCONNECT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+# statement_timeout ham OperationalError (QueryCanceled), lekin connection sog' qoladi
+_CANCEL_ERRORS = (psycopg2.errors.QueryCanceled,)
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class _PooledConn:
+    __slots__ = ("conn", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.last_used = time.monotonic()
+
+
+class DBPool:
+    """
+    psycopg2 connection pool (thread-safe): handlerlar DB chaqiruvlarini
+    asyncio.to_thread (run_db) orqali bajaradi, har bir thread o'z connection'ini oladi.
+
+    - min_size ta connection oldindan ochiladi, max_size gacha o'sadi
+    - connection olishda: yopilgan bo'lsa yoki uzoq turgan bo'lsa SELECT 1
+    - uzilish xatosi (OperationalError/InterfaceError) bo'lgan connection poolga qaytmaydi;
+      statement_timeout (QueryCanceled) bundan mustasno – connection qayta ishlatiladi
+    - har bir connection'da statement_timeout (osilib qolgan so'rov poolni band qilmaydi)
+    - kutish metrikalari: stats()
+    """
+
+    def __init__(
+            self,
+            dsn: str,
+            *,
+            min_size: int = 1,
+            max_size: int = 10,
+            timeout: float = 5.0,
+            statement_timeout_ms: int = 5000,
+    ):
+        self._dsn = dsn
+        self._min_size = max(0, min_size)
+        self._max_size = max(1, max_size, self._min_size)
+        self._timeout = timeout
+        self._statement_timeout_ms = statement_timeout_ms
+        # LIFO: eng yaqinda ishlatilgan (issiq) connection birinchi olinadi
+        self._idle: "queue.LifoQueue[_PooledConn]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._closed = False
+
+        self.acquired = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+
+        for _ in range(self._min_size):
+            self._reserve()
+            self._idle.put(self._new_conn())
+
+    def _reserve(self) -> bool:
+        """
+        Yangi connection uchun joy: tekshiruv va _size += 1 bitta lock ostida –
+        parallel thread'lar birgalikda max_size dan oshib ketmaydi.
+        """
+        with self._lock:
+            if self._size >= self._max_size:
+                return False
+            self._size += 1
+            return True
+
+    def _new_conn(self) -> _PooledConn:
+        # Joy _reserve() da olingan; ulanib bo'lmasa – qaytariladi
+        try:
+            conn = psycopg2.connect(
+                self._dsn,
+                options=f"-c statement_timeout={int(self._statement_timeout_ms)}",
+            )
+            conn.autocommit = True
+        except Exception:
+            with self._lock:
+                self._size -= 1
+            raise
+        self.created += 1
+        return _PooledConn(conn)
+
+    def _discard(self, item: _PooledConn) -> None:
+        with self._lock:
+            self._size -= 1
+        self.discarded += 1
+        try:
+            item.conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, item: _PooledConn) -> bool:
+        if item.conn.closed:
+            return False
+        if time.monotonic() - item.last_used < HEALTH_CHECK_IDLE_SECONDS:
+            return True
+        try:
+            with item.conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            return True
+        except Exception:
+            return False
+
+    def _checkout(self) -> _PooledConn:
+        if self._closed:
+            raise RuntimeError("DB pool yopilgan.")
+
+        started = time.monotonic()
+        while True:
+            try:
+                item = self._idle.get_nowait()
+            except queue.Empty:
+                item = None
+                if self._reserve():
+                    item = self._new_conn()
+                else:
+                    remaining = self._timeout - (time.monotonic() - started)
+                    try:
+                        item = self._idle.get(timeout=max(remaining, 0.0))
+                    except queue.Empty:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f"DB pool: {self._timeout:.1f}s ichida bo'sh connection topilmadi "
+                            f"(size={self._size}, max={self._max_size})"
+                        )
+
+            if self._healthy(item):
+                break
+            logger.warning("DB pool: yaroqsiz connection tashlandi, yangisi olinadi.")
+            self._discard(item)
+
+        waited = time.monotonic() - started
+        self.acquired += 1
+        if waited > 0.001:
+            self.waits += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if waited > SLOW_WAIT_SECONDS:
+                logger.warning("DB pool: connection kutish %.0fms (size=%s)", waited * 1000, self._size)
+        return item
+
+    def _checkin(self, item: _PooledConn, broken: bool) -> None:
+        if broken or self._closed or item.conn.closed:
+            self._discard(item)
+            return
+        if item.conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Bekor qilingan so'rov ochiq tranzaksiyani "aborted" holatda qoldirgan bo'lishi mumkin
+            try:
+                item.conn.rollback()
+                item.conn.autocommit = True
+            except Exception:
+                self._discard(item)
+                return
+        item.last_used = time.monotonic()
+        self._idle.put(item)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        item = self._checkout()
+        broken = False
+        try:
+            yield item.conn
+        except _DISCONNECT_ERRORS as e:
+            broken = not isinstance(e, _CANCEL_ERRORS) or bool(item.conn.closed)
+            raise
+        finally:
+            self._checkin(item, broken)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self._size,
+            "idle": self._idle.qsize(),
+            "max": self._max_size,
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "wait_avg_ms": round(self.wait_total / self.waits * 1000, 1) if self.waits else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 1),
+            "timeouts": self.timeouts,
+            "created": self.created,
+            "discarded": self.discarded,
+        }
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                item = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(item)
+
+
+_POOL: Optional[DBPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool(settings: Settings) -> DBPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                if not settings.db_dsn:
+                    raise RuntimeError("DB_DSN .env ichida ko'rsatilmagan, Postgresga ulana olmayman.")
+                _POOL = DBPool(
+                    settings.db_dsn,
+                    min_size=settings.db_pool_min,
+                    max_size=settings.db_pool_max,
+                    timeout=settings.db_pool_timeout,
+                    statement_timeout_ms=settings.db_statement_timeout_ms,
+                )
+    return _POOL
+
+
+def close_pool() -> None:
+    global _POOL
+    if _POOL is not None:
+        logger.info("DB pool stats: %s", _POOL.stats())
+        _POOL.close()
+        _POOL = None
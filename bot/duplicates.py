@@ -0,0 +1,218 @@
+# bot/duplicates.py
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .config import Settings
+from .db import load_recent_orders, run_db
+from .utils.phones import normalize_phone_list_strict
+
+logger = logging.getLogger(__name__)
+
+AMOUNT_BUCKET = 5000  # so'm: 45 000 va 47 000 – bitta bucket
+COORD_DIGITS = 3  # ~100 m: bitta manzildan ikki marta yuborilgan location
+
+# (telefon, summa bucket, taxminiy manzil)
+DuplicateKey = Tuple[str, Optional[int], Optional[Tuple[Any, ...]]]
+
+
+def amount_bucket(amount: Optional[int]) -> Optional[int]:
+    if amount in (None, 0):
+        return None
+    return int(amount) // AMOUNT_BUCKET
+
+
+def rough_location(location: Optional[Dict[str, Any]]) -> Optional[Tuple[Any, ...]]:
+    if not location:
+        return None
+    if location.get("lat") is not None and location.get("lon") is not None:
+        return (
+            "geo",
+            round(float(location["lat"]), COORD_DIGITS),
+            round(float(location["lon"]), COORD_DIGITS),
+        )
+    raw = (location.get("raw") or "").strip().lower()
+    return ("raw", raw) if raw else None
+
+
+def duplicate_keys(
+        phones: Iterable[str],
+        amount: Optional[int],
+        location: Optional[Dict[str, Any]],
+) -> List[DuplicateKey]:
+    bucket = amount_bucket(amount)
+    loc = rough_location(location)
+    return [(phone, bucket, loc) for phone in normalize_phone_list_strict(list(phones))]
+
+
+@dataclass
+class SeenOrder:
+    order_id: int
+    group_id: int
+    created_at: float  # unix timestamp (DB dan tiklangan qatorlar bilan bir xil)
+    active: bool = True
+
+
+class DuplicateIndex:
+    """
+    So'nggi `window` soniyadagi zakazlar: (telefon, summa bucket, taxminiy manzil) -> zakaz.
+    Barcha guruhlar bo'yicha bitta indeks – bir zakaz ikki guruhga tashlansa ham ko'rinadi.
+
+    - add(): finalize zakazni yozgandan keyin
+    - check(): finalize boshida (draft/LLM va guruhga yuborishdan oldin)
+    - load(): startup'da oyna DB dan tiklanadi
+    - mark_cancelled(): bekor qilingan zakaz bilan mos kelsa – faqat belgi, bostirilmaydi
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window = window_seconds
+        self._by_key: Dict[DuplicateKey, SeenOrder] = {}
+        self._by_order: Dict[int, SeenOrder] = {}
+        self._expiry: Deque[Tuple[float, DuplicateKey, int]] = deque()
+        self.checks = 0
+        self.duplicates = 0
+        self.suppressed = 0
+        self.db_lookups = 0
+        self.lookup_ms_total = 0.0
+        self.lookup_ms_max = 0.0
+
+    def _expire(self, now: float) -> None:
+        while self._expiry and self._expiry[0][0] < now - self.window:
+            _, key, order_id = self._expiry.popleft()
+            seen = self._by_key.get(key)
+            if seen is not None and seen.order_id == order_id:
+                del self._by_key[key]
+            if order_id in self._by_order and self._by_order[order_id].created_at < now - self.window:
+                del self._by_order[order_id]
+
+    def add(
+            self,
+            order_id: int,
+            group_id: int,
+            phones: Iterable[str],
+            amount: Optional[int],
+            location: Optional[Dict[str, Any]],
+            *,
+            created_at: Optional[float] = None,
+            active: bool = True,
+    ) -> None:
+        known = self._by_order.get(order_id)
+        if known is not None:
+            # _find_in_db/load bir zakazni qayta beradi – kalitlar allaqachon indeksda,
+            # faqat boshqa worker'dagi bekor qilish belgisi olinadi
+            known.active = known.active and active
+            return
+        created_at = time.time() if created_at is None else created_at
+        seen = SeenOrder(order_id, group_id, created_at, active)
+        self._by_order[order_id] = seen
+        for key in duplicate_keys(phones, amount, location):
+            current = self._by_key.get(key)
+            if current is None or current.created_at <= created_at:
+                self._by_key[key] = seen
+            self._expiry.append((created_at, key, order_id))
+
+    def mark_cancelled(self, order_id: int) -> None:
+        seen = self._by_order.get(order_id)
+        if seen is not None:
+            seen.active = False
+
+    def find(self, keys: List[DuplicateKey]) -> Optional[SeenOrder]:
+        now = time.time()
+        self._expire(now)
+        # DB dan kelgan qatorlar navbatga vaqt tartibida tushmaydi – _expire eski qatorni
+        # oldidagi yangiroq qator tugaguncha qoldirishi mumkin, shuning uchun oyna shu yerda ham
+        matches = [
+            seen for seen in (self._by_key.get(key) for key in keys)
+            if seen is not None and seen.created_at >= now - self.window
+        ]
+        if not matches:
+            return None
+        # Faol zakaz bo'lsa – o'sha (bostirish mumkin), aks holda eng yangisi
+        return max(matches, key=lambda s: (s.active, s.created_at))
+
+    async def _find_in_db(self, settings: Settings, keys: List[DuplicateKey]) -> Optional[SeenOrder]:
+        rows = await run_db(
+            load_recent_orders,
+            settings,
+            self.window,
+            phones=sorted({key[0] for key in keys}),
+        )
+        for row in rows:
+            self._add_row(row)
+        return self.find(keys)
+
+    def _add_row(self, row: Dict[str, Any]) -> None:
+        self.add(
+            row["order_id"],
+            row["group_id"],
+            row["phones"] or [],
+            row["amount"],
+            row["location"],
+            created_at=row["created_at"].timestamp(),
+            active=row["is_active"],
+        )
+
+    async def check(
+            self,
+            settings: Settings,
+            phones: Iterable[str],
+            amount: Optional[int],
+            location: Optional[Dict[str, Any]],
+    ) -> Optional[SeenOrder]:
+        """
+        Xotirada topilmasa va sharding yoqilgan bo'lsa (boshqa guruhlar boshqa
+        process'da) – bitta indekslangan SELECT.
+        """
+        started = time.perf_counter()
+        keys = duplicate_keys(phones, amount, location)
+        found = self.find(keys) if keys else None
+        if found is None and keys and settings.workers > 1 and settings.db_dsn:
+            self.db_lookups += 1
+            try:
+                found = await self._find_in_db(settings, keys)
+            except Exception as e:
+                logger.error("Duplicate DB lookup failed: %s", e)
+
+        took_ms = (time.perf_counter() - started) * 1000
+        self.checks += 1
+        self.lookup_ms_total += took_ms
+        self.lookup_ms_max = max(self.lookup_ms_max, took_ms)
+        if found is not None:
+            self.duplicates += 1
+        return found
+
+    async def load(self, settings: Settings) -> int:
+        rows = await run_db(load_recent_orders, settings, self.window)
+        for row in rows:
+            self._add_row(row)
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_min": round(self.window / 60),
+            "orders": len(self._by_order),
+            "checks": self.checks,
+            "duplicates": self.duplicates,
+            "duplicate_rate": round(self.duplicates / self.checks, 3) if self.checks else 0.0,
+            "suppressed": self.suppressed,
+            "db_lookups": self.db_lookups,
+            "lookup_ms_avg": round(self.lookup_ms_total / self.checks, 3) if self.checks else 0.0,
+            "lookup_ms_max": round(self.lookup_ms_max, 3),
+        }
+
+
+DUPLICATES: Optional[DuplicateIndex] = None
+
+
+def get_duplicate_index(settings: Settings) -> Optional[DuplicateIndex]:
+    """
+    DUPLICATE_WINDOW_MINUTES=0 – dublikat tekshiruvi o'chiq (None).
+    """
+    global DUPLICATES
+    if settings.duplicate_window_minutes <= 0:
+        return None
+    if DUPLICATES is None:
+        DUPLICATES = DuplicateIndex(settings.duplicate_window_minutes * 60)
+    return DUPLICATES
@@ -0,0 +1,72 @@
+# bot/export_orders.py
+"""
+ai_orders ni JSONL ga eksport qilish (xotira doimiy – iter_orders sahifalab o'qiydi).
+
+    python -m bot.export_orders --out orders.jsonl --since 2026-01-01 --group -1001234567890
+    python -m bot.export_orders --format dataset --has-amount --limit 5000 > dataset.jsonl
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from .config import load_settings
+from .db import iter_orders, order_dataset_record
+from .db_pool import close_pool
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_date(value: str) -> datetime:
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="ai_orders -> JSONL eksport")
+    parser.add_argument("--out", help="fayl (berilmasa stdout)")
+    parser.add_argument("--format", choices=("orders", "dataset"), default="orders")
+    parser.add_argument("--group", type=int, help="group_id")
+    parser.add_argument("--since", type=_parse_date, help="created_at >= (ISO sana, UTC)")
+    parser.add_argument("--until", type=_parse_date, help="created_at < (ISO sana, UTC)")
+    amount = parser.add_mutually_exclusive_group()
+    amount.add_argument("--has-amount", dest="has_amount", action="store_const", const=True)
+    amount.add_argument("--no-amount", dest="has_amount", action="store_const", const=False)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--oldest-first", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    settings = load_settings()
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    started = time.perf_counter()
+    count = 0
+    try:
+        for order in iter_orders(
+                settings,
+                group_id=args.group,
+                since=args.since,
+                until=args.until,
+                has_amount=args.has_amount,
+                with_text=args.format == "dataset",
+                newest_first=not args.oldest_first,
+                limit=args.limit,
+        ):
+            row = order_dataset_record(order) if args.format == "dataset" else order
+            out.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        close_pool()
+
+    logger.info("Eksport: %s ta qator, %.1fs", count, time.perf_counter() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
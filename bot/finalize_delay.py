@@ -0,0 +1,108 @@
+# bot/finalize_delay.py
+import logging
+import statistics
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from .config import Settings
+from .db import load_group_message_counts, run_db
+from .models import OrderSession
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DELAY = 5.0
+MIN_DELAY = 1.5
+MAX_DELAY = 15.0
+COMPLETE_DELAY = 1.5  # telefon + summa + lokatsiya bor: deyarli darhol
+
+MIN_SAMPLES = 8
+GROUP_WINDOW = 300
+USER_WINDOW = 60
+GAP_SAFETY = 1.25  # p90 ustiga zaxira
+HISTORY_DAYS = 30
+USER_CACHE_SIZE = 20000  # eng uzoq yozmagan (chat, user) lar chiqarib yuboriladi
+
+
+def _p90(values) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(0.9 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class FinalizeDelayModel:
+    """
+    Har bir guruh (va user) uchun finalize kutish vaqtini tanlaydi.
+
+    - Bir zakaz ichidagi xabarlar orasidagi oraliqlar (gap) kuzatiladi,
+      delay = p90(gap) * GAP_SAFETY, [MIN_DELAY, MAX_DELAY] oralig'ida.
+    - Statistik yetarli bo'lmasa: ai_order_dataset dagi "bir zakaz necha
+      xabardan iborat" o'rtachasi bo'yicha DEFAULT_DELAY masshtablanadi.
+    - Sessiya to'liq bo'lsa (telefon, summa, lokatsiya) – COMPLETE_DELAY.
+    - User oraliqlari LRU (USER_CACHE_SIZE): bir martalik mijozlar xotirada qolib ketmaydi.
+    """
+
+    def __init__(self, max_gap_seconds: float = 120.0):
+        self._max_gap = max_gap_seconds
+        self._group_gaps: Dict[int, Deque[float]] = {}
+        self._user_gaps: "OrderedDict[Tuple[int, int], Deque[float]]" = OrderedDict()
+        self._group_pieces: Dict[int, float] = {}
+        self._time_to_post: Deque[float] = deque(maxlen=1000)
+
+    def configure(self, settings: Settings) -> None:
+        """
+        Sessiya chegarasi bilan bir xil: MAX_DIFF_SECONDS dan katta oraliq – yangi zakaz,
+        uni "zakaz ichidagi" oraliq sifatida hisoblamaymiz.
+        """
+        self._max_gap = float(settings.max_diff_seconds)
+
+    def observe_gap(self, chat_id: int, user_id: Optional[int], gap_seconds: float) -> None:
+        if gap_seconds <= 0 or gap_seconds > self._max_gap:
+            return
+        self._group_gaps.setdefault(chat_id, deque(maxlen=GROUP_WINDOW)).append(gap_seconds)
+        if user_id is not None:
+            key = (chat_id, user_id)
+            gaps = self._user_gaps.get(key)
+            if gaps is None:
+                gaps = self._user_gaps[key] = deque(maxlen=USER_WINDOW)
+                while len(self._user_gaps) > USER_CACHE_SIZE:
+                    self._user_gaps.popitem(last=False)
+            else:
+                self._user_gaps.move_to_end(key)
+            gaps.append(gap_seconds)
+
+    def delay_for(self, session: OrderSession) -> float:
+        if session.phones and session.location is not None and session.amount:
+            return COMPLETE_DELAY
+
+        gaps = self._user_gaps.get((session.chat_id, session.user_id))
+        if not gaps or len(gaps) < MIN_SAMPLES:
+            gaps = self._group_gaps.get(session.chat_id)
+
+        if gaps and len(gaps) >= MIN_SAMPLES:
+            delay = _p90(gaps) * GAP_SAFETY
+        else:
+            pieces = self._group_pieces.get(session.chat_id)
+            if pieces is None:
+                return DEFAULT_DELAY
+            # 3 ta xabarli zakaz – odatiy; bo'lib-bo'lib yuboradigan guruhlar ko'proq kutadi
+            delay = DEFAULT_DELAY * min(2.0, max(0.6, pieces / 3.0))
+
+        return min(MAX_DELAY, max(MIN_DELAY, delay))
+
+    def observe_time_to_post(self, seconds: float) -> None:
+        self._time_to_post.append(seconds)
+
+    def median_time_to_post(self) -> Optional[float]:
+        if not self._time_to_post:
+            return None
+        return statistics.median(self._time_to_post)
+
+    async def load_history(self, settings: Settings) -> None:
+        """
+        ai_order_dataset dan guruhlar bo'yicha "bir zakazdagi xabarlar soni" o'rtachasi.
+        """
+        self._group_pieces = await run_db(load_group_message_counts, settings, HISTORY_DAYS)
+        logger.info("FinalizeDelayModel: %s ta guruh tarixi yuklandi.", len(self._group_pieces))
+
+
+FINALIZE_DELAYS = FinalizeDelayModel()
@@ -0,0 +1,139 @@
+# bot/handlers/admin_stats.py
+import html
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from aiogram import Dispatcher, F
+from aiogram.enums import ParseMode
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from ..config import Settings
+from ..db import STATS_COLUMNS, load_group_stats, run_db
+from ..duplicates import get_duplicate_index
+from ..prompt.admin_prompt import ADMIN_IDS
+
+logger = logging.getLogger(__name__)
+
+# ai_stats_day() bilan bir xil (bot/migrations/0008_group_daily_stats.sql)
+STATS_TZ = ZoneInfo("Asia/Tashkent")
+SUMMARY_DAYS = 30
+TOP_GROUPS_DAYS = 7
+TOP_GROUPS = 10
+GROUP_DAYS = 14
+
+
+def _total(rows: List[Dict[str, Any]], since: Optional[date] = None) -> Dict[str, int]:
+    total = {col: 0 for col in STATS_COLUMNS}
+    for row in rows:
+        if since is not None and row["day"] < since:
+            continue
+        for col in STATS_COLUMNS:
+            total[col] += row[col] or 0
+    return total
+
+
+def _fmt_money(value: int) -> str:
+    return f"{value:,}".replace(",", " ")
+
+
+def _summary_line(label: str, t: Dict[str, int]) -> str:
+    non_order = t["error_logs"] / (t["orders"] + t["error_logs"]) if t["orders"] + t["error_logs"] else 0.0
+    cancel = t["cancelled"] / t["orders"] if t["orders"] else 0.0
+    return (
+        f"{label:<8} zakaz={t['orders']:<6} summa={_fmt_money(t['amount_sum'])}\n"
+        f"{'':<8} bekor={t['cancelled']} ({cancel:.0%})  zakaz-emas={t['error_logs']} ({non_order:.0%})  "
+        f"ovoz={t['voice_logs']}"
+    )
+
+
+def _load_summary(settings: Settings, today: date) -> Dict[str, Any]:
+    by_day = load_group_stats(settings, today - timedelta(days=SUMMARY_DAYS - 1), today, by_day=True)
+    top = load_group_stats(settings, today - timedelta(days=TOP_GROUPS_DAYS - 1), today)
+    return {"by_day": by_day, "top": top[:TOP_GROUPS]}
+
+
+def _render_summary(data: Dict[str, Any], today: date) -> str:
+    by_day = data["by_day"]
+    lines = [
+        _summary_line("Bugun", _total(by_day, today)),
+        _summary_line("7 kun", _total(by_day, today - timedelta(days=6))),
+        _summary_line("30 kun", _total(by_day)),
+        "",
+        f"Top guruhlar ({TOP_GROUPS_DAYS} kun):",
+    ]
+    for row in data["top"]:
+        lines.append(f"{row['group_id']:<16} {row['orders']:>5} ta  {_fmt_money(row['amount_sum'])}")
+    if data.get("duplicates"):
+        d = data["duplicates"]
+        lines += [
+            "",
+            f"Dublikatlar (process ishga tushgandan, oyna {d['window_min']} daq):",
+            f"tekshiruv={d['checks']} dublikat={d['duplicates']} ({d['duplicate_rate']:.1%}) "
+            f"bostirildi={d['suppressed']}",
+            f"lookup avg={d['lookup_ms_avg']:.2f} ms max={d['lookup_ms_max']:.2f} ms db={d['db_lookups']}",
+        ]
+    return "\n".join(lines)
+
+
+def _render_group(group_id: int, rows: List[Dict[str, Any]]) -> str:
+    lines = [f"Guruh {group_id}, {GROUP_DAYS} kun:", "kun         zakaz  bekor  zakaz-emas  summa"]
+    for row in rows:
+        lines.append(
+            f"{row['day']:%Y-%m-%d}  {row['orders']:>5}  {row['cancelled']:>5}  {row['error_logs']:>10}  "
+            f"{_fmt_money(row['amount_sum'])}"
+        )
+    lines.append("")
+    lines.append(_summary_line("Jami", _total(rows)))
+    return "\n".join(lines)
+
+
+def register_admin_stats_handlers(dp: Dispatcher, settings: Settings) -> None:
+    @dp.message(Command("stats"), F.from_user.id.in_(ADMIN_IDS))
+    async def cmd_stats(message: Message, command: CommandObject):
+        """
+        /stats – bugun / 7 / 30 kun va top guruhlar
+        /stats <group_id> – shu guruh kunlar bo'yicha
+        Faqat ai_group_daily_stats o'qiladi (tarix hajmiga bog'liq emas).
+        """
+        if not settings.db_dsn:
+            await message.answer("DB ulanmagan (DB_DSN yo'q).")
+            return
+
+        arg = (command.args or "").strip()
+        today = datetime.now(STATS_TZ).date()
+        started = time.perf_counter()
+        try:
+            if arg:
+                try:
+                    group_id = int(arg)
+                except ValueError:
+                    await message.answer("Foydalanish: /stats yoki /stats <group_id>")
+                    return
+                rows = await run_db(
+                    load_group_stats,
+                    settings,
+                    today - timedelta(days=GROUP_DAYS - 1),
+                    today,
+                    group_id=group_id,
+                    by_day=True,
+                )
+                text = _render_group(group_id, rows)
+            else:
+                data = await run_db(_load_summary, settings, today)
+                duplicates = get_duplicate_index(settings)
+                data["duplicates"] = duplicates.stats() if duplicates is not None else None
+                text = _render_summary(data, today)
+        except Exception as e:
+            logger.error("/stats failed: %s", e)
+            await message.answer("Statistikani olishda xatolik yuz berdi.")
+            return
+
+        took_ms = (time.perf_counter() - started) * 1000
+        await message.answer(
+            f"<pre>{html.escape(text)}</pre>\n<i>{took_ms:.0f} ms</i>",
+            parse_mode=ParseMode.HTML,
+        )
@@ -6,7 +6,8 @@ from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message
 
 from bot.config import Settings
-from bot.db import save_ai_check_row
+from bot.db import ai_check_log_row
+from bot.log_writer import enqueue_log_row
 from .order_utils import append_dataset_line
 
 logger = logging.getLogger(__name__)
@@ -98,11 +99,6 @@ async def send_ai_check_log(
     append_dataset_line("ai_check.txt", payload)
 
     try:
-        save_ai_check_row(
-            settings=settings,
-            message=message,
-            text=text,
-            ai_result=payload["ai"],
-        )
+        enqueue_log_row("ai_check_logs", ai_check_log_row(message, text, payload["ai"]))
     except Exception as e:
         logger.error("Failed to save AI_CHECK row to DB: %s", e)
@@ -6,7 +6,8 @@ from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message
 
 from bot.config import Settings
-from bot.db import save_error_row
+from bot.db import error_log_row
+from bot.log_writer import enqueue_log_row
 from .order_utils import append_dataset_line
 
 logger = logging.getLogger(__name__)
@@ -52,11 +53,7 @@ async def send_non_order_error(
     append_dataset_line("errors.txt", payload)
 
     try:
-        save_error_row(
-            settings=settings,
-            message=message,
-            text=text,
-        )
+        enqueue_log_row("ai_error_logs", error_log_row(message, text))
     except Exception as e:
         logger.error("Failed to save error row to DB: %s", e)
 
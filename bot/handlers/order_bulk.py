@@ -0,0 +1,203 @@
+# bot/handlers/order_bulk.py
+import asyncio
+import logging
+import re
+import time
+from typing import List, Optional, Set, Tuple
+
+from aiogram.types import Message
+
+from .order_finalize import finalize_and_send, speculate_order_draft
+from ..ai.classifier import classify_text_ai
+from ..config import Settings
+from ..customers import prefill_returning_customer
+from ..models import OrderSession, add_session_text
+from ..storage import SESSIONS, is_session_ready
+from ..utils.amounts import extract_amount_from_text
+from ..utils.locations import extract_location_from_text
+from ..utils.phones import PHONE_REGEX, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+BLANK_LINE_RE = re.compile(r"\n\s*\n")
+MIN_BULK_AMOUNT = 1000
+MAX_BULK_BLOCKS = 20  # 4096 belgili xabarda bundan ko'p zakaz bo'lmaydi
+
+# Bulk sessiya kalitlari: (chat_id, -(BULK_KEY_BASE + message_id * 32 + i)) –
+# user_id (musbat) va segment kalitlari (-message_id) bilan to'qnashmaydi
+BULK_KEY_BASE = 1 << 53
+
+# Throughput statistikasi (log uchun)
+BULK_STATS = {"messages": 0, "orders": 0, "seconds": 0.0}
+
+
+def _block_phones(text: str) -> Set[str]:
+    # extract_phones har chaqiruvda info-log yozadi; bu yerda satr bo'yicha ko'p chaqiriladi
+    phones = set()
+    for m in PHONE_REGEX.findall(text):
+        p = normalize_phone(m)
+        if p:
+            phones.add(p)
+    return phones
+
+
+def _has_amount(text: str) -> bool:
+    amount = extract_amount_from_text(text)
+    return amount is not None and amount >= MIN_BULK_AMOUNT
+
+
+def _group_units(units: List[str], sep: str, require_amount: bool) -> List[str]:
+    """
+    Bo'laklarni (paragraf yoki satr) zakazlarga yig'adi: joriy zakazda telefon
+    bo'lib, yangi bo'lakda boshqa telefon chiqsa – yangi zakaz boshlanadi.
+    require_amount: joriy zakazda summa ham bo'lishi shart (bitta zakazdagi
+    ikkinchi telefon alohida zakaz bo'lib ketmasin).
+    """
+    blocks: List[str] = []
+    current: List[str] = []
+    current_phones: Set[str] = set()
+    current_amount = False
+
+    for unit in units:
+        phones = _block_phones(unit)
+        starts_new = (
+                phones
+                and current_phones
+                and not phones <= current_phones
+                and (current_amount or not require_amount)
+        )
+        if starts_new:
+            blocks.append(sep.join(current).strip())
+            current, current_phones, current_amount = [], set(), False
+
+        current.append(unit)
+        current_phones |= phones
+        current_amount = current_amount or _has_amount(unit)
+
+    if current:
+        blocks.append(sep.join(current).strip())
+    return [b for b in blocks if b]
+
+
+def split_order_blocks(text: str) -> List[str]:
+    """
+    Bitta xabarda bir nechta zakaz bo'lsa, ularni bloklarga ajratadi.
+
+    1) Bo'sh qator bilan ajratilgan paragraflar, har birida o'z telefoni
+    2) Bo'sh qator bo'lmasa: telefon + summa takrorlanadigan satrlar
+
+    Bitta zakaz bo'lsa – [text] qaytaradi.
+    """
+    if not text or len(PHONE_REGEX.findall(text)) < 2:
+        return [text]
+
+    paragraphs = [p for p in BLANK_LINE_RE.split(text) if p.strip()]
+    blocks: List[str] = []
+    if len(paragraphs) > 1:
+        blocks = _group_units(paragraphs, "\n\n", require_amount=True)
+    if len(blocks) < 2:
+        lines = [line for line in text.splitlines() if line.strip()]
+        blocks = _group_units(lines, "\n", require_amount=True)
+
+    if len(blocks) < 2 or len(blocks) > MAX_BULK_BLOCKS:
+        return [text]
+    return blocks
+
+
+def _bulk_session(message: Message, index: int, block: str) -> Tuple[Tuple[int, int], OrderSession]:
+    key = (message.chat.id, -(BULK_KEY_BASE + message.message_id * 32 + index))
+    session = OrderSession(
+        user_id=message.from_user.id,  # type: ignore[union-attr]
+        chat_id=message.chat.id,
+    )
+    add_session_text(session, block)
+    session.phones.update(_block_phones(block))
+    amount = extract_amount_from_text(block)
+    if amount is not None and amount >= MIN_BULK_AMOUNT:
+        session.amount = amount
+    session.location = extract_location_from_text(block)
+    return key, session
+
+
+async def _ready_bulk_sessions(
+        message: Message,
+        blocks: List[str],
+        settings: Settings,
+) -> Optional[List[Tuple[Tuple[int, int], OrderSession]]]:
+    """
+    Har bir blok oddiy xabar yo'lidagi filtrdan o'tadi: klassifikator zakaz deb topadi,
+    sessiya tayyor (telefon + manzil; manzil qayta kelgan mijozdan ham bo'lishi mumkin).
+    Birorta blok o'tmasa – None (xabar odatiy sessiya oqimiga tushadi).
+    """
+    sessions = [_bulk_session(message, i, block) for i, block in enumerate(blocks)]
+    results = await asyncio.gather(
+        *(classify_text_ai(settings, block, [block]) for block in blocks)
+    )
+    for (key, session), ai_result in zip(sessions, results):
+        if not ai_result.get("is_order_related", False):
+            logger.info("Bulk block %s is not an order (%s)", key, ai_result.get("reason"))
+            return None
+        await prefill_returning_customer(settings, session, message.chat.id)
+        if not is_session_ready(session):
+            logger.info("Bulk block %s is not ready: phones=%s location=%s", key, session.phones, session.location)
+            return None
+    return sessions
+
+
+async def handle_bulk_message(
+        message: Message,
+        sessions: List[Tuple[Tuple[int, int], OrderSession]],
+        settings: Settings,
+) -> None:
+    """
+    Har bir blok – alohida sessiya. LLM extraction hammasi uchun parallel
+    (spekulyativ draft task'lari), keyin zakazlar xabardagi tartibda yuboriladi.
+    """
+    started = time.perf_counter()
+
+    keys = []
+    for key, session in sessions:
+        SESSIONS[key] = session
+        speculate_order_draft(key, session, message, settings)
+        keys.append(key)
+
+    for part, key in enumerate(keys):
+        try:
+            # message_part: bitta xabardagi har bir zakaz alohida idempotency kaliti
+            await finalize_and_send(key, message, settings, message_part=part)
+        except Exception as e:
+            logger.exception("Bulk order finalize failed for key=%s: %s", key, e)
+        finally:
+            SESSIONS.pop(key, None)
+
+    elapsed = time.perf_counter() - started
+    BULK_STATS["messages"] += 1
+    BULK_STATS["orders"] += len(keys)
+    BULK_STATS["seconds"] += elapsed
+    logger.info(
+        "Bulk message chat=%s msg=%s: orders=%s took=%.2fs (%.1f orders/s, total=%s orders in %s messages)",
+        message.chat.id,
+        message.message_id,
+        len(keys),
+        elapsed,
+        len(keys) / max(elapsed, 1e-9),
+        BULK_STATS["orders"],
+        BULK_STATS["messages"],
+    )
+
+
+async def maybe_handle_bulk_message(message: Message, settings: Settings) -> bool:
+    """
+    handle_group_message oldidan: xabar bir nechta zakazdan iborat bo'lsa, shu yerda ishlanadi.
+    """
+    if message.voice or message.reply_to_message:
+        return False
+    blocks = split_order_blocks(message.text or message.caption or "")
+    if len(blocks) < 2:
+        return False
+    logger.info("Bulk message detected: chat=%s msg=%s blocks=%s", message.chat.id, message.message_id, len(blocks))
+    sessions = await _ready_bulk_sessions(message, blocks, settings)
+    if sessions is None:
+        return False
+    await handle_bulk_message(message, sessions, settings)
+    return True
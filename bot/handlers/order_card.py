@@ -0,0 +1,101 @@
+# bot/handlers/order_card.py
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from ..utils.phones import ensure_phone_suffix
+
+ORDER_HEADER = "🆕 Yangi zakaz"
+
+
+@dataclass
+class OrderCard:
+    """
+    Guruhga yuborilgan zakazning strukturali ko'rinishi.
+    Xabar matni faqat shundan render qilinadi; reply-update matnni parslamaydi,
+    kartani (ai_order_messages.card) yamab qayta render qiladi.
+    """
+    chat_title: str
+    user_id: Optional[int]
+    full_name: str
+    client_name: Optional[str] = None
+    phones: List[str] = field(default_factory=list)  # suffixsiz (+998...)
+    amount: Optional[int] = None
+    location: Optional[Dict[str, Any]] = None
+    comment: str = ""
+    products: str = "—"
+    duplicate_of: Optional[int] = None  # bot/duplicates.py: shu oynadagi o'xshash zakaz
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "OrderCard":
+        known = cls.__dataclass_fields__
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+def location_text(location: Optional[Dict[str, Any]]) -> str:
+    if not location:
+        return "—"
+    if location.get("type") == "telegram":
+        return f"Telegram location\nhttps://maps.google.com/?q={location.get('lat')},{location.get('lon')}"
+    if location.get("type") == "text":
+        # Eski (kartasiz) zakaz xabaridan olingan manzil satri – o'zgarishsiz
+        return location.get("raw") or "—"
+    return f"{location.get('type', 'custom')} location: {location.get('raw') or ''}"
+
+
+def render_order_body(card: OrderCard) -> str:
+    """
+    Zakaz xabari (headersiz). Finalize ham, reply-update ham shu funksiyadan foydalanadi.
+    """
+    phones_out = ensure_phone_suffix(card.phones)
+    phones_str = ", ".join(phones_out) if phones_out else "—"
+
+    if card.amount is not None:
+        amount_str = f"{card.amount:,}".replace(",", " ")
+        amount_line = f"💰 Summa: {amount_str} so'm"
+    else:
+        amount_line = "💰 Summa: —"
+
+    if card.client_name:
+        client_line = f"👤 Mijoz: {card.client_name} (tg: {card.full_name}, id: {card.user_id})"
+    else:
+        client_line = f"👤 Mijoz: {card.full_name} (id: {card.user_id})"
+
+    duplicate_line = ""
+    if card.duplicate_of is not None:
+        duplicate_line = f"⚠️ Ehtimoliy dublikat: ID {card.duplicate_of}\n"
+
+    return (
+        f"{duplicate_line}"
+        f"👥 Guruhdan: {card.chat_title}\n"
+        f"{client_line}\n\n"
+        f"📞 Telefon(lar): {phones_str}\n"
+        f"{amount_line}\n"
+        f"📍 Manzil: {location_text(card.location)}\n"
+        f"💬 Izoh/comment:\n{card.comment or '—'}\n\n"
+        f"☕️ Mahsulot/zakaz matni:\n{card.products}"
+    )
+
+
+def render_order_text(order_id: Optional[int], card: OrderCard) -> str:
+    header_line = ORDER_HEADER
+    if order_id is not None:
+        header_line += f" (ID: {order_id})"
+    return f"{header_line}\n{render_order_body(card)}"
+
+
+def order_cancel_keyboard(order_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="❌ Buyurtmani bekor qilish",
+                    callback_data=f"cancel_order:{order_id}",
+                )
+            ]
+        ]
+    )
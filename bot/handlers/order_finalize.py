@@ -1,33 +1,116 @@
 # bot/handlers/order_finalize.py
 import asyncio
+import hashlib
+import json
 import logging
+import time
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
-from typing import Optional, List
+from typing import Any, Dict, List, Optional, Set, Tuple
 
+from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
+from aiogram.types import Message
 
 from bot.ai.voice_order_structured import extract_order_structured
 from .ai_check_logger import send_ai_check_log
-from .order_utils import build_final_texts, append_dataset_line
+from .order_card import OrderCard
+from .order_outbox import OUTBOX, new_order_rows, send_order_message
+from .order_utils import build_final_texts, append_dataset_line, text_fingerprint
 from ..config import Settings
-from ..db import save_order_row
-from ..order_dataset_db import save_order_dataset_row
-from ..storage import finalize_session, save_order_to_json
+from ..customers import CUSTOMERS, CustomerInfo
+from ..db import run_db, save_finalized_order
+from ..duplicates import get_duplicate_index
+from ..finalize_delay import DEFAULT_DELAY, FINALIZE_DELAYS
+from ..mailbox import MAILBOXES
+from ..order_messages import ORDER_MESSAGES
+from ..models import OrderSession
+from ..storage import SESSIONS, finalize_session, save_order_to_json
+from ..timers import TIMERS
 # MUHIM: phones output enforce
 from ..utils.phones import normalize_phone_list_strict, ensure_phone_suffix
 
 logger = logging.getLogger(__name__)
 
 
-async def auto_remove_cancel_keyboard(order_message: Message, delay: int = 30):
-    await asyncio.sleep(delay)
+FINALIZE_DELAY_SECONDS = DEFAULT_DELAY
+CANCEL_KEYBOARD_TTL_SECONDS = 30
+
+
+async def auto_remove_cancel_keyboard(bot: Bot, chat_id: int, message_id: int):
+    """
+    TIMERS orqali chaqiriladi: faqat id'lar saqlanadi, butun Message emas.
+    """
     try:
-        await order_message.edit_reply_markup(reply_markup=None)
+        await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
     except TelegramBadRequest as e:
         logger.warning("Failed to auto-remove inline keyboard: %s", e)
 
 
+async def after_order_posted(
+        bot: Bot,
+        settings: Settings,
+        order_id: int,
+        card: Dict[str, Any],
+        sent_msgs: List[Message],
+) -> None:
+    """
+    Zakaz xabari guruhga chiqdi (finalize yoki outbox worker'i yubordi).
+    ai_order_messages ni mark_outbox_sent yozgan – bu yerda faqat LRU.
+    """
+    # Reply-update shu karta bo'yicha ishlaydi (xabar matni parslanmaydi)
+    await ORDER_MESSAGES.remember(
+        settings,
+        order_id,
+        card,
+        [(m.chat.id, m.message_id) for m in sent_msgs],
+        persist=False,
+    )
+    for m in sent_msgs:
+        TIMERS.schedule(
+            ("cancel_kb", m.chat.id, m.message_id),
+            CANCEL_KEYBOARD_TTL_SECONDS,
+            auto_remove_cancel_keyboard,
+            bot,
+            m.chat.id,
+            m.message_id,
+        )
+
+
+def target_chat_ids(settings: Settings, base_message: Message) -> List[int]:
+    # SEND_GROUP_ID – bitta guruh (config._to_int); berilmasa zakaz manba guruhga
+    if settings.send_group_ids:
+        return [settings.send_group_ids]
+    return [base_message.chat.id]
+
+
+def schedule_finalize(
+        key,
+        base_message: Message,
+        settings: Settings,
+        delay: float = FINALIZE_DELAY_SECONDS,
+) -> None:
+    """
+    Debounce: shu kalit uchun finalize allaqachon kutilayotgan bo'lsa,
+    muddat qaytadan boshlanadi (oxirgi xabardan keyin `delay` soniya).
+    """
+    TIMERS.schedule(
+        ("finalize", key),
+        delay,
+        finalize_and_send,
+        key,
+        base_message,
+        settings,
+    )
+
+
+def postpone_finalize(key, delay: float = FINALIZE_DELAY_SECONDS) -> bool:
+    """
+    Yangi xabar keldi: kutilayotgan finalize bo'lsa, uni kechiktiramiz.
+    """
+    return TIMERS.touch(("finalize", key), delay)
+
+
 def _clean_products_with_structured(
         raw_lines: List[str],
         phones: List[str],
@@ -77,51 +160,85 @@ def _clean_products_with_structured(
 
     return cleaned
 
-
-async def finalize_and_send_after_delay(
-        key: str,
-        base_message: Message,
+@dataclass
+class OrderDraft:
+    """
+    Order ID'siz tayyor zakaz: finalize paytida karta order_id bilan render qilinadi.
+    """
+    fingerprint: str
+    text_for_ai: str
+    client_phones: List[str]
+    phones_out: List[str]
+    amount: Optional[int]
+    client_name: Optional[str]
+    products_str: str
+    card: OrderCard
+    llm_called: bool = False
+
+
+def session_fingerprint(session: OrderSession) -> str:
+    """
+    Sessiya mazmuni o'zgarganini aniqlash uchun qisqa hash.
+    """
+    h = hashlib.sha1()
+    for msg in session.raw_messages:
+        h.update(msg.encode("utf-8"))
+        h.update(b"\x00")
+    h.update(repr(sorted(session.phones)).encode("utf-8"))
+    h.update(repr(session.amount).encode("utf-8"))
+    h.update(json.dumps(session.location, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _build_order_draft(
         settings: Settings,
-):
-    await asyncio.sleep(5)
-
-    finalized = finalize_session(key)
-    logger.info("Delayed finalize for key=%s, finalized=%s", key, bool(finalized))
-    if not finalized:
-        return
-
-    chat_title = base_message.chat.title or "Noma'lum guruh"
-    user = base_message.from_user
-    full_name = user.full_name if user and user.full_name else f"id={user.id}"
-
-    client_phones, final_products, final_comments = build_final_texts(
-        finalized.raw_messages, finalized.phones
-    )
-
-    text_for_ai = "\n".join(finalized.raw_messages).strip()
+        *,
+        fingerprint: str,
+        raw_messages: List[str],
+        phones: Set[str],
+        location: Optional[Dict[str, Any]],
+        session_amount: Optional[int],
+        cached_struct: Optional[Any],
+        chat_title: str,
+        user_id: int,
+        full_name: str,
+) -> OrderDraft:
+    """
+    Sinxron (thread ichida ishlaydi): build_final_texts + LLM extraction +
+    product tozalash + xabar matni (headersiz).
+    """
+    client_phones, final_products, final_comments = build_final_texts(raw_messages, phones)
+
+    text_for_ai = "\n".join(raw_messages).strip()
 
     # candidates (lekin endi prompt-first bo'lsin desangiz bo'sh ham berishingiz mumkin)
-    raw_phone_candidates = list(finalized.phones) if finalized.phones else client_phones
+    raw_phone_candidates = list(phones) if phones else client_phones
     raw_amount_candidates: list[int] = []
-    session_amount = getattr(finalized, "amount", None)
     if session_amount is not None:
         raw_amount_candidates.append(session_amount)
 
     struct = None
     client_name_parsed: Optional[str] = None
     final_amount: Optional[int] = session_amount
+    llm_called = False
 
-    try:
-        struct = extract_order_structured(
-            settings,
-            text=text_for_ai,
-            raw_phone_candidates=raw_phone_candidates,
-            raw_amount_candidates=raw_amount_candidates,
-        )
-        logger.info("Structured order result in finalize: %s", struct.json())
-    except Exception as e:
-        logger.exception("Failed to run structured order extraction in finalize: %s", e)
-        struct = None
+    if cached_struct is not None:
+        # Sessiyadagi oxirgi extraction aynan shu matndan olingan – qayta chaqirmaymiz
+        struct = cached_struct
+        logger.info("Reusing in-session structured result in finalize.")
+    else:
+        try:
+            llm_called = True
+            struct = extract_order_structured(
+                settings,
+                text=text_for_ai,
+                raw_phone_candidates=raw_phone_candidates,
+                raw_amount_candidates=raw_amount_candidates,
+            )
+            logger.info("Structured order result in finalize: %s", struct.json())
+        except Exception as e:
+            logger.exception("Failed to run structured order extraction in finalize: %s", e)
+            struct = None
 
     # =========================
     # APPLY STRUCTURED RESULT
@@ -150,8 +267,6 @@ async def finalize_and_send_after_delay(
     # phones_out: +998...--
     # =========================
     phones_out = ensure_phone_suffix(client_phones)
-    phones_str = ", ".join(phones_out) if phones_out else "—"
-    comment_str = "\n".join(final_comments) if final_comments else "—"
 
     raw_lines = text_for_ai.splitlines()
     cleaned_product_lines = _clean_products_with_structured(
@@ -162,25 +277,205 @@ async def finalize_and_send_after_delay(
     )
     products_str = "\n".join(cleaned_product_lines) if cleaned_product_lines else "—"
 
-    loc = finalized.location
-    if loc:
-        if loc.get("type") == "telegram":
-            lat = loc.get("lat")
-            lon = loc.get("lon")
-            loc_str = f"Telegram location\nhttps://maps.google.com/?q={lat},{lon}"
+    amount = final_amount
+    card = OrderCard(
+        chat_title=chat_title,
+        user_id=user_id,
+        full_name=full_name,
+        client_name=client_name_parsed,
+        phones=list(client_phones),
+        amount=amount,
+        location=location,
+        comment="\n".join(final_comments) if final_comments else "",
+        products=products_str,
+    )
+
+    return OrderDraft(
+        fingerprint=fingerprint,
+        text_for_ai=text_for_ai,
+        client_phones=client_phones,
+        phones_out=phones_out,
+        amount=amount,
+        client_name=client_name_parsed,
+        products_str=products_str,
+        card=card,
+        llm_called=llm_called,
+    )
+
+
+async def build_order_draft(
+        session: OrderSession,
+        base_message: Message,
+        settings: Settings,
+) -> OrderDraft:
+    """
+    Sessiyadan snapshot olib, draftni thread ichida quradi
+    (LLM chaqiruvi event loop'ni bloklamaydi).
+    """
+    user = base_message.from_user
+    raw_messages = list(session.raw_messages)
+    text_for_ai = "\n".join(raw_messages).strip()
+    cached_struct = None
+    if session.last_struct_fp is not None and session.last_struct_fp == text_fingerprint(text_for_ai):
+        cached_struct = session.last_struct
+
+    return await asyncio.to_thread(
+        _build_order_draft,
+        settings,
+        fingerprint=session_fingerprint(session),
+        raw_messages=raw_messages,
+        phones=set(session.phones),
+        location=session.location,
+        session_amount=session.amount,
+        cached_struct=cached_struct,
+        chat_title=base_message.chat.title or "Noma'lum guruh",
+        user_id=user.id,
+        full_name=user.full_name if user and user.full_name else f"id={user.id}",
+    )
+
+
+# Spekulyativ draftlar: key -> (fingerprint, task)
+_DRAFTS: Dict[Any, Tuple[str, asyncio.Task]] = {}
+# Thread'da ishlayotgan draft (LLM) – task cancel qilinsa ham thread to'xtamaydi
+_DRAFT_THREADS: Dict[Any, asyncio.Future] = {}
+
+
+async def _speculative_draft(key, session: OrderSession, base_message: Message, settings: Settings) -> OrderDraft:
+    """
+    Bitta kalit uchun bir vaqtda ko'pi bilan bitta LLM thread: eskisi hali ishlayotgan
+    bo'lsa, tugashini kutamiz (kutish paytida cancel qilinsa – yangi thread ochilmaydi).
+    """
+    running = _DRAFT_THREADS.get(key)
+    if running is not None and not running.done():
+        await asyncio.wait({running})
+
+    future = asyncio.ensure_future(build_order_draft(session, base_message, settings))
+    _DRAFT_THREADS[key] = future
+    future.add_done_callback(lambda f: _DRAFT_THREADS.get(key) is f and _DRAFT_THREADS.pop(key, None))
+    return await asyncio.shield(future)
+
+
+def speculate_order_draft(key, session: OrderSession, base_message: Message, settings: Settings) -> None:
+    """
+    Sessiya tayyor bo'lishi bilan (finalize timer kutayotgan paytda) yakuniy
+    zakazni oldindan hisoblab qo'yadi. Sessiya o'zgarsa, eski draft bekor qilinadi.
+    """
+    fingerprint = session_fingerprint(session)
+    current = _DRAFTS.get(key)
+    if current is not None:
+        if current[0] == fingerprint:
+            return
+        current[1].cancel()
+
+    task = asyncio.create_task(_speculative_draft(key, session, base_message, settings))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    _DRAFTS[key] = (fingerprint, task)
+
+
+def invalidate_order_draft(key) -> None:
+    current = _DRAFTS.pop(key, None)
+    if current is not None:
+        current[1].cancel()
+
+
+async def _take_order_draft(
+        key,
+        session: OrderSession,
+        base_message: Message,
+        settings: Settings,
+) -> OrderDraft:
+    current = _DRAFTS.pop(key, None)
+    if current is not None:
+        fingerprint, task = current
+        if fingerprint == session_fingerprint(session):
+            try:
+                draft = await task
+                logger.info("Speculative order draft used for key=%s", key)
+                return draft
+            except (asyncio.CancelledError, Exception) as e:
+                logger.warning("Speculative draft failed for key=%s: %r", key, e)
         else:
-            raw_loc = loc.get("raw") or ""
-            loc_type = loc.get("type", "custom")
-            loc_str = f"{loc_type} location: {raw_loc}"
-    else:
-        loc_str = "—"
+            task.cancel()
 
-    amount = final_amount
-    if amount is not None:
-        amount_str = f"{amount:,}".replace(",", " ")
-        amount_line = f"💰 Summa: {amount_str} so'm"
-    else:
-        amount_line = "💰 Summa: —"
+    return await build_order_draft(session, base_message, settings)
+
+
+async def finalize_and_send(
+        key: Tuple[int, int],
+        base_message: Message,
+        settings: Settings,
+        message_part: int = 0,
+):
+    try:
+        await _finalize_and_send(key, base_message, settings, message_part)
+    finally:
+        # Erta qaytish (dublikat, bo'sh sessiya) yoki xatolik: draft _DRAFTS da osilib qolmasin.
+        # Shu kalitda yangi (tugallanmagan) sessiya bo'lsa – uning drafti tegilmaydi.
+        current = SESSIONS.get(key)
+        if current is None or current.is_completed:
+            invalidate_order_draft(key)
+
+
+async def _finalize_and_send(
+        key: Tuple[int, int],
+        base_message: Message,
+        settings: Settings,
+        message_part: int,
+):
+    # Shu kalit bo'yicha ishlanayotgan xabar tugashini kutamiz (yarim holatni finalize qilmaslik uchun)
+    async with MAILBOXES.acquire(key):
+        finalized = finalize_session(key)
+    logger.info("Finalize for key=%s, finalized=%s", key, bool(finalized))
+    if not finalized:
+        return
+
+    # Boshqa guruhga ham tashlangan / bekor qilingandan keyin qayta yuborilgan zakaz
+    duplicates = get_duplicate_index(settings)
+    duplicate = None
+    if duplicates is not None:
+        duplicate = await duplicates.check(settings, finalized.phones, finalized.amount, finalized.location)
+        if duplicate is not None:
+            logger.info(
+                "Duplicate order for key=%s: matches order_id=%s group=%s active=%s stats=%s",
+                key,
+                duplicate.order_id,
+                duplicate.group_id,
+                duplicate.active,
+                duplicates.stats(),
+            )
+            if settings.duplicate_action == "suppress" and duplicate.active:
+                # Draft (LLM) ham, guruhga yuborish ham yo'q
+                duplicates.suppressed += 1
+                invalidate_order_draft(key)
+                minutes = max(1, round((time.time() - duplicate.created_at) / 60))
+                try:
+                    await base_message.reply(
+                        f"⚠️ Bu zakaz {minutes} daqiqa oldin yuborilgan zakazning takrori "
+                        f"(ID: {duplicate.order_id}) – qayta yuborilmadi."
+                    )
+                except TelegramBadRequest:
+                    pass
+                return
+
+    chat_title = base_message.chat.title or "Noma'lum guruh"
+    user = base_message.from_user
+    full_name = user.full_name if user and user.full_name else f"id={user.id}"
+
+    draft = await _take_order_draft(key, finalized, base_message, settings)
+    if duplicate is not None:
+        draft.card = replace(draft.card, duplicate_of=duplicate.order_id)
+
+    text_for_ai = draft.text_for_ai
+    client_phones = draft.client_phones
+    phones_out = draft.phones_out
+    client_name_parsed = draft.client_name
+    products_str = draft.products_str
+    amount = draft.amount
+    loc = finalized.location
+
+    if draft.llm_called:
+        finalized.llm_calls += 1
+    logger.info("LLM extraction calls for key=%s: %s", key, finalized.llm_calls)
 
     # AI_CHECK log
     try:
@@ -202,57 +497,58 @@ async def finalize_and_send_after_delay(
     except Exception as e:
         logger.error("Failed to send AI_CHECK log in finalize: %s", e)
 
-    # ai_orders ga yozish
+    target_ids = target_chat_ids(settings, base_message)
+    card = draft.card.to_dict()
+
+    # ai_orders + ai_order_dataset + ai_order_outbox: bitta CTE, idempotent
     order_id: Optional[int] = None
+    messages = list(finalized.raw_messages) if finalized.raw_messages else []
+    db_started = time.perf_counter()
     try:
         # DBga suffixsiz yozamiz (barqarorlik uchun)
-        order_id = save_order_row(
+        order_id, created = await run_db(
+            save_finalized_order,
             settings=settings,
             message=base_message,
             phones=client_phones,  # suffixsiz
             order_text=products_str,
             location=finalized.location,
             amount=amount,
+            messages=messages,
+            message_part=message_part,
+            outbox_chat_ids=target_ids,
+            card=card,
+            outbox_lease_seconds=settings.outbox_lease_seconds,
         )
+        logger.info(
+            "Order saved: order_id=%s created=%s messages_count=%s finalize_db_ms=%.1f",
+            order_id,
+            created,
+            len(messages),
+            (time.perf_counter() - db_started) * 1000,
+        )
+        if not created:
+            # Qayta urinilgan finalize: zakaz allaqachon yozilgan va yuborilgan
+            logger.info("Finalize retry for key=%s is a no-op (order_id=%s).", key, order_id)
+            return
     except Exception as e:
         logger.error("Failed to save order to Postgres: %s", e)
 
-    # ai_order_dataset ga yozish
-    try:
-        if order_id is not None:
-            messages = list(finalized.raw_messages) if finalized.raw_messages else []
-            save_order_dataset_row(
-                settings=settings,
+    if order_id is not None and duplicates is not None:
+        duplicates.add(order_id, base_message.chat.id, finalized.phones, finalized.amount, finalized.location)
+
+    if order_id is not None and finalized.location:
+        # Keyingi zakazda shu telefon(lar) uchun manzil so'ralmaydi (bot/customers.py)
+        CUSTOMERS.remember(
+            client_phones,
+            CustomerInfo(
                 order_id=order_id,
-                base_message=base_message,
-                messages=messages,
-                phones=client_phones,  # suffixsiz
+                group_id=base_message.chat.id,
                 location=finalized.location,
                 amount=amount,
-            )
-            logger.info("Order dataset saved: order_id=%s, messages_count=%s", order_id, len(messages))
-    except Exception as e:
-        logger.error("Failed to save order dataset row for order_id=%s: %s", order_id, e)
-
-    header_line = "🆕 Yangi zakaz"
-    if order_id is not None:
-        header_line += f" (ID: {order_id})"
-
-    if client_name_parsed:
-        client_line = f"👤 Mijoz: {client_name_parsed} (tg: {full_name}, id: {user.id})"
-    else:
-        client_line = f"👤 Mijoz: {full_name} (id: {user.id})"
-
-    msg_text = (
-        f"{header_line}\n"
-        f"👥 Guruhdan: {chat_title}\n"
-        f"{client_line}\n\n"
-        f"📞 Telefon(lar): {phones_str}\n"
-        f"{amount_line}\n"
-        f"📍 Manzil: {loc_str}\n"
-        f"💬 Izoh/comment:\n{comment_str}\n\n"
-        f"☕️ Mahsulot/zakaz matni:\n{products_str}"
-    )
+                created_at=datetime.now(timezone.utc),
+            ),
+        )
 
     try:
         save_order_to_json(finalized)
@@ -275,51 +571,45 @@ async def finalize_and_send_after_delay(
                 "phones": client_phones,  # suffixsiz dataset
                 "phones_out": phones_out,  # xohlasangiz ko'rish uchun
                 "location": finalized.location,
-                "raw_messages": finalized.raw_messages,
+                "raw_messages": list(finalized.raw_messages),
                 "amount": amount,
                 "client_name": client_name_parsed,
+                "llm_calls": finalized.llm_calls,
             },
         )
     except Exception as e:
         logger.warning("Failed to append orders_dataset.txt for order_id=%s: %s", order_id, e)
 
-    reply_markup = None
+    logger.info("Sending order to target groups=%s", target_ids)
+
+    sent_msgs: List[Message] = []
     if order_id is not None:
-        reply_markup = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(
-                        text="❌ Buyurtmani bekor qilish",
-                        callback_data=f"cancel_order:{order_id}",
-                    )
-                ]
-            ]
+        # Outbox qatorlari CTE'da band qilingan: birinchi urinish shu yerda,
+        # xato/crash bo'lsa – bot/handlers/order_outbox.py worker'i qayta yuboradi
+        sent_msgs = await OUTBOX.deliver(
+            base_message.bot,
+            settings,
+            new_order_rows(order_id, card, target_ids, base_message.chat.id),
+            after_order_posted,
         )
-
-    target_chat_ids = list(settings.send_group_ids) if settings.send_group_ids else [base_message.chat.id]
-    logger.info("Sending order to target groups=%s", target_chat_ids)
-
-    sent_msgs: list[Message] = []
-
-    for target_chat_id in target_chat_ids:
-        try:
-            sent_msg = await base_message.bot.send_message(
-                target_chat_id,
-                msg_text,
-                reply_markup=reply_markup,
-            )
-            sent_msgs.append(sent_msg)
-        except TelegramBadRequest as e:
-            logger.error(
-                "Failed to send order to target_chat_id=%s: %s. Falling back to source chat_id=%s",
-                target_chat_id, e, base_message.chat.id
-            )
+    else:
+        # DB ishlamadi – outbox yo'q: avvalgidek to'g'ridan-to'g'ri, bitta urinish
+        for target_chat_id in target_ids:
             try:
-                fallback_msg = await base_message.answer(msg_text, reply_markup=reply_markup)
-                sent_msgs.append(fallback_msg)
-            except Exception as e2:
-                logger.error("Fallback send also failed: %s", e2)
-
-    if reply_markup is not None:
-        for m in sent_msgs:
-            asyncio.create_task(auto_remove_cancel_keyboard(m, delay=30))
+                sent_msgs.append(
+                    await send_order_message(
+                        base_message.bot, target_chat_id, None, draft.card, base_message.chat.id
+                    )
+                )
+            except Exception as e:
+                logger.error("Failed to send order to target_chat_id=%s: %s", target_chat_id, e)
+
+    if sent_msgs:
+        time_to_post = time.monotonic() - finalized.created_at
+        FINALIZE_DELAYS.observe_time_to_post(time_to_post)
+        logger.info(
+            "Order posted: key=%s time_to_post=%.1fs median_time_to_post=%.1fs",
+            key,
+            time_to_post,
+            FINALIZE_DELAYS.median_time_to_post() or 0.0,
+        )
@@ -0,0 +1,382 @@
+# bot/handlers/order_outbox.py
+"""
+Zakazni guruh(lar)ga yuborish outbox'i (ai_order_outbox, bot/migrations/0009_order_outbox.sql).
+
+Outbox qatorlari zakaz bilan BITTA CTE'da yoziladi (save_finalized_order), band (lease) holatda:
+  - finalize darhol o'zi yuboradi (deliver) – oddiy holatda qo'shimcha DB so'rovi yo'q;
+  - Telegram xatosi: qator backoff bilan qayta rejalashtiriladi
+    (RetryAfter – Telegram aytgan muddatdan keyin);
+  - process yiqilsa: lease tugagach worker (run) qatorni qayta oladi va yuboradi;
+  - rate limiter kutishi lease'ning yarmidan oshsa – yuborishdan oldin lease uzaytiriladi
+    (attempts – fencing token); qatorni boshqa worker olib ulgurgan bo'lsa, yuborilmaydi.
+Yuborilgan xabar id'lari ai_order_outbox va ai_order_messages ga bitta so'rovda yoziladi.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import Message
+
+from .order_card import OrderCard, order_cancel_keyboard, render_order_text
+from ..config import Settings
+from ..db import claim_due_outbox, mark_outbox_failed, mark_outbox_sent, renew_outbox_lease, run_db
+
+logger = logging.getLogger(__name__)
+
+# Telegram: bitta guruhga ~20 xabar/daqiqa, umumiy ~30 xabar/soniya
+PER_CHAT_LIMIT = 20
+PER_CHAT_WINDOW_SECONDS = 60.0
+GLOBAL_PER_SECOND = 25
+
+MAX_ATTEMPTS = 10
+BACKOFF_BASE_SECONDS = 5.0
+BACKOFF_MAX_SECONDS = 600.0
+
+POLL_SECONDS = 5.0
+CLAIM_BATCH = 20  # PER_CHAT_LIMIT dan oshmasin: bitta guruhga batch lease ichida ulguradi
+LEASE_RENEW_FRACTION = 0.5  # lease'ning shuncha qismi qolmaganda yuborishdan oldin uzaytiriladi
+
+# (bot, settings, order_id, card, yuborilgan xabarlar) – finalize'dagi after_order_posted
+OnDelivered = Callable[[Bot, Settings, int, Dict[str, Any], List[Message]], Awaitable[None]]
+
+
+class SendRateLimiter:
+    """
+    Sliding window: guruh bo'yicha va umumiy. Kutish asyncio.sleep bilan –
+    limitga urilgan guruh boshqa guruhlarga yuborishni to'smaydi.
+    """
+
+    def __init__(
+            self,
+            per_chat: int = PER_CHAT_LIMIT,
+            per_chat_window: float = PER_CHAT_WINDOW_SECONDS,
+            global_per_second: int = GLOBAL_PER_SECOND,
+    ):
+        self.per_chat = per_chat
+        self.per_chat_window = per_chat_window
+        self.global_per_second = global_per_second
+        self._chats: Dict[int, Deque[float]] = {}
+        self._global: Deque[float] = deque()
+        self._blocked_until: Dict[int, float] = {}
+
+    @staticmethod
+    def _wait(window: Deque[float], now: float, period: float, limit: int) -> float:
+        while window and window[0] <= now - period:
+            window.popleft()
+        if len(window) < limit:
+            return 0.0
+        return window[0] + period - now
+
+    def _purge(self, now: float) -> None:
+        for chat_id in [c for c, w in self._chats.items() if not w or w[-1] <= now - self.per_chat_window]:
+            del self._chats[chat_id]
+        for chat_id in [c for c, t in self._blocked_until.items() if t <= now]:
+            del self._blocked_until[chat_id]
+
+    async def acquire(self, chat_id: int) -> None:
+        while True:
+            now = time.monotonic()
+            if len(self._chats) > 1000:
+                self._purge(now)
+            window = self._chats.setdefault(chat_id, deque())
+            wait = max(
+                self._blocked_until.get(chat_id, 0.0) - now,
+                self._wait(window, now, self.per_chat_window, self.per_chat),
+                self._wait(self._global, now, 1.0, self.global_per_second),
+            )
+            if wait <= 0:
+                # Tekshiruv va yozish orasida await yo'q – lock kerak emas
+                window.append(now)
+                self._global.append(now)
+                return
+            await asyncio.sleep(wait)
+
+    def block(self, chat_id: int, seconds: float) -> None:
+        """
+        TelegramRetryAfter: shu guruhga muddat tugaguncha yubormaymiz.
+        """
+        until = time.monotonic() + seconds
+        self._blocked_until[chat_id] = max(self._blocked_until.get(chat_id, 0.0), until)
+
+
+LIMITER = SendRateLimiter()
+
+# Yuborishdan oldin chaqiriladi: False – qator endi bizniki emas, yuborilmaydi
+LeaseCheck = Callable[[], Awaitable[bool]]
+
+
+class OutboxLeaseLost(Exception):
+    pass
+
+
+class OutboxLease:
+    """
+    Bitta claim qilingan qatorning lease'i. Vaqt yetarli bo'lsa DB ga so'rov yo'q;
+    aks holda renew_outbox_lease (attempts mos kelsagina uzayadi).
+    """
+
+    def __init__(self, settings: Settings, row: Dict[str, Any], claimed_at: float):
+        self.settings = settings
+        self.row = row
+        self.seconds = settings.outbox_lease_seconds
+        self.expires_at = claimed_at + self.seconds
+
+    async def check(self) -> bool:
+        if time.monotonic() < self.expires_at - self.seconds * LEASE_RENEW_FRACTION:
+            return True
+        renewed_at = time.monotonic()
+        try:
+            ok = await run_db(
+                renew_outbox_lease,
+                self.settings,
+                self.row["order_id"],
+                self.row["chat_id"],
+                self.row["attempts"],
+                self.seconds,
+            )
+        except Exception as e:
+            # Lease tasdiqlanmadi – yubormaymiz, qator tugagach qayta olinadi
+            logger.error("Outbox: lease uzaytirilmadi (order_id=%s): %s", self.row["order_id"], e)
+            return False
+        if ok:
+            self.expires_at = renewed_at + self.seconds
+        return ok
+
+
+async def send_order_message(
+        bot: Bot,
+        chat_id: int,
+        order_id: Optional[int],
+        card: OrderCard,
+        fallback_chat_id: Optional[int] = None,
+        check_lease: Optional[LeaseCheck] = None,
+) -> Message:
+    """
+    Zakaz kartasini yuboradi. Maqsad guruh rad etsa (BadRequest/Forbidden) –
+    manba guruhga (fallback_chat_id). RetryAfter va tarmoq xatolari chaqiruvchiga chiqadi.
+    check_lease – limiter kutishidan keyin, har bir send_message oldidan (OutboxLeaseLost).
+    """
+    text = render_order_text(order_id, card)
+    reply_markup = order_cancel_keyboard(order_id) if order_id is not None else None
+    await LIMITER.acquire(chat_id)
+    if check_lease is not None and not await check_lease():
+        raise OutboxLeaseLost(chat_id)
+    try:
+        return await bot.send_message(chat_id, text, reply_markup=reply_markup)
+    except (TelegramBadRequest, TelegramForbiddenError) as e:
+        if fallback_chat_id is None or fallback_chat_id == chat_id:
+            raise
+        logger.error(
+            "Failed to send order to target_chat_id=%s: %s. Falling back to source chat_id=%s",
+            chat_id, e, fallback_chat_id,
+        )
+    await LIMITER.acquire(fallback_chat_id)
+    if check_lease is not None and not await check_lease():
+        raise OutboxLeaseLost(fallback_chat_id)
+    return await bot.send_message(fallback_chat_id, text, reply_markup=reply_markup)
+
+
+def new_order_rows(
+        order_id: int,
+        card: Dict[str, Any],
+        chat_ids: Sequence[int],
+        fallback_chat_id: Optional[int],
+) -> List[Dict[str, Any]]:
+    """
+    save_finalized_order yozgan (va band qilgan) qatorlar – finalize ularni claim'siz yuboradi.
+    """
+    return [
+        {
+            "order_id": order_id,
+            "chat_id": chat_id,
+            "fallback_chat_id": fallback_chat_id,
+            "card": card,
+            "attempts": 1,
+        }
+        for chat_id in chat_ids
+    ]
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS)
+
+
+class OrderOutbox:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.recovered = 0
+        self.lease_lost = 0
+
+    async def _reschedule(
+            self,
+            settings: Settings,
+            row: Dict[str, Any],
+            error: Exception,
+            retry_in: Optional[float],
+    ) -> None:
+        if retry_in is None:
+            self.failed += 1
+            logger.error(
+                "Outbox: order_id=%s chat_id=%s yuborilmadi (%s urinish), voz kechildi: %r",
+                row["order_id"], row["chat_id"], row["attempts"], error,
+            )
+        else:
+            self.retried += 1
+            logger.warning(
+                "Outbox: order_id=%s chat_id=%s yuborilmadi (%s-urinish), %.0fs dan keyin qayta: %r",
+                row["order_id"], row["chat_id"], row["attempts"], retry_in, error,
+            )
+        try:
+            await run_db(
+                mark_outbox_failed, settings, row["order_id"], row["chat_id"], row["attempts"], repr(error), retry_in
+            )
+        except Exception as e:
+            # Qator band holicha qoladi – lease tugagach worker baribir qayta oladi
+            logger.error("Outbox: xatoni yozib bo'lmadi (order_id=%s): %s", row["order_id"], e)
+
+    async def deliver(
+            self,
+            bot: Bot,
+            settings: Settings,
+            rows: List[Dict[str, Any]],
+            on_delivered: Optional[OnDelivered] = None,
+    ) -> List[Message]:
+        """
+        Band qilingan qatorlarni yuboradi, natijani outbox'ga yozadi.
+        Chaqiruvchi qatorlarni hozirgina band qilgan bo'lishi kerak (lease shu paytdan hisoblanadi).
+        Qaytadi: yuborilgan xabarlar (yuborilmaganlari qayta rejalashtirilgan).
+        """
+        claimed_at = time.monotonic()
+        delivered: List[Tuple[Dict[str, Any], Message]] = []
+        for row in rows:
+            try:
+                msg = await send_order_message(
+                    bot,
+                    row["chat_id"],
+                    row["order_id"],
+                    OrderCard.from_dict(row["card"]),
+                    row["fallback_chat_id"],
+                    check_lease=OutboxLease(settings, row, claimed_at).check,
+                )
+            except OutboxLeaseLost:
+                # Lease tugab, qatorni boshqa worker olgan (yoki yuborgan) – ikkinchi marta yubormaymiz
+                self.lease_lost += 1
+                logger.warning(
+                    "Outbox: order_id=%s chat_id=%s lease yo'qotildi, yuborilmadi",
+                    row["order_id"], row["chat_id"],
+                )
+                continue
+            except TelegramRetryAfter as e:
+                # Limit – zakazning aybi emas: urinishlar soniga qaramay qayta
+                LIMITER.block(row["chat_id"], e.retry_after)
+                await self._reschedule(settings, row, e, e.retry_after + 1)
+                continue
+            except (TelegramBadRequest, TelegramForbiddenError) as e:
+                # Maqsad ham, fallback ham rad etdi – qayta urinish foyda bermaydi
+                await self._reschedule(settings, row, e, None)
+                continue
+            except Exception as e:
+                retry_in = backoff_seconds(row["attempts"]) if row["attempts"] < MAX_ATTEMPTS else None
+                await self._reschedule(settings, row, e, retry_in)
+                continue
+            delivered.append((row, msg))
+
+        if not delivered:
+            return []
+
+        self.sent += len(delivered)
+        try:
+            marked = await run_db(
+                mark_outbox_sent,
+                settings,
+                [
+                    (row["order_id"], row["chat_id"], row["attempts"], msg.chat.id, msg.message_id)
+                    for row, msg in delivered
+                ],
+            )
+            if marked < len(delivered):
+                # Yuborish paytida lease boshqa worker'ga o'tgan – u ham yuborgan bo'lishi mumkin
+                logger.warning("Outbox: %s ta yuborilgan qator belgilanmadi (lease o'tgan)", len(delivered) - marked)
+        except Exception as e:
+            # Lease tugagach worker shu qatorlarni qayta yuboradi (dublikat bo'ladi)
+            logger.error("Outbox: yuborilganini yozib bo'lmadi: %s", e)
+
+        if on_delivered is not None:
+            by_order: Dict[int, List[Message]] = defaultdict(list)
+            cards: Dict[int, Dict[str, Any]] = {}
+            for row, msg in delivered:
+                by_order[row["order_id"]].append(msg)
+                cards[row["order_id"]] = row["card"]
+            for order_id, messages in by_order.items():
+                try:
+                    await on_delivered(bot, settings, order_id, cards[order_id], messages)
+                except Exception as e:
+                    logger.error("Outbox: on_delivered xatolik (order_id=%s): %s", order_id, e)
+
+        return [msg for _, msg in delivered]
+
+    async def run(self, bot: Bot, settings: Settings, on_delivered: Optional[OnDelivered] = None) -> None:
+        """
+        Vaqti kelgan qatorlar: qayta urinishlar va lease'i tugagan (crash) yuborishlar.
+        """
+        while True:
+            rows: List[Dict[str, Any]] = []
+            try:
+                rows = await run_db(claim_due_outbox, settings, CLAIM_BATCH, settings.outbox_lease_seconds)
+            except Exception as e:
+                logger.error("Outbox claim xatolik: %s", e)
+            if rows:
+                self.recovered += len(rows)
+                logger.info("Outbox: %s ta qator qayta yuborilmoqda", len(rows))
+                await self.deliver(bot, settings, rows, on_delivered)
+                if len(rows) == CLAIM_BATCH:
+                    continue
+            await asyncio.sleep(POLL_SECONDS)
+
+    def start(self, bot: Bot, settings: Settings, on_delivered: Optional[OnDelivered] = None) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run(bot, settings, on_delivered))
+
+    async def close(self) -> None:
+        """
+        Band qatorlar DB da qoladi – keyingi ishga tushishda lease tugagach yuboriladi.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info("Outbox stats: %s", self.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "recovered": self.recovered,
+            "lease_lost": self.lease_lost,
+        }
+
+
+OUTBOX = OrderOutbox()
+
+
+def start_outbox(bot: Bot, settings: Settings, on_delivered: Optional[OnDelivered] = None) -> None:
+    """
+    Event loop ichida chaqiriladi (dp.startup). Sharding'da har bir worker ishga
+    tushiradi – claim SKIP LOCKED bilan, bitta qatorni ikki worker olmaydi.
+    """
+    from ..shutdown import register_flusher
+
+    if OUTBOX._task is None:
+        register_flusher("outbox", OUTBOX.close)
+    OUTBOX.start(bot, settings, on_delivered)
@@ -1,21 +1,56 @@
 # bot/handlers/order_reply_update.py
 import logging
+from dataclasses import replace
 from datetime import datetime, timezone
-from typing import Optional, List
+from typing import List, Optional, Tuple
 
 from aiogram.exceptions import TelegramBadRequest
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message
 
+from .order_card import ORDER_HEADER, OrderCard, order_cancel_keyboard, render_order_text
 from .order_utils import parse_order_message_text, append_dataset_line
 from ..config import Settings
-from ..db import update_order_row  # YANGI: eski orderni update qilish uchun
+from ..customers import CUSTOMERS
+from ..db import run_db, update_order_row  # YANGI: eski orderni update qilish uchun
+from ..order_messages import ORDER_MESSAGES
 from ..utils.amounts import extract_amount_from_text  # agar summa ham o'zgarsa
 from ..utils.locations import extract_location_from_message
-from ..utils.phones import extract_phones
+from ..utils.phones import extract_phones, strip_phone_suffix
 
 logger = logging.getLogger(__name__)
 
 
+def _card_from_order_text(
+        text: str,
+        message: Message,
+) -> Optional[Tuple[int, OrderCard, Optional[int]]]:
+    """
+    ai_order_messages da yo'q (index'dan oldin yuborilgan) zakaz uchun:
+    xabar matnini parslab taxminiy karta tiklaydi. (order_id, card, old_amount)
+    """
+    parsed = parse_order_message_text(text)
+    if not parsed or not parsed["order_id"]:
+        return None
+
+    user = message.from_user
+    old_location_text = parsed.get("location_text")
+    card = OrderCard(
+        chat_title=parsed["chat_title"] or (message.chat.title or "Noma'lum guruh"),
+        user_id=parsed["client_id"] or (user.id if user else None),
+        full_name=parsed["client_name"] or (user.full_name if user and user.full_name else f"id={user.id}"),
+        phones=[strip_phone_suffix(p) for p in parsed["phones"] or []],
+        location=(
+            {"type": "text", "raw": old_location_text}
+            if old_location_text and old_location_text != "—"
+            else None
+        ),
+        comment=parsed["comments"] or "",
+        products=parsed["products"] or "",
+    )
+    # Eski summa – mavjud zakaz xabaridan o'qiymiz
+    return parsed["order_id"], card, extract_amount_from_text(text)
+
+
 async def handle_order_reply_update(
         message: Message,
         settings: Settings,
@@ -37,22 +72,27 @@ async def handle_order_reply_update(
         return False
 
     # Faqat zakaz xabarlariga ishlasin:
-    if not reply_msg.text.startswith("🆕 Yangi zakaz"):
-        return False
-
-    parsed = parse_order_message_text(reply_msg.text)
-    if not parsed:
+    if not reply_msg.text.startswith(ORDER_HEADER):
         return False
 
-    order_id = parsed["order_id"]
-    if not order_id:
-        return False
+    try:
+        indexed = await ORDER_MESSAGES.lookup(settings, reply_msg.chat.id, reply_msg.message_id)
+    except Exception as e:
+        logger.error("ai_order_messages lookup failed: %s", e)
+        indexed = None
 
-    old_phones: List[str] = parsed["phones"] or []
-    old_location_text: Optional[str] = parsed.get("location_text")
+    if indexed is not None:
+        order_id, card_data = indexed
+        card = OrderCard.from_dict(card_data)
+        old_amount = card.amount
+    else:
+        # Index'dan oldin yuborilgan zakaz – xabar matnidan tiklaymiz
+        legacy = _card_from_order_text(reply_msg.text, message)
+        if legacy is None:
+            return False
+        order_id, card, old_amount = legacy
 
-    # Eski summa – mavjud zakaz xabaridan o'qiymiz (agar kerak bo'lsa)
-    old_amount = extract_amount_from_text(reply_msg.text)
+    old_phones: List[str] = list(card.phones)
 
     # Reply xabardan yangi ma'lumotlarni olish
     new_loc = extract_location_from_message(message)
@@ -73,13 +113,14 @@ async def handle_order_reply_update(
 
     logger.info(
         "Order reply update detected: order_id=%s, new_loc=%s, "
-        "phones_changed=%s, amount_changed=%s (old_amount=%s, new_amount=%s)",
+        "phones_changed=%s, amount_changed=%s (old_amount=%s, new_amount=%s, indexed=%s)",
         order_id,
         new_loc,
         phones_changed,
         amount_changed,
         old_amount,
         new_amount,
+        indexed is not None,
     )
 
     # Eski xabarni vizual belgilash uchun reason text
@@ -103,73 +144,28 @@ async def handle_order_reply_update(
         # Agar eski matn juda uzun bo'lsa yoki HTML xatolik bo'lsa – shunchaki e'tibor bermaymiz
         logger.warning("Failed to append update reason to original message", exc_info=True)
 
-    # Eski xabardan product/comment va boshqa maydonlarni olib qolamiz
-    products_str = parsed["products"] or ""
-    comments_str = parsed["comments"] or ""
-    chat_title = parsed["chat_title"]
-    client_name = parsed["client_name"]
-    client_id = parsed["client_id"]
-
-    # Yangilangan telefon ro'yxati
-    if phones_changed:
-        phones = sorted(reply_phones_set)
-    else:
-        phones = old_phones
-
-    phones_str = ", ".join(phones) if phones else "—"
-    comment_str = comments_str or "—"
-
-    # Location yangilash
-    if has_new_loc:
-        loc = new_loc
-        if loc["type"] == "telegram":
-            lat = loc["lat"]
-            lon = loc["lon"]
-            loc_str = f"Telegram location\nhttps://maps.google.com/?q={lat},{lon}"
-        else:
-            raw_loc = loc["raw"] or ""
-            loc_str = f"{loc['type']} location: {raw_loc}"
-    else:
-        if old_location_text and old_location_text != "—":
-            loc_str = old_location_text
-            loc = {
-                "type": "text",
-                "raw": old_location_text,
-            }
-        else:
-            loc_str = "—"
-            loc = None
-
-    # Summa uchun ko'rsatish va DB ga berish
-    if new_amount is not None:
-        amount_to_show = new_amount
-    else:
-        amount_to_show = old_amount
-
-    if amount_to_show is not None:
-        try:
-            amount_int = int(amount_to_show)
-        except (TypeError, ValueError):
-            amount_int = None
-    else:
+    # Kartani yamaymiz: o'zgarmagan maydonlar (mahsulot, izoh, mijoz) aynan saqlanadi
+    phones = sorted(reply_phones_set) if phones_changed else old_phones
+    loc = new_loc if has_new_loc else card.location
+    amount = new_amount if new_amount is not None else old_amount
+    try:
+        amount_int = int(amount) if amount is not None else None
+    except (TypeError, ValueError):
         amount_int = None
 
-    if amount_int is not None:
-        amount_str = f"{amount_int:,}".replace(",", " ")
-        amount_line = f"💰 Summa: {amount_str} so'm"
-    else:
-        amount_line = "💰 Summa: —"
+    new_card = replace(card, phones=phones, location=loc, amount=amount_int)
 
-    # DBdagi o'sha order_id bo'yicha yozuvni UPDATE qilamiz
+    # DBdagi o'sha order_id bo'yicha yozuvni (va ai_order_messages kartasini) UPDATE qilamiz
     try:
-        updated = update_order_row(
+        updated = await run_db(
+            update_order_row,
             settings=settings,
             order_id=order_id,
             phones=phones,
-            order_text=products_str,
+            order_text=new_card.products,
             location=loc,
-            # agar DB'da summa ustuni bo'lsa:
             amount=amount_int,
+            card=new_card.to_dict(),
         )
     except Exception as e:
         logger.error("Failed to update order_id=%s: %s", order_id, e)
@@ -184,46 +180,21 @@ async def handle_order_reply_update(
         )
         return True
 
-    # Telegramdagi asosiy zakaz xabarini yangilangan ma'lumot bilan to'liq qayta yozamiz
-    header_line = parsed.get("header_line")
-    if not header_line:
-        # Fallback – agar parse_order_message_text header_line qaytarmasa:
-        header_line = f"🆕 Yangi zakaz (ID: {order_id})"
-
-    # Mijoz satri
-    if client_name and client_id:
-        client_line = f"👤 Mijoz: {client_name} (id: {client_id})"
+    if indexed is not None:
+        ORDER_MESSAGES.update_card(order_id, new_card.to_dict())
     else:
-        user = message.from_user
-        full_name = (
-            user.full_name if user and user.full_name else f"id={user.id}"
+        # Keyingi reply'lar uchun endi index'da bo'lsin
+        await ORDER_MESSAGES.remember(
+            settings, order_id, new_card.to_dict(), [(reply_msg.chat.id, reply_msg.message_id)]
         )
-        client_line = f"👤 Mijoz: {full_name} (id: {user.id})"
-
-    group_title = chat_title or (message.chat.title or "Noma'lum guruh")
-
-    new_msg_text = (
-        f"{header_line}\n"
-        f"👥 Guruhdan: {group_title}\n"
-        f"{client_line}\n\n"
-        f"📞 Telefon(lar): {phones_str}\n"
-        f"{amount_line}\n"
-        f"📍 Manzil: {loc_str}\n"
-        f"💬 Izoh/comment:\n{comment_str}\n\n"
-        f"☕️ Mahsulot/zakaz matni:\n{products_str}"
-    )
+    # Telefon/manzil o'zgargan bo'lishi mumkin – keyingi lookup DB dan oladi
+    CUSTOMERS.forget_order(order_id)
+
+    # Telegramdagi asosiy zakaz xabarini yangilangan ma'lumot bilan to'liq qayta yozamiz
+    new_msg_text = render_order_text(order_id, new_card)
 
     # Inline knopkalarni saqlab qolamiz (cancel_order:{order_id})
-    reply_markup = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="❌ Buyurtmani bekor qilish",
-                    callback_data=f"cancel_order:{order_id}",
-                )
-            ]
-        ]
-    )
+    reply_markup = order_cancel_keyboard(order_id)
 
     try:
         await reply_msg.edit_text(new_msg_text, reply_markup=reply_markup)
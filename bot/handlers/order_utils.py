@@ -1,4 +1,5 @@
 # bot/handlers/order_utils.py
+import hashlib
 import json
 import logging
 import re
@@ -79,6 +80,13 @@ def normalize_digits(s: str) -> str:
     return re.sub(r"\D", "", s or "")
 
 
+def text_fingerprint(text: str) -> str:
+    """
+    LLM'ga berilgan matnning qisqa hash'i (natijani qayta ishlatish uchun).
+    """
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
 def append_dataset_line(filename: str, payload: dict) -> None:
     """
     Dataset yig‘ish: har bir yozuvni alohida JSON-line sifatida faylga yozamiz.
@@ -1,7 +1,6 @@
 # bot/handlers/order.py
-import asyncio
 import logging
-from datetime import datetime, timezone
+import time
 from io import BytesIO
 
 from aiogram import Dispatcher, F
@@ -19,13 +18,20 @@ from bot.ai.status_intent import is_status_question
 from bot.services.stt_uzbekvoice import stt_uzbekvoice
 from bot.utils.read_file import read_text_file
 from .error_logger import send_non_order_error
-from .order_finalize import finalize_and_send_after_delay
+from .order_bulk import maybe_handle_bulk_message
+from .order_finalize import (
+    invalidate_order_draft,
+    postpone_finalize,
+    schedule_finalize,
+    speculate_order_draft,
+)
 from .order_manual import start_manual_order_after_cancel
 from .order_reply_update import handle_order_reply_update
 from .order_utils import (
     COMMENT_KEYWORDS,
     append_dataset_line,
     make_timestamp,
+    text_fingerprint,
 )
 from ..ai.classifier import classify_text_ai
 from ..ai.voice_order_structured import (
@@ -33,11 +39,19 @@ from ..ai.voice_order_structured import (
     VoiceOrderExtraction,
 )
 from ..config import Settings
-from ..db import cancel_order_row, save_voice_stt_row
+from ..customers import CUSTOMERS, prefill_notice, prefill_returning_customer
+from ..db import cancel_order_row, run_db, voice_log_row
+from ..duplicates import get_duplicate_index
+from ..finalize_delay import FINALIZE_DELAYS
+from ..log_writer import enqueue_log_row
+from ..mailbox import MAILBOXES
+from ..models import add_session_text
 from ..storage import (
     get_or_create_session,
     get_session_key,
+    has_amount_candidate,
     is_session_ready,
+    mark_session_dirty,
 )
 from ..utils.locations import extract_location_from_message
 # MUHIM: phones util'lar
@@ -63,12 +77,24 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
         if message.from_user is None or message.from_user.is_bot:
             return
 
-        # 1) Reply update logika
+        # Bitta xabarda bir nechta zakaz (do'kon ro'yxatni paste qilgan)
+        if await maybe_handle_bulk_message(message, settings):
+            return
+
+        # Reply update – sessiya kaliti olinmasdan oldin: zakazni tahrirlovchi reply
+        # segmentatsiyada yangi (bo'sh) segment ochmasin va by_user/by_phone ni buzmasin.
+        # Bitta zakaz xabariga kelgan reply'lar ketma-ket ishlanadi.
         if message.reply_to_message:
-            handled = await handle_order_reply_update(message, settings)
-            if handled:
-                return
+            reply_key = ("reply", message.chat.id, message.reply_to_message.message_id)
+            async with MAILBOXES.acquire(reply_key):
+                if await handle_order_reply_update(message, settings):
+                    return
+
+        # Bir (chat, user) kalitidagi xabarlar ketma-ket, boshqa kalitlar parallel
+        async with MAILBOXES.acquire(get_session_key(message)):
+            await _process_group_message(message)
 
+    async def _process_group_message(message: Message):
         text: str = ""
         stt_text_for_dataset: str | None = None
         voice_ai_result: VoiceOrderExtraction | None = None
@@ -144,15 +170,28 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
         )
 
         # Session
-        session = get_or_create_session(settings, message)
+        session = await get_or_create_session(settings, message)
         key = get_session_key(message)
 
         if session.is_completed:
             logger.info("Session already completed for key=%s, skipping.", key)
             return
 
+        # Bir zakaz ichidagi xabarlar oralig'i (adaptive finalize delay uchun)
+        if session.raw_messages:
+            gap = time.monotonic() - session.updated_at
+            FINALIZE_DELAYS.observe_gap(message.chat.id, message.from_user.id, gap)
+
         if text:
-            session.raw_messages.append(text)
+            add_session_text(session, text)
+
+        if voice_ai_result is not None:
+            session.llm_calls += 1
+
+        # Finalize kutilayotgan bo'lsa, yangi xabar kelgani uchun uni kechiktiramiz
+        # va oldindan hisoblangan draftni bekor qilamiz (sessiya o'zgardi)
+        postpone_finalize(key, FINALIZE_DELAYS.delay_for(session))
+        invalidate_order_draft(key)
 
         # =========================
         # PHONES/AMOUNT: TEXT => PROMPT FIRST
@@ -163,12 +202,21 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
             # TEXT pipeline: phones/amount faqat LLM/prompt orqali
             try:
                 text_for_ai = "\n".join(session.raw_messages).strip()
-                struct = extract_order_structured(
-                    settings,
-                    text=text_for_ai,
-                    raw_phone_candidates=[],  # MUHIM: bo'sh
-                    raw_amount_candidates=[],  # MUHIM: bo'sh
-                )
+                text_fp = text_fingerprint(text_for_ai)
+                if session.last_struct_fp == text_fp:
+                    # Matn o'zgarmagan (masalan faqat lokatsiya keldi) – LLM'ni qayta chaqirmaymiz
+                    struct = session.last_struct
+                else:
+                    struct = extract_order_structured(
+                        settings,
+                        text=text_for_ai,
+                        raw_phone_candidates=[],  # MUHIM: bo'sh
+                        raw_amount_candidates=[],  # MUHIM: bo'sh
+                    )
+                    session.llm_calls += 1
+                    if struct is not None:
+                        session.last_struct = struct
+                        session.last_struct_fp = text_fp
 
                 if struct is not None and getattr(struct, "is_order", False):
                     # phones
@@ -179,7 +227,7 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
 
                     # amount
                     if getattr(struct, "amount", None) is not None:
-                        if getattr(session, "amount", None) in (None, 0):
+                        if session.amount in (None, 0):
                             session.amount = int(struct.amount)
 
                 logger.info("TEXT structured result: %s", getattr(struct, "json", lambda: struct)())
@@ -201,7 +249,7 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
                     session.phones.add(p)
 
             if voice_ai_result is not None and voice_ai_result.amount is not None:
-                if getattr(session, "amount", None) in (None, 0):
+                if session.amount in (None, 0):
                     session.amount = int(voice_ai_result.amount)
 
         phones_new = bool(session.phones) and not had_phones_before
@@ -244,12 +292,14 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
         # Voice STT DB (qolsin)
         if message.voice:
             try:
-                save_voice_stt_row(
-                    settings=settings,
-                    message=message,
-                    text=text,
-                    phones=list(session.phones) if session.phones else None,
-                    amount=getattr(session, "amount", None),
+                enqueue_log_row(
+                    "ai_voice_logs",
+                    voice_log_row(
+                        message,
+                        text,
+                        phones=list(session.phones) if session.phones else None,
+                        amount=session.amount,
+                    ),
                 )
             except Exception as e:
                 logger.error("Failed to save voice STT row: %s", e)
@@ -264,7 +314,7 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
                         "user_id": message.from_user.id if message.from_user else None,
                         "raw_text": stt_text_for_dataset or text,
                         "true_phones": list(session.phones),
-                        "true_amount": getattr(session, "amount", None),
+                        "true_amount": session.amount,
                         "true_address": None,
                         "comment": getattr(voice_ai_result, "comment", None) if voice_ai_result else None,
                     },
@@ -303,15 +353,20 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
             await send_non_order_error(settings=settings, message=message, text=text)
             return
 
-        session.updated_at = datetime.now(timezone.utc)
+        # Qayta kelgan mijoz: manzil oldingi zakazdan – location so'ralmaydi
+        prefilled = await prefill_returning_customer(settings, session, message.chat.id)
+        if prefilled is not None:
+            just_got_location = True
+            try:
+                await message.reply(prefill_notice(prefilled))
+            except TelegramBadRequest:
+                pass
+
+        session.updated_at = time.monotonic()
+        mark_session_dirty(key)
 
-        # Sessiya bo‘yicha summa kandidati bor-yo‘qligi
-        all_text = " ".join(session.raw_messages).lower()
-        has_digits_all = any(ch.isdigit() for ch in all_text)
-        money_kw_all = ["summa", "ming", "min", "мин", "минг", "сум", "сом", "тыс", "so'm", "som"]
-        has_money_kw_all = any(kw in all_text for kw in money_kw_all)
-        has_amount_candidate_all = has_digits_all or has_money_kw_all or (
-                    getattr(session, "amount", None) not in (None, 0))
+        # Sessiya bo‘yicha summa kandidati bor-yo‘qligi (add_session_text belgilaridan)
+        has_amount_candidate_all = has_amount_candidate(session)
 
         ready_base = is_session_ready(session)
         ready = ready_base or (session.location is not None and has_amount_candidate_all)
@@ -344,14 +399,11 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
             logger.info("Session is ready, but current message is not a finalize trigger.")
             return
 
-        asyncio.create_task(
-            finalize_and_send_after_delay(
-                key=key,
-                base_message=message,
-                settings=settings,
-            )
-        )
-        logger.info("Finalize scheduled with 5s delay for key=%s", key)
+        delay = FINALIZE_DELAYS.delay_for(session)
+        schedule_finalize(key, message, settings, delay=delay)
+        # Timer kutayotgan paytda yakuniy zakazni oldindan tayyorlab qo'yamiz
+        speculate_order_draft(key, session, message, settings)
+        logger.info("Finalize scheduled (debounced, %.1fs) for key=%s", delay, key)
         return
 
     @dp.callback_query(F.data.startswith("cancel_order:"))
@@ -365,12 +417,17 @@ def register_order_handlers(dp: Dispatcher, settings: Settings) -> None:
             return
 
         try:
-            cancelled = cancel_order_row(settings=settings, order_id=order_id)
+            cancelled = await run_db(cancel_order_row, settings=settings, order_id=order_id)
         except Exception as e:
             logger.error("Failed to cancel order_id=%s: %s", order_id, e)
             await callback.answer("Bekor qilishda xatolik yuz berdi.", show_alert=True)
             return
 
+        CUSTOMERS.forget_order(order_id)
+        duplicates = get_duplicate_index(settings)
+        if duplicates is not None:
+            duplicates.mark_cancelled(order_id)
+
         if not cancelled:
             await callback.answer(
                 "Bu buyurtma allaqachon bekor qilingan yoki topilmadi.",
@@ -1,6 +1,6 @@
 # bot/handlers/voice_stt.py
 import logging
-from datetime import datetime, timezone
+import time
 from io import BytesIO
 
 from aiogram import Dispatcher, F
@@ -9,8 +9,13 @@ from aiogram.types import Message
 
 from bot.ai.voice_order_structured import extract_order_structured
 from bot.config import Settings
+from bot.customers import prefill_notice, prefill_returning_customer
+from bot.finalize_delay import FINALIZE_DELAYS
+from bot.handlers.order_finalize import schedule_finalize, speculate_order_draft
 from bot.services.stt_uzbekvoice import stt_uzbekvoice
-from bot.storage import get_or_create_session
+from bot.mailbox import MAILBOXES
+from bot.models import add_session_text
+from bot.storage import get_or_create_session, get_session_key, is_session_ready
 from bot.utils.amounts import extract_amount_from_text
 from bot.utils.phones import (
     extract_phones,
@@ -30,6 +35,11 @@ def register_voice_handlers(dp: Dispatcher, settings: Settings) -> None:
         if message.from_user is None or message.from_user.is_bot:
             return
 
+        # Shu (chat, user) dagi matnli xabarlar bilan bir navbatda ishlanadi
+        async with MAILBOXES.acquire(get_session_key(message)):
+            await _process_voice_message(message)
+
+    async def _process_voice_message(message: Message):
         if not getattr(settings, "uzbekvoice_api_key", None):
             await message.answer(
                 "STT servisi sozlanmagan (UZBEKVOICE_API_KEY). Admin bilan bog‘laning."
@@ -63,9 +73,9 @@ def register_voice_handlers(dp: Dispatcher, settings: Settings) -> None:
             print(text)
 
             # 3. Sessionga yozish
-            session = get_or_create_session(settings, message)
+            session = await get_or_create_session(settings, message)
             if text:
-                session.raw_messages.append(text)
+                add_session_text(session, text)
 
             # 4. Rule-based: raqamli telefonlar
             phones_in_msg = extract_phones(text)
@@ -117,7 +127,7 @@ def register_voice_handlers(dp: Dispatcher, settings: Settings) -> None:
             if final_amount is not None:
                 session.amount = final_amount
 
-            session.updated_at = datetime.now(timezone.utc)
+            session.updated_at = time.monotonic()
 
             reply_text = f"🎤 Golosdan olingan matn:\n\n{text}"
 
@@ -169,6 +179,15 @@ def register_voice_handlers(dp: Dispatcher, settings: Settings) -> None:
                 has_phone_candidate,
             )
 
+            # Qayta kelgan mijoz: manzil oldingi zakazdan – location so'ralmaydi
+            prefilled = await prefill_returning_customer(settings, session, message.chat.id)
+            if prefilled is not None:
+                await message.answer(prefill_notice(prefilled))
+                if is_session_ready(session):
+                    key = get_session_key(message)
+                    schedule_finalize(key, message, settings, delay=FINALIZE_DELAYS.delay_for(session))
+                    speculate_order_draft(key, session, message, settings)
+
             if (has_amount_candidate or has_phone_candidate) and session.location is None:
                 await message.answer(
                     "✅ Zakaz ma'lumotlari qabul qilindi (telefon/summa).\n"
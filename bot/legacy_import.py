@@ -0,0 +1,651 @@
+# bot/legacy_import.py
+"""
+Bot yozgan eski JSON/JSONL fayllarni Postgres'ga import qilish.
+
+    python -m bot.legacy_import                      # standart fayllar (joriy papkada)
+    python -m bot.legacy_import order.txt errors.txt --batch 5000
+    python -m bot.legacy_import --dry-run ai_bot.json
+
+    order.txt                        -> ai_order_dataset
+    ai_bot.json                      -> ai_order_dataset  (save_order_to_json, JSON massiv)
+    ai_check.txt                     -> ai_check_logs
+    errors.txt                       -> ai_error_logs
+    order_updates.txt                -> ai_order_updates
+    data/voice_orders_dataset.jsonl  -> ai_voice_logs
+
+- Fayl oqim bilan o'qiladi: xotirada faqat bitta batch (fayl hajmiga bog'liq emas).
+- Batch COPY bilan vaqtinchalik jadvalga, u yerdan yangi hash'lilari asosiy jadvalga.
+- Dedupe: normallashtirilgan qatorning kontent hash'i (ai_import_hashes) –
+  order.txt va ai_bot.json dagi bitta zakaz ham bir marta kiradi.
+- Checkpoint (ai_import_checkpoints) batch bilan bitta tranzaksiyada: qayta ishga
+  tushirilsa, oxirgi commit qilingan joydan davom etadi.
+- Jadvalga bot o'zi yoza boshlagan vaqtdan keyingi yozuvlar olinmaydi – ular DB da
+  allaqachon bor. Chegara jadvalga birinchi importdan oldin min(created_at) dan bir marta
+  olinadi va ai_import_cutoffs da saqlanadi (import qilingan qatorlar uni surmaydi;
+  order.txt va ai_bot.json bitta chegarani ishlatadi). --before uni aniq beradi,
+  --all cheklovni o'chiradi.
+"""
+import argparse
+import codecs
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from .config import Settings
+from .db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+BATCH_ROWS = 5000
+READ_CHUNK = 1 << 20
+MAX_RECORD_CHARS = 16 << 20  # bundan uzun "yozuv" – buzilgan, keyingi qatorgacha tashlanadi
+HEAD_BYTES = 4096  # checkpoint: fayl almashganini shu boshlang'ich baytlardan bilamiz
+
+_SEPARATORS = re.compile(r"[\s\[\],]*")  # massiv/obyektlar orasidagi belgilar
+
+Record = Dict[str, Any]
+Row = Dict[str, Any]
+
+
+# ======================================================================
+# FAYLNI OQIM BILAN O'QISH: (yozuv, keyingi yozuvning bayt offseti)
+# ======================================================================
+
+def iter_json_lines(f: BinaryIO, start: int) -> Iterator[Tuple[Optional[Record], int]]:
+    """
+    JSONL (append_dataset_line). Buzilgan qator – None. Oxirgi tugallanmagan
+    qator (bot hozir yozayotgan bo'lishi mumkin) o'qilmaydi.
+    """
+    f.seek(start)
+    offset = start
+    for line in iter(f.readline, b""):
+        if not line.endswith(b"\n"):
+            return
+        offset += len(line)
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield (record if isinstance(record, dict) else None), offset
+
+
+def iter_json_stream(f: BinaryIO, start: int) -> Iterator[Tuple[Optional[Record], int]]:
+    """
+    JSON massiv (ai_bot.json, indent=2) yoki ketma-ket obyektlar: butun faylni
+    json.load qilmasdan, obyektma-obyekt. Offset bayt hisobida (checkpoint uchun).
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    f.seek(start)
+    buf = ""
+    pos = 0  # buf ichidagi joriy o'rin (har yozuvda buf kesilmaydi – faqat o'qishda)
+    offset = start  # buf[pos] ning fayldagi bayt offseti
+    eof = False
+
+    def _more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = f.read(READ_CHUNK)
+        eof = not chunk
+        buf = buf[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+        return True
+
+    while True:
+        skip = _SEPARATORS.match(buf, pos).end()
+        if skip > pos:
+            offset += len(buf[pos:skip].encode("utf-8"))
+            pos = skip
+        if pos >= len(buf):
+            if not _more():
+                return
+            continue
+
+        try:
+            record, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if len(buf) - pos < MAX_RECORD_CHARS and _more():
+                continue
+            if eof:
+                # Tugallanmagan oxirgi yozuv – keyingi importda
+                logger.warning("Fayl oxirida tugallanmagan yozuv (offset=%s)", offset)
+                return
+            newline = buf.find("\n", pos)
+            end = len(buf) if newline < 0 else newline + 1
+            record = None
+
+        offset += len(buf[pos:end].encode("utf-8"))
+        pos = end
+        yield (record if isinstance(record, dict) else None), offset
+
+
+# ======================================================================
+# YOZUV -> JADVAL QATORI
+# ======================================================================
+
+def _ts(value: Any) -> Optional[datetime]:
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _int(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text_list(value: Any) -> Optional[List[str]]:
+    if not isinstance(value, list):
+        return None
+    items = [str(v) for v in value if v is not None]
+    return items or None
+
+
+def _log_row(record: Record) -> Optional[Row]:
+    created_at = _ts(record.get("timestamp"))
+    if created_at is None:
+        return None
+    return {
+        "user_id": _int(record.get("user_id")),
+        "full_name": record.get("user_name"),
+        "group_id": _int(record.get("chat_id")),
+        "group_title": record.get("chat_title"),
+        "text": record.get("text"),
+        "ai": record.get("ai"),
+        "created_at": created_at,
+    }
+
+
+def _voice_row(record: Record) -> Optional[Row]:
+    created_at = _ts(record.get("ts"))
+    user_id = _int(record.get("user_id"))
+    group_id = _int(record.get("chat_id"))
+    if created_at is None or user_id is None or group_id is None:
+        return None  # ai_voice_logs: user_id, group_id NOT NULL
+    return {
+        "user_id": user_id,
+        "group_id": group_id,
+        "stt_text": record.get("raw_text"),
+        "phones": _text_list(record.get("true_phones")),
+        "amount": _int(record.get("true_amount")),
+        "created_at": created_at,
+    }
+
+
+def _order_dataset_row(record: Record) -> Optional[Row]:
+    """
+    order.txt (finalize) va ai_bot.json (save_order_to_json) – ikkinchisida
+    order_id/ism/summa yo'q, ular NULL bo'ladi.
+    """
+    created_at = _ts(record.get("timestamp"))
+    messages = _text_list(record.get("raw_messages"))
+    if created_at is None or not messages:
+        return None
+    location = record.get("location")
+    return {
+        "order_id": _int(record.get("order_id")),
+        "user_id": _int(record.get("user_id")),
+        "full_name": record.get("user_name"),
+        "group_id": _int(record.get("chat_id")),
+        "group_title": record.get("chat_title"),
+        "messages": messages,
+        "phones": _text_list(record.get("phones")),
+        "location": location if isinstance(location, dict) else None,
+        "amount": _int(record.get("amount")),
+        "created_at": created_at,
+    }
+
+
+def _order_update_row(record: Record) -> Optional[Row]:
+    created_at = _ts(record.get("timestamp"))
+    if created_at is None:
+        return None
+    location = record.get("location")
+    return {
+        "order_id": _int(record.get("order_id")),
+        "group_id": _int(record.get("chat_id")),
+        "user_id": _int(record.get("user_id")),
+        "location": location if isinstance(location, dict) else None,
+        "phones_old": _text_list(record.get("phones_old")),
+        "phones_new": _text_list(record.get("phones_new")),
+        "amount_old": _int(record.get("amount_old")),
+        "amount_new": _int(record.get("amount_new")),
+        "location_updated": bool(record.get("location_updated")),
+        "phones_updated": bool(record.get("phones_updated")),
+        "amount_updated": bool(record.get("amount_updated")),
+        "created_at": created_at,
+    }
+
+
+@dataclass(frozen=True)
+class ImportSource:
+    path: str  # standart joylashuv (bot shu yerga yozadi)
+    table: str
+    columns: Tuple[str, ...]
+    key_columns: Tuple[str, ...]  # kontent hash shu ustunlardan
+    to_row: Callable[[Record], Optional[Row]]
+    json_columns: FrozenSet[str] = frozenset()
+    json_array: bool = False
+
+
+_LOG_COLUMNS = ("user_id", "full_name", "group_id", "group_title", "text")
+_DATASET_COLUMNS = (
+    "order_id", "user_id", "full_name", "group_id", "group_title",
+    "messages", "phones", "location", "amount", "created_at",
+)
+# Bitta zakaz order.txt da ham, ai_bot.json da ham bor – vaqt belgisi farq qiladi,
+# shuning uchun kalitda yo'q
+_DATASET_KEY = ("group_id", "user_id", "messages")
+
+# Tartib muhim: order.txt (to'liqroq) ai_bot.json dan oldin
+SOURCES: Tuple[ImportSource, ...] = (
+    ImportSource(
+        "order.txt", "ai_order_dataset", _DATASET_COLUMNS, _DATASET_KEY,
+        _order_dataset_row, frozenset({"location"}),
+    ),
+    ImportSource(
+        "ai_bot.json", "ai_order_dataset", _DATASET_COLUMNS, _DATASET_KEY,
+        _order_dataset_row, frozenset({"location"}), json_array=True,
+    ),
+    ImportSource(
+        "ai_check.txt", "ai_check_logs", _LOG_COLUMNS + ("ai", "created_at"),
+        ("group_id", "user_id", "text", "created_at"), _log_row, frozenset({"ai"}),
+    ),
+    ImportSource(
+        "errors.txt", "ai_error_logs", _LOG_COLUMNS + ("created_at",),
+        ("group_id", "user_id", "text", "created_at"), _log_row,
+    ),
+    ImportSource(
+        "order_updates.txt", "ai_order_updates",
+        (
+            "order_id", "group_id", "user_id", "location", "phones_old", "phones_new",
+            "amount_old", "amount_new", "location_updated", "phones_updated",
+            "amount_updated", "created_at",
+        ),
+        ("order_id", "user_id", "created_at"), _order_update_row, frozenset({"location"}),
+    ),
+    ImportSource(
+        "data/voice_orders_dataset.jsonl", "ai_voice_logs",
+        ("user_id", "group_id", "stt_text", "phones", "amount", "created_at"),
+        ("group_id", "user_id", "stt_text", "created_at"), _voice_row,
+    ),
+)
+
+
+def source_for(path: str) -> ImportSource:
+    name = os.path.basename(path)
+    for source in SOURCES:
+        if os.path.basename(source.path) == name:
+            return source
+    raise ValueError(f"Noma'lum fayl: {path} (kutilgan: {', '.join(s.path for s in SOURCES)})")
+
+
+def content_hash(source: ImportSource, row: Row) -> str:
+    key = [source.table] + [row[c] for c in source.key_columns]
+    data = json.dumps(key, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# ======================================================================
+# COPY
+# ======================================================================
+
+def _pg_array(items: List[Any]) -> str:
+    parts = []
+    for item in items:
+        text = str(item).replace("\\", "\\\\").replace('"', '\\"')
+        parts.append(f'"{text}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _copy_value(value: Any, is_json: bool) -> str:
+    if value is None:
+        return "\\N"
+    if is_json:
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, list):
+        value = _pg_array(value)
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    # COPY text formati; NUL Postgres text'da bo'lolmaydi
+    return (
+        value.replace("\x00", "")
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_batch(cur, source: ImportSource, rows: List[Tuple[str, Row]]) -> int:
+    """
+    Batch -> vaqtinchalik jadval (COPY) -> yangi hash'lilar asosiy jadvalga.
+    Qaytadi: qo'shilgan qatorlar.
+    """
+    stage = f"_import_{source.table}"
+    columns = ", ".join(source.columns)
+    cur.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {stage} AS "
+        f"SELECT {columns}, NULL::TEXT AS content_hash FROM {source.table} WITH NO DATA;"
+    )
+
+    buf = io.StringIO()
+    for digest, row in rows:
+        values = [_copy_value(row[c], c in source.json_columns) for c in source.columns]
+        buf.write("\t".join(values + [digest]) + "\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {stage} ({columns}, content_hash) FROM STDIN", buf)
+
+    cur.execute(
+        f"""
+        WITH fresh AS (
+            INSERT INTO ai_import_hashes (content_hash, source)
+            SELECT DISTINCT content_hash, %s FROM {stage}
+            ON CONFLICT (content_hash) DO NOTHING
+            RETURNING content_hash
+        )
+        INSERT INTO {source.table} ({columns})
+        SELECT DISTINCT ON (s.content_hash) {", ".join("s." + c for c in source.columns)}
+        FROM {stage} s
+        JOIN fresh f ON f.content_hash = s.content_hash;
+        """,
+        (source.path,),
+    )
+    inserted = cur.rowcount
+    cur.execute(f"TRUNCATE {stage};")
+    return inserted
+
+
+# ======================================================================
+# CHECKPOINT
+# ======================================================================
+
+def _head_hash(fd: int, length: int) -> str:
+    return hashlib.blake2b(os.pread(fd, min(length, HEAD_BYTES), 0), digest_size=16).hexdigest()
+
+
+def _resume_offset(cur, path: str, fd: int) -> int:
+    cur.execute(
+        "SELECT head_hash, byte_offset FROM ai_import_checkpoints WHERE path = %s;",
+        (path,),
+    )
+    row = cur.fetchone()
+    if row is None:
+        return 0
+    head_hash, offset = row
+    if offset > os.fstat(fd).st_size or _head_hash(fd, offset) != head_hash:
+        # Fayl almashgan (rotatsiya / qayta yaratilgan) – boshidan; dublikatlarni hash ushlaydi
+        logger.info("%s: fayl o'zgargan, boshidan import qilinadi", path)
+        cur.execute("DELETE FROM ai_import_checkpoints WHERE path = %s;", (path,))
+        return 0
+    return offset
+
+
+def _save_checkpoint(cur, path: str, fd: int, offset: int, records: int, inserted: int) -> None:
+    cur.execute(
+        """
+        INSERT INTO ai_import_checkpoints (path, head_hash, byte_offset, records, inserted)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (path) DO UPDATE
+        SET head_hash   = EXCLUDED.head_hash,
+            byte_offset = EXCLUDED.byte_offset,
+            records     = ai_import_checkpoints.records + EXCLUDED.records,
+            inserted    = ai_import_checkpoints.inserted + EXCLUDED.inserted,
+            updated_at  = now();
+        """,
+        (path, _head_hash(fd, offset), offset, records, inserted),
+    )
+
+
+class LiveCutoffUnknown(RuntimeError):
+    pass
+
+
+def _live_cutoff(cur, source: ImportSource, before: Optional[datetime] = None) -> datetime:
+    """
+    Jadvalning saqlangan chegarasi. before berilsa – u saqlanadi (avvalgisi almashtiriladi).
+    Saqlanmagan bo'lsa – hozirgi min(created_at) (jadval bo'sh bo'lsa now()), lekin faqat
+    jadvalga hali hech narsa import qilinmagan bo'lsa: aks holda min import qilingan
+    eski qatorlardan bo'ladi va chegarani --before bilan berish kerak.
+    """
+    if before is not None:
+        cur.execute(
+            """
+            INSERT INTO ai_import_cutoffs (target_table, live_cutoff, source)
+            VALUES (%s, %s, '--before')
+            ON CONFLICT (target_table) DO UPDATE
+            SET live_cutoff = EXCLUDED.live_cutoff, source = EXCLUDED.source, created_at = now();
+            """,
+            (source.table, before),
+        )
+        return before
+
+    cur.execute("SELECT live_cutoff FROM ai_import_cutoffs WHERE target_table = %s;", (source.table,))
+    row = cur.fetchone()
+    if row is not None:
+        return row[0]
+
+    cur.execute(
+        "SELECT EXISTS (SELECT 1 FROM ai_import_hashes WHERE source = ANY(%s));",
+        ([s.path for s in SOURCES if s.table == source.table],),
+    )
+    if cur.fetchone()[0]:
+        raise LiveCutoffUnknown(
+            f"{source.table}: import qilingan qatorlar bor, chegara saqlanmagan – "
+            "bot DB ga yoza boshlagan vaqtni --before bilan bering"
+        )
+    # created_at indeksidan (log partitsiyalari, ai_order_dataset_created_at_idx).
+    # Parallel import bo'lsa – birinchi yozilgani qoladi
+    cur.execute(
+        f"""
+        INSERT INTO ai_import_cutoffs (target_table, live_cutoff, source)
+        SELECT %s, COALESCE(min(created_at), now()), 'min(created_at)' FROM {source.table}
+        ON CONFLICT (target_table) DO NOTHING;
+        """,
+        (source.table,),
+    )
+    cur.execute("SELECT live_cutoff FROM ai_import_cutoffs WHERE target_table = %s;", (source.table,))
+    return cur.fetchone()[0]
+
+
+# ======================================================================
+# IMPORT
+# ======================================================================
+
+def import_file(
+        settings: Optional[Settings],
+        source: ImportSource,
+        path: str,
+        *,
+        batch_rows: int = BATCH_ROWS,
+        skip_live: bool = True,
+        before: Optional[datetime] = None,
+        dry_run: bool = False,
+) -> Dict[str, int]:
+    """
+    Bitta faylni import qiladi (dry_run – faqat o'qish va mapping, DB siz).
+    skip_live – chegaradan (_live_cutoff, before) yangi yozuvlar olinmaydi.
+    """
+    totals = {"records": 0, "bad": 0, "skipped": 0, "live": 0, "inserted": 0}
+    path = os.path.abspath(path)
+    reader = iter_json_stream if source.json_array else iter_json_lines
+    started = time.perf_counter()
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if dry_run:
+            for record, _ in reader(f, 0):
+                totals["records"] += 1
+                if record is None:
+                    totals["bad"] += 1
+                elif source.to_row(record) is None:
+                    totals["skipped"] += 1
+            return totals
+
+        with get_pool(settings).connection() as conn:
+            with conn.cursor() as cur:
+                # Katta batch INSERT ... SELECT pool'dagi statement_timeout'ga urilmasin
+                cur.execute("SET statement_timeout = 0;")
+                try:
+                    start = _resume_offset(cur, path, f.fileno())
+                    cutoff = _live_cutoff(cur, source, before) if skip_live else None
+                    if start:
+                        logger.info("%s: %s-baytdan davom etiladi", path, start)
+                    if cutoff is not None:
+                        logger.info("%s: %s dan yangi yozuvlar olinmaydi", source.table, cutoff.isoformat())
+
+                    batch: List[Tuple[str, Row]] = []
+                    batch_records = 0
+                    offset = start
+
+                    def _commit() -> None:
+                        nonlocal batch, batch_records
+                        conn.autocommit = False
+                        try:
+                            inserted = _copy_batch(cur, source, batch) if batch else 0
+                            _save_checkpoint(cur, path, f.fileno(), offset, batch_records, inserted)
+                            conn.commit()
+                        except Exception:
+                            conn.rollback()
+                            raise
+                        finally:
+                            conn.autocommit = True
+                        totals["inserted"] += inserted
+                        batch = []
+                        batch_records = 0
+                        elapsed = time.perf_counter() - started
+                        logger.info(
+                            "%s: %.1f%% (%s/%s bayt), yozuv=%s qo'shildi=%s, %.0f yozuv/s",
+                            os.path.basename(path),
+                            100.0 * offset / size if size else 100.0,
+                            offset,
+                            size,
+                            totals["records"],
+                            totals["inserted"],
+                            totals["records"] / elapsed if elapsed else 0.0,
+                        )
+
+                    for record, offset in reader(f, start):
+                        totals["records"] += 1
+                        batch_records += 1
+                        if record is None:
+                            totals["bad"] += 1
+                            continue
+                        row = source.to_row(record)
+                        if row is None:
+                            totals["skipped"] += 1
+                        elif cutoff is not None and row["created_at"] >= cutoff:
+                            totals["live"] += 1
+                        else:
+                            batch.append((content_hash(source, row), row))
+                        if batch_records >= batch_rows:
+                            _commit()
+                    if batch_records:
+                        _commit()
+                finally:
+                    cur.execute("RESET statement_timeout;")
+
+    logger.info(
+        "%s -> %s: %s (%.1fs)",
+        os.path.basename(path),
+        source.table,
+        totals,
+        time.perf_counter() - started,
+    )
+    return totals
+
+
+def _before_arg(value: str) -> datetime:
+    dt = _ts(value)
+    if dt is None:
+        raise argparse.ArgumentTypeError(f"ISO vaqt kutilgan: {value!r}")
+    return dt
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Eski JSON/JSONL fayllarni Postgres'ga import qilish")
+    parser.add_argument("paths", nargs="*", help="fayllar (default: mavjud standart fayllar)")
+    parser.add_argument("--dir", default=".", help="standart fayllar qidiriladigan papka")
+    parser.add_argument("--batch", type=int, default=BATCH_ROWS, help="bitta COPY/tranzaksiyadagi yozuvlar")
+    parser.add_argument("--all", action="store_true", help="chegaradan yangi yozuvlarni ham olish")
+    parser.add_argument(
+        "--before",
+        type=_before_arg,
+        help="faqat shu vaqtdan oldingi yozuvlar (ISO, masalan 2026-01-15T00:00:00+05:00); saqlanadi",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="DB siz: faqat o'qish va mapping statistikasi")
+    args = parser.parse_args(argv)
+    if args.all and args.before is not None:
+        parser.error("--all va --before birga ishlatilmaydi")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    if args.paths:
+        try:
+            jobs = [(source_for(p), p) for p in args.paths]
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        jobs = [(s, os.path.join(args.dir, s.path)) for s in SOURCES]
+        jobs = [(s, p) for s, p in jobs if os.path.exists(p)]
+    # order.txt ai_bot.json dan oldin (SOURCES tartibi)
+    jobs.sort(key=lambda job: SOURCES.index(job[0]))
+
+    settings = None
+    if not args.dry_run:
+        from .config import load_settings
+        from .db import init_db
+
+        settings = load_settings()
+        if not settings.db_dsn:
+            parser.error("DB_DSN .env ichida ko'rsatilmagan")
+        init_db(settings)
+
+    try:
+        for source, path in jobs:
+            totals = import_file(
+                settings,
+                source,
+                path,
+                batch_rows=args.batch,
+                skip_live=not args.all,
+                before=args.before,
+                dry_run=args.dry_run,
+            )
+            if args.dry_run:
+                logger.info("%s (dry-run): %s", path, totals)
+    except LiveCutoffUnknown as e:
+        parser.error(str(e))
+    finally:
+        if settings is not None:
+            from .db_pool import close_pool
+
+            close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
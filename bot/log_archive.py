@@ -0,0 +1,441 @@
+# bot/log_archive.py
+"""
+Log jadvallarining cold-storage arxivi (zstd segmentlar).
+
+Eski oylik partitsiya (bot/partitions.py) to'liq arxivlanadi, keyin DROP qilinadi:
+
+    <LOG_ARCHIVE_DIR>/<table>/<YYYY-MM>/<table>-<YYYY-MM-DD>.jsonl.zst
+    <LOG_ARCHIVE_DIR>/<table>/<YYYY-MM>/<table>-<YYYY-MM-DD>.idx.json
+
+Segment – bir kunlik qatorlar, FRAME_ROWS qatordan mustaqil zstd frame'lar.
+Index – har bir frame uchun offset/length/rows/first_ts/last_ts: so'rov faqat
+kerakli frame'larni o'qib, ochadi (butun faylni yoki DB ni tiklamasdan).
+
+<table>_default partitsiyasi DROP qilinmaydi: undagi muddati o'tgan qatorlar kunma-kun
+DELETE ... RETURNING bilan olinib, o'sha kunlik segmentlarga qo'shiladi.
+
+    python -m bot.log_archive archive
+    python -m bot.log_archive query ai_error_logs --since 2026-01-05 --until 2026-01-06 --group -100123
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import zstandard
+
+from .config import Settings
+from .db import LOG_TABLE_COLUMNS
+from .db_pool import get_pool
+from .partitions import PARTITIONED_TABLES, default_partition_name, month_start, partitions_before
+
+logger = logging.getLogger(__name__)
+
+FRAME_ROWS = 1000  # bitta zstd frame'dagi qatorlar (query shu aniqlikda o'qiydi)
+PAGE_ROWS = 5000  # partitsiyadan bitta SELECT'da o'qiladigan qatorlar
+ZSTD_LEVEL = 10
+# Sharding worker'lari bir vaqtda bitta partitsiyani arxivlamasin
+ADVISORY_LOCK_ID = 0x41494F41  # "AIOA"
+
+SEGMENT_SUFFIX = ".jsonl.zst"
+INDEX_SUFFIX = ".idx.json"
+
+
+def segment_base(archive_dir: str, table: str, day: date) -> str:
+    return os.path.join(archive_dir, table, f"{day:%Y-%m}", f"{table}-{day:%Y-%m-%d}")
+
+
+def _iso(dt: datetime) -> str:
+    # Index'dagi vaqtlar satr sifatida solishtiriladi – format bir xil bo'lishi shart
+    return dt.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _replace_atomic(tmp_path: str, path: str) -> None:
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SegmentWriter:
+    """
+    Bitta kunlik segment: qatorlar (JSON satr) FRAME_ROWS bo'lib mustaqil frame'larga siqiladi.
+    Fayl .tmp nomda yoziladi, close() da fsync + rename – yarim segment qolmaydi.
+    """
+
+    def __init__(self, base_path: str, table: str, day: date):
+        self.base_path = base_path
+        self.table = table
+        self.day = day
+        os.makedirs(os.path.dirname(base_path), exist_ok=True)
+        self._tmp_path = base_path + SEGMENT_SUFFIX + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, write_content_size=True)
+        self._lines: List[str] = []
+        self._first_ts: Optional[str] = None
+        self._last_ts: Optional[str] = None
+        self._offset = 0
+        self.frames: List[Dict[str, Any]] = []
+        self.rows = 0
+        self.raw_bytes = 0
+
+    def add(self, created_at: datetime, line: str) -> None:
+        ts = _iso(created_at)
+        if not self._lines:
+            self._first_ts = ts
+        self._last_ts = ts
+        self._lines.append(line)
+        if len(self._lines) >= FRAME_ROWS:
+            self._flush_frame()
+
+    def _flush_frame(self) -> None:
+        if not self._lines:
+            return
+        raw = ("\n".join(self._lines) + "\n").encode("utf-8")
+        frame = self._compressor.compress(raw)
+        self._file.write(frame)
+        self.frames.append({
+            "offset": self._offset,
+            "length": len(frame),
+            "rows": len(self._lines),
+            "first_ts": self._first_ts,
+            "last_ts": self._last_ts,
+        })
+        self._offset += len(frame)
+        self.rows += len(self._lines)
+        self.raw_bytes += len(raw)
+        self._lines = []
+
+    def close(self) -> None:
+        self._flush_frame()
+        self._file.close()
+        _replace_atomic(self._tmp_path, self.base_path + SEGMENT_SUFFIX)
+
+        index_tmp = self.base_path + INDEX_SUFFIX + ".tmp"
+        with open(index_tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "table": self.table,
+                    "day": self.day.isoformat(),
+                    "rows": self.rows,
+                    "raw_bytes": self.raw_bytes,
+                    "compressed_bytes": self._offset,
+                    "frames": self.frames,
+                },
+                f,
+            )
+        _replace_atomic(index_tmp, self.base_path + INDEX_SUFFIX)
+
+
+def archive_partition(cur, archive_dir: str, table: str, partition: str) -> Dict[str, int]:
+    """
+    Partitsiyani (created_at, id) tartibida keyset sahifalar bilan o'qib, kunlik
+    segmentlarga yozadi. JSON Postgres ichida (row_to_json) tayyorlanadi.
+    Qayta ishga tushirilsa (masalan crash'dan keyin) segmentlar qaytadan to'liq yoziladi.
+    """
+    columns = ", ".join(("id",) + tuple(LOG_TABLE_COLUMNS[table]))
+    writer: Optional[SegmentWriter] = None
+    last: Optional[Tuple[datetime, int]] = None
+    totals = {"rows": 0, "raw_bytes": 0, "compressed_bytes": 0, "segments": 0}
+
+    def _close(w: SegmentWriter) -> None:
+        w.close()
+        totals["rows"] += w.rows
+        totals["raw_bytes"] += w.raw_bytes
+        totals["compressed_bytes"] += sum(fr["length"] for fr in w.frames)
+        totals["segments"] += 1
+
+    while True:
+        keyset = "WHERE (created_at, id) > (%s, %s)" if last is not None else ""
+        cur.execute(
+            f"""
+            SELECT id, created_at, row_to_json(r)::text
+            FROM (SELECT {columns} FROM {partition}) r
+            {keyset}
+            ORDER BY created_at, id
+            LIMIT %s;
+            """,
+            (*(last or ()), PAGE_ROWS),
+        )
+        rows = cur.fetchall()
+        for row_id, created_at, line in rows:
+            day = created_at.astimezone(timezone.utc).date()
+            if writer is None or writer.day != day:
+                if writer is not None:
+                    _close(writer)
+                writer = SegmentWriter(segment_base(archive_dir, table, day), table, day)
+            writer.add(created_at, line)
+        if len(rows) < PAGE_ROWS:
+            break
+        last = (rows[-1][1], rows[-1][0])
+
+    if writer is not None:
+        _close(writer)
+    return totals
+
+
+ArchiveRow = Tuple[datetime, int, str]  # (created_at, id, JSON satr)
+
+
+def read_segment(base_path: str) -> List[ArchiveRow]:
+    """
+    Mavjud kunlik segmentning barcha qatorlari (segment vaqt tartibida yozilgan).
+    """
+    if not os.path.exists(base_path + INDEX_SUFFIX):
+        return []
+    with open(base_path + INDEX_SUFFIX, encoding="utf-8") as f:
+        index = json.load(f)
+    decompressor = zstandard.ZstdDecompressor()
+    rows: List[ArchiveRow] = []
+    with open(base_path + SEGMENT_SUFFIX, "rb") as seg:
+        for frame in index["frames"]:
+            seg.seek(frame["offset"])
+            data = decompressor.decompress(seg.read(frame["length"]))
+            for line in data.decode("utf-8").splitlines():
+                row = json.loads(line)
+                rows.append((datetime.fromisoformat(row["created_at"]), row["id"], line))
+    return rows
+
+
+def _delete_day_pages(cur, table: str, partition: str, lo: datetime, hi: datetime) -> Iterator[ArchiveRow]:
+    """
+    Default partitsiyadan [lo, hi) qatorlarini (created_at, id) tartibida PAGE_ROWS lab
+    o'chirib qaytaradi. Chaqiruvchi tranzaksiyasi commit qilinmaguncha hech narsa o'chmaydi.
+    """
+    columns = ", ".join(f"d.{c}" for c in ("id",) + tuple(LOG_TABLE_COLUMNS[table]))
+    while True:
+        cur.execute(
+            f"""
+            DELETE FROM {partition} AS d
+            WHERE ctid IN (
+                SELECT ctid FROM {partition}
+                WHERE created_at >= %s AND created_at < %s
+                ORDER BY created_at, id
+                LIMIT %s
+            )
+            RETURNING d.created_at, d.id, (SELECT row_to_json(r)::text FROM (SELECT {columns}) r);
+            """,
+            (lo, hi, PAGE_ROWS),
+        )
+        # RETURNING tartibi kafolatlanmagan; sahifalar esa o'zaro tartibli (har safar eng kichiklari)
+        rows = sorted(cur.fetchall(), key=lambda r: (r[0], r[1]))
+        yield from rows
+        if len(rows) < PAGE_ROWS:
+            return
+
+
+def archive_default_partition(conn, cur, archive_dir: str, table: str, cutoff: datetime) -> Dict[str, int]:
+    """
+    <table>_default dagi created_at < cutoff qatorlarini arxivga ko'chiradi.
+
+    Har bir kun – bitta tranzaksiya: qatorlar o'chiriladi, segment (shu kunning mavjud
+    segmenti bilan birlashtirilib, id bo'yicha takrorsiz) yoziladi va fsync qilinadi,
+    keyin COMMIT. Segment yozilgach crash bo'lsa – qatorlar DB da qoladi va keyingi
+    safar yana birlashtiriladi (takror yozilmaydi).
+    """
+    partition = default_partition_name(table)
+    totals = {"rows": 0, "raw_bytes": 0, "compressed_bytes": 0, "segments": 0}
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (partition,))
+    if not cur.fetchone()[0]:
+        return totals
+
+    cur.execute(
+        f"""
+        SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date
+        FROM {partition}
+        WHERE created_at < %s
+        ORDER BY 1;
+        """,
+        (cutoff,),
+    )
+    days = [day for (day,) in cur.fetchall()]
+
+    for day in days:
+        lo = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        base = segment_base(archive_dir, table, day)
+        existing = read_segment(base)
+        conn.autocommit = False
+        try:
+            writer = SegmentWriter(base, table, day)
+            seen = set()
+            merged = heapq.merge(
+                existing,
+                _delete_day_pages(cur, table, partition, lo, lo + timedelta(days=1)),
+                key=lambda r: (r[0], r[1]),
+            )
+            for created_at, row_id, line in merged:
+                if row_id in seen:
+                    continue
+                seen.add(row_id)
+                writer.add(created_at, line)
+            writer.close()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+
+        totals["rows"] += writer.rows - len(existing)
+        totals["raw_bytes"] += writer.raw_bytes
+        totals["compressed_bytes"] += sum(fr["length"] for fr in writer.frames)
+        totals["segments"] += 1
+    return totals
+
+
+def archive_expired_partitions(settings: Settings) -> List[Tuple[str, Dict[str, int]]]:
+    """
+    Yuqori chegarasi (joriy oy - LOG_ARCHIVE_AFTER_MONTHS) dan oldin bo'lgan
+    partitsiyalarni arxivlab DROP qiladi, default partitsiyadagi shu davr qatorlarini
+    esa arxivga ko'chiradi. [(partition, totals), ...]
+    """
+    cutoff = month_start(datetime.now(timezone.utc), -settings.log_archive_after_months)
+    done: List[Tuple[str, Dict[str, int]]] = []
+
+    with get_pool(settings).connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (ADVISORY_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                logger.info("Log archive: boshqa process arxivlayapti, o'tkazib yuborildi.")
+                return done
+            try:
+                for table in PARTITIONED_TABLES:
+                    for partition in partitions_before(cur, table, cutoff):
+                        started = time.perf_counter()
+                        totals = archive_partition(cur, settings.log_archive_dir, table, partition)
+                        cur.execute(f"DROP TABLE IF EXISTS {partition};")
+                        done.append((partition, totals))
+                        logger.info(
+                            "Log archive: %s -> %s qator, %s segment, %.1f MB -> %.1f MB, %.1fs",
+                            partition,
+                            totals["rows"],
+                            totals["segments"],
+                            totals["raw_bytes"] / 1e6,
+                            totals["compressed_bytes"] / 1e6,
+                            time.perf_counter() - started,
+                        )
+
+                    started = time.perf_counter()
+                    totals = archive_default_partition(conn, cur, settings.log_archive_dir, table, cutoff)
+                    if totals["rows"]:
+                        done.append((default_partition_name(table), totals))
+                        logger.info(
+                            "Log archive: %s (< %s) -> %s qator, %s segment, %.1fs",
+                            default_partition_name(table),
+                            cutoff.date(),
+                            totals["rows"],
+                            totals["segments"],
+                            time.perf_counter() - started,
+                        )
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_ID,))
+    return done
+
+
+# ======================================================================
+# QUERY (DB siz, faqat arxiv fayllari)
+# ======================================================================
+
+def query_archive(
+        archive_dir: str,
+        table: str,
+        since: datetime,
+        until: datetime,
+        *,
+        group_id: Optional[int] = None,
+        contains: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    since <= created_at < until oralig'idagi arxiv qatorlari (vaqt tartibida).
+    Index bo'yicha faqat oraliqqa tushadigan frame'lar o'qiladi.
+    """
+    since = since.astimezone(timezone.utc)
+    until = until.astimezone(timezone.utc)
+    since_iso, until_iso = _iso(since), _iso(until)
+    decompressor = zstandard.ZstdDecompressor()
+
+    day = since.date()
+    while day <= until.date():
+        base = segment_base(archive_dir, table, day)
+        day += timedelta(days=1)
+        if not os.path.exists(base + INDEX_SUFFIX):
+            continue
+        with open(base + INDEX_SUFFIX, encoding="utf-8") as f:
+            index = json.load(f)
+
+        with open(base + SEGMENT_SUFFIX, "rb") as seg:
+            for frame in index["frames"]:
+                if frame["last_ts"] < since_iso or frame["first_ts"] >= until_iso:
+                    continue
+                seg.seek(frame["offset"])
+                data = decompressor.decompress(seg.read(frame["length"]))
+                for line in data.decode("utf-8").splitlines():
+                    if contains and contains not in line:
+                        continue
+                    row = json.loads(line)
+                    created_at = datetime.fromisoformat(row["created_at"]).astimezone(timezone.utc)
+                    if not (since <= created_at < until):
+                        continue
+                    if group_id is not None and row.get("group_id") != group_id:
+                        continue
+                    yield row
+
+
+def _parse_date(value: str) -> datetime:
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Log jadvallari zstd arxivi")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("archive", help="muddati o'tgan partitsiyalarni arxivlab DROP qilish")
+
+    q = sub.add_parser("query", help="arxivdan qatorlarni JSONL qilib chiqarish")
+    q.add_argument("table", choices=PARTITIONED_TABLES)
+    q.add_argument("--since", type=_parse_date, required=True, help="ISO sana/vaqt (UTC)")
+    q.add_argument("--until", type=_parse_date, required=True, help="ISO sana/vaqt (UTC), kirmaydi")
+    q.add_argument("--group", type=int)
+    q.add_argument("--contains", help="xom JSON satrda substring")
+    q.add_argument("--dir", help="arxiv papkasi (default: LOG_ARCHIVE_DIR)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    if args.command == "query":
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        archive_dir = args.dir or os.getenv("LOG_ARCHIVE_DIR")
+        if not archive_dir:
+            parser.error("--dir yoki LOG_ARCHIVE_DIR kerak")
+        count = 0
+        for row in query_archive(
+                archive_dir, args.table, args.since, args.until,
+                group_id=args.group, contains=args.contains,
+        ):
+            sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+        logger.info("Arxivdan %s ta qator", count)
+        return 0
+
+    from .config import load_settings
+    from .db_pool import close_pool
+
+    settings = load_settings()
+    if not settings.log_archive_dir:
+        parser.error("LOG_ARCHIVE_DIR .env ichida ko'rsatilmagan")
+    try:
+        archive_expired_partitions(settings)
+    finally:
+        close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# bot/log_writer.py
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from .config import Settings
+from .db import LOG_TABLE_COLUMNS, insert_log_rows
+
+logger = logging.getLogger(__name__)
+
+FLUSH_ROWS = 500  # buferda shuncha qator yig'ilsa – darhol flush
+MAX_BUFFERED_ROWS = 10_000  # xotira chegarasi: oshsa, bufer diskka tushadi
+REPLAY_FILES_PER_FLUSH = 5  # DB qaytganda bitta flush'da nechta spill fayl qayta yoziladi
+STATS_EVERY_SECONDS = 60
+REPLAY_RETRY_SECONDS = 30  # replay xato bersa, keyingi urinishgacha
+
+
+class LogWriter:
+    """
+    ai_check_logs / ai_error_logs / ai_voice_logs uchun write-behind yozuvchi.
+
+    - enqueue(): hot-path, faqat list.append (I/O yo'q)
+    - FLUSH_ROWS qator yoki LOG_FLUSH_SECONDS dan eski qator bo'lsa – har jadval
+      uchun bitta multi-row INSERT (thread ichida, pool connection bilan)
+    - Postgres ishlamasa yoki bufer MAX_BUFFERED_ROWS dan oshsa – qatorlar
+      spill_dir ga JSONL bo'lib tushadi va DB qaytganda qayta yoziladi
+    - stats(): navbat chuqurligi, flush latency, spill/replay hisoblari
+    """
+
+    def __init__(self, settings: Settings, flush_seconds: float = 2.0, spill_dir: str = "data/log_spill"):
+        self._settings = settings
+        self._flush_seconds = flush_seconds
+        self._spill_dir = spill_dir
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {table: [] for table in LOG_TABLE_COLUMNS}
+        self._buffered = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._next_replay = 0.0
+
+        self.flushes = 0
+        self.rows_written = 0
+        self.flush_ms_last = 0.0
+        self.flush_ms_max = 0.0
+        self.flush_ms_total = 0.0
+        self.failures = 0
+        self.rows_spilled = 0
+        self.rows_replayed = 0
+        self.depth_max = 0
+
+    # ------------------------------------------------------------------
+    def enqueue(self, table: str, row: Dict[str, Any]) -> None:
+        self._buffers[table].append(row)
+        self._buffered += 1
+        self.depth_max = max(self.depth_max, self._buffered)
+
+        if self._buffered >= MAX_BUFFERED_ROWS:
+            # DB sekin/ishlamayapti: xotirani cheklash uchun hammasini diskka
+            buffers = self._take()
+            for t, rows in buffers.items():
+                self._spill(t, rows)
+            logger.warning("LogWriter: bufer to'ldi, %s ta qator diskka yozildi.", sum(map(len, buffers.values())))
+        elif self._buffered >= FLUSH_ROWS:
+            self._wakeup.set()
+
+    def _take(self) -> Dict[str, List[Dict[str, Any]]]:
+        taken = {t: rows for t, rows in self._buffers.items() if rows}
+        self._buffers = {table: [] for table in LOG_TABLE_COLUMNS}
+        self._buffered = 0
+        return taken
+
+    # ------------------------------------------------------------------
+    def _spill(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        os.makedirs(self._spill_dir, exist_ok=True)
+        path = os.path.join(self._spill_dir, f"{table}-{time.time_ns()}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        self.rows_spilled += len(rows)
+
+    def _spill_files(self) -> List[str]:
+        if not os.path.isdir(self._spill_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self._spill_dir)
+            if name.endswith(".jsonl") and name.rsplit("-", 1)[0] in LOG_TABLE_COLUMNS
+        )
+
+    def _replay_spilled(self) -> int:
+        replayed = 0
+        for name in self._spill_files()[:REPLAY_FILES_PER_FLUSH]:
+            path = os.path.join(self._spill_dir, name)
+            table = name.rsplit("-", 1)[0]
+            with open(path, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            if rows:
+                insert_log_rows(self._settings, table, rows)
+            os.remove(path)
+            replayed += len(rows)
+            self.rows_replayed += len(rows)
+        return replayed
+
+    # ------------------------------------------------------------------
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            buffers = self._take()
+            failed = False
+
+            for table, rows in buffers.items():
+                started = time.perf_counter()
+                try:
+                    await asyncio.to_thread(insert_log_rows, self._settings, table, rows)
+                except Exception as e:
+                    failed = True
+                    self.failures += 1
+                    logger.error("LogWriter: %s ga yozib bo'lmadi (%s ta qator diskka): %s", table, len(rows), e)
+                    await asyncio.to_thread(self._spill, table, rows)
+                    continue
+
+                took = (time.perf_counter() - started) * 1000
+                self.flushes += 1
+                self.rows_written += len(rows)
+                self.flush_ms_last = took
+                self.flush_ms_total += took
+                self.flush_ms_max = max(self.flush_ms_max, took)
+
+            if not failed and time.monotonic() >= self._next_replay:
+                try:
+                    replayed = await asyncio.to_thread(self._replay_spilled)
+                    if replayed:
+                        logger.info("LogWriter: diskdagi %s ta qator DB ga qayta yozildi.", replayed)
+                except Exception as e:
+                    self._next_replay = time.monotonic() + REPLAY_RETRY_SECONDS
+                    logger.warning("LogWriter: spill replay xatolik: %s", e)
+
+    async def run(self) -> None:
+        last_stats = time.monotonic()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+            now = time.monotonic()
+            if now - last_stats >= STATS_EVERY_SECONDS:
+                last_stats = now
+                if self.flushes or self.failures:
+                    logger.info("LogWriter stats: %s", self.stats())
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        logger.info("LogWriter stats: %s", self.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self._buffered,
+            "depth_max": self.depth_max,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "flush_ms_last": round(self.flush_ms_last, 1),
+            "flush_ms_avg": round(self.flush_ms_total / self.flushes, 1) if self.flushes else 0.0,
+            "flush_ms_max": round(self.flush_ms_max, 1),
+            "failures": self.failures,
+            "rows_spilled": self.rows_spilled,
+            "rows_replayed": self.rows_replayed,
+            "spill_files": len(self._spill_files()),
+        }
+
+
+LOG_WRITER: Optional[LogWriter] = None
+
+
+def start_log_writer(settings: Settings) -> LogWriter:
+    """
+    Event loop ichida chaqiriladi (dp.startup). Shutdown'da graceful_shutdown flush qiladi.
+    """
+    from .shutdown import register_flusher
+
+    global LOG_WRITER
+    if LOG_WRITER is None:
+        LOG_WRITER = LogWriter(
+            settings,
+            flush_seconds=settings.log_flush_seconds,
+            spill_dir=settings.log_spill_dir,
+        )
+        register_flusher("log_writer", LOG_WRITER.close)
+    LOG_WRITER.start()
+    return LOG_WRITER
+
+
+def enqueue_log_row(table: str, row: Dict[str, Any]) -> bool:
+    """
+    Writer ishlamayotgan bo'lsa (DB_DSN yo'q) – False, qator tashlab yuboriladi.
+    """
+    if LOG_WRITER is None:
+        return False
+    LOG_WRITER.enqueue(table, row)
+    return True
@@ -0,0 +1,71 @@
+# bot/mailbox.py
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, Optional
+
+
+class _Mailbox:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class SessionMailboxes:
+    """
+    Har bir sessiya kaliti ((chat_id, user_id)) uchun xabarlarni KETMA-KET
+    qayta ishlash. Turli kalitlar parallel ishlaydi.
+
+    asyncio.Lock FIFO tartibda uyg'otadi, shuning uchun bir kalitdagi xabarlar
+    kelgan tartibida ishlanadi. Kutayotgan/ishlayotgan hech kim qolmasa,
+    mailbox darhol o'chiriladi (idle mailboxlar xotirada qolmaydi).
+    """
+
+    def __init__(self) -> None:
+        self._boxes: Dict[Hashable, _Mailbox] = {}
+        self._idle: Optional[asyncio.Event] = None
+
+    @asynccontextmanager
+    async def acquire(self, key: Hashable) -> AsyncIterator[None]:
+        box = self._boxes.get(key)
+        if box is None:
+            box = self._boxes[key] = _Mailbox()
+        box.users += 1
+        try:
+            async with box.lock:
+                yield
+        finally:
+            box.users -= 1
+            if box.users == 0 and self._boxes.get(key) is box:
+                del self._boxes[key]
+                if not self._boxes and self._idle is not None:
+                    self._idle.set()
+
+    def pending(self) -> Dict[Hashable, int]:
+        """
+        Kalit -> navbatdagi (ishlayotgan + kutayotgan) xabarlar soni.
+        """
+        return {key: box.users for key, box in self._boxes.items()}
+
+    async def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Shutdown uchun: barcha mailboxlar bo'shashini kutadi.
+        True – hammasi tugadi, False – timeout.
+        """
+        if not self._boxes:
+            return True
+        self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._idle = None
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+
+MAILBOXES = SessionMailboxes()
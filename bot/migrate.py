@@ -0,0 +1,145 @@
+# bot/migrate.py
+import logging
+import os
+import re
+import time
+from typing import List, Tuple
+
+from .config import Settings
+from .db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+MIGRATION_FILE_RE = re.compile(r"^(\d{4})_[\w\-]+\.sql$")
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+# Bir nechta process (sharding worker'lari) bir vaqtda migratsiya qilmasin
+ADVISORY_LOCK_ID = 0x41494F52  # "AIOR"
+
+
+def list_migrations(directory: str = MIGRATIONS_DIR) -> List[Tuple[int, str, str]]:
+    """
+    [(version, name, path), ...] – version bo'yicha tartiblangan.
+    """
+    found = []
+    for name in os.listdir(directory):
+        m = MIGRATION_FILE_RE.match(name)
+        if m:
+            found.append((int(m.group(1)), name, os.path.join(directory, name)))
+    found.sort()
+    versions = [v for v, _, _ in found]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Migratsiya versiyalari takrorlangan: {versions}")
+    return found
+
+
+def _split_statements(sql: str) -> List[str]:
+    """
+    no-transaction migratsiyalar uchun: har bir statement alohida yuboriladi
+    (CREATE INDEX CONCURRENTLY tranzaksiya ichida ishlamaydi).
+    $$ ... $$ (DO blok) ichidagi ; bo'lmaydi – blok bitta statement, o'z tranzaksiyasida.
+    """
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    statements = []
+    # $$ bo'yicha bo'laklar: juft indekslar – blokdan tashqarida
+    current = ""
+    for i, part in enumerate("\n".join(lines).split("$$")):
+        if i % 2:
+            current += "$$" + part + "$$"
+            continue
+        pieces = part.split(";")
+        current += pieces[0]
+        for piece in pieces[1:]:
+            statements.append(current)
+            current = piece
+    statements.append(current)
+    return [s.strip() for s in statements if s.strip()]
+
+
+def _current_version(cur) -> int:
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version;")
+    return cur.fetchone()[0]
+
+
+def run_migrations(settings: Settings) -> int:
+    """
+    Qo'llanmagan migratsiyalarni tartib bilan bajaradi. Qo'llanganlar soni qaytadi.
+
+    Baza allaqachon oxirgi versiyada bo'lsa – bitta SELECT, hech qanday DDL/lock yo'q.
+    """
+    started = time.perf_counter()
+    migrations = list_migrations()
+    head = migrations[-1][0] if migrations else 0
+
+    with get_pool(settings).connection() as conn:
+        with conn.cursor() as cur:
+            current = _current_version(cur)
+            if current >= head:
+                logger.info(
+                    "Schema at head (version=%s), check took %.1fms",
+                    current,
+                    (time.perf_counter() - started) * 1000,
+                )
+                return 0
+
+            cur.execute("SELECT pg_advisory_lock(%s);", (ADVISORY_LOCK_ID,))
+            # Pool connection'dagi statement_timeout (DB_STATEMENT_TIMEOUT_MS) backfill /
+            # index qurishni uzib qo'ymasin; RESET connection default'iga qaytaradi
+            cur.execute("SET statement_timeout = 0;")
+            try:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version     INTEGER PRIMARY KEY,
+                        name        TEXT NOT NULL,
+                        applied_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+                    );
+                    """
+                )
+                # Lock kutgan paytda boshqa process qo'llagan bo'lishi mumkin
+                current = _current_version(cur)
+                applied = 0
+                for version, name, path in migrations:
+                    if version <= current:
+                        continue
+                    _apply(conn, cur, version, name, path)
+                    applied += 1
+            finally:
+                cur.execute("RESET statement_timeout;")
+                cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_ID,))
+
+    logger.info(
+        "Migrations applied: %s (version %s -> %s) in %.1fms",
+        applied,
+        current,
+        head,
+        (time.perf_counter() - started) * 1000,
+    )
+    return applied
+
+
+def _apply(conn, cur, version: int, name: str, path: str) -> None:
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+
+    step_started = time.perf_counter()
+    if sql.lstrip().startswith(NO_TRANSACTION_MARKER):
+        for statement in _split_statements(sql):
+            cur.execute(statement)
+        cur.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s);", (version, name))
+    else:
+        conn.autocommit = False
+        try:
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s);", (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+
+    logger.info("Migration %s applied in %.1fms", name, (time.perf_counter() - step_started) * 1000)
@@ -0,0 +1,90 @@
+-- Boshlang'ich sxema (avval init_db / init_order_dataset_table har startda bajarardi).
+-- IF NOT EXISTS: mavjud bazada ham xavfsiz qo'llanadi.
+
+CREATE TABLE IF NOT EXISTS ai_orders (
+    id              SERIAL PRIMARY KEY,
+    user_message_id BIGINT,
+    user_id         BIGINT NOT NULL,
+    username        TEXT,
+    full_name       TEXT,
+    group_id        BIGINT NOT NULL,
+    group_title     TEXT,
+    order_text      TEXT,
+    phones          TEXT[],
+    location        JSONB,
+    amount          BIGINT,
+    is_active       BOOLEAN NOT NULL DEFAULT TRUE,
+    cancelled_at    TIMESTAMPTZ,
+    created_at      TIMESTAMPTZ DEFAULT now()
+);
+
+-- Eskidan qolgan bo'lishi mumkin
+ALTER TABLE ai_orders ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE;
+ALTER TABLE ai_orders ADD COLUMN IF NOT EXISTS cancelled_at TIMESTAMPTZ;
+ALTER TABLE ai_orders ADD COLUMN IF NOT EXISTS amount BIGINT;
+
+CREATE TABLE IF NOT EXISTS ai_voice_logs (
+    id              SERIAL PRIMARY KEY,
+    user_message_id BIGINT,
+    user_id         BIGINT NOT NULL,
+    username        TEXT,
+    full_name       TEXT,
+    group_id        BIGINT NOT NULL,
+    group_title     TEXT,
+    voice_file_id   TEXT,
+    stt_text        TEXT,
+    phones          TEXT[],
+    amount          BIGINT,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS ai_check_logs (
+    id              SERIAL PRIMARY KEY,
+    user_message_id BIGINT,
+    user_id         BIGINT,
+    username        TEXT,
+    full_name       TEXT,
+    group_id        BIGINT,
+    group_title     TEXT,
+    text            TEXT,
+    ai              JSONB,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS ai_error_logs (
+    id              SERIAL PRIMARY KEY,
+    user_message_id BIGINT,
+    user_id         BIGINT,
+    username        TEXT,
+    full_name       TEXT,
+    group_id        BIGINT,
+    group_title     TEXT,
+    text            TEXT,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- qo'lda yoki optimizer orqali kiritiladigan prompt konfiguratsiyalar
+CREATE TABLE IF NOT EXISTS ai_prompt_configs (
+    id          SERIAL PRIMARY KEY,
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    source      TEXT NOT NULL,          -- 'manual' | 'optimizer'
+    version     INTEGER NOT NULL,       -- 1, 2, 3 ...
+    is_active   BOOLEAN NOT NULL DEFAULT FALSE,
+    payload     JSONB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ai_order_dataset (
+    id              SERIAL PRIMARY KEY,
+    order_id        INTEGER,          -- ai_orders.id
+    user_message_id BIGINT,           -- asosiy base_message.id
+    user_id         BIGINT,
+    username        TEXT,
+    full_name       TEXT,
+    group_id        BIGINT,
+    group_title     TEXT,
+    messages        TEXT[],           -- sessiyadagi hamma xabarlar
+    phones          TEXT[],
+    location        JSONB,
+    amount          BIGINT,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Idempotent finalize: (group_id, user_message_id, message_part) bo'yicha bitta zakaz.
+-- Eski qatorlarda message_part NULL qoladi – ulardagi dublikatlar indeksga xalaqit bermaydi.
+-- CONCURRENTLY: ai_orders ga yozishni bloklamaydi.
+
+ALTER TABLE ai_orders ADD COLUMN IF NOT EXISTS message_part SMALLINT;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ai_orders_idempotency_uq
+    ON ai_orders (group_id, user_message_id, message_part)
+    WHERE message_part IS NOT NULL;
@@ -0,0 +1,9 @@
+-- SESSION_STORE=postgres uchun sessiyalar jadvali (bot/session_store.py)
+
+CREATE TABLE IF NOT EXISTS ai_order_sessions (
+    chat_id     BIGINT NOT NULL,
+    session_key BIGINT NOT NULL,
+    payload     JSONB NOT NULL,
+    updated_at  TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (chat_id, session_key)
+);
@@ -0,0 +1,24 @@
+-- migrate: no-transaction
+-- Issiq so'rovlar uchun indekslar (avval faqat PRIMARY KEY bor edi).
+-- CONCURRENTLY: katta jadvallarda ham yozishni bloklamaydi.
+
+-- load_orders_for_prompt_dataset: ORDER BY created_at DESC LIMIT n (backward index scan)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_orders_created_at_idx
+    ON ai_orders (created_at);
+
+-- Guruh bo'yicha so'rovlar (hisobot, export)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_orders_group_created_idx
+    ON ai_orders (group_id, created_at);
+
+-- phones && ARRAY[...] / phones @> ARRAY[...] qidiruvi
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_orders_phones_gin
+    ON ai_orders USING GIN (phones);
+
+-- get_active_prompt_config: WHERE is_active ORDER BY id DESC LIMIT 1
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_prompt_configs_active_idx
+    ON ai_prompt_configs (id DESC)
+    WHERE is_active;
+
+-- FinalizeDelayModel.load_history: WHERE created_at > now() - N days
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_order_dataset_created_at_idx
+    ON ai_order_dataset (created_at);
@@ -0,0 +1,123 @@
+-- migrate: no-transaction
+-- ai_check_logs / ai_error_logs / ai_voice_logs – oylik RANGE (created_at) partitsiyalar.
+--
+-- Eski jadval <name>_legacy bo'lib, (MINVALUE, chegara) partitsiyasi sifatida ulanadi
+-- (ma'lumot ko'chirilmaydi). Retention vaqti kelganda u ham oddiy oylik partitsiya
+-- kabi DROP qilinadi (bot/partitions.py).
+--
+-- Issiq jadval uzoq lock qilinmasin – og'ir ishlar swap'dan oldin, yozish to'xtamasdan:
+--   1) legacy indekslari CREATE INDEX CONCURRENTLY;
+--   2) CHECK (created_at < chegara) NOT VALID, keyin VALIDATE (SHARE UPDATE EXCLUSIVE);
+--   3) qisqa tranzaksiya: rename, parent (indekslari ON ONLY), ATTACH PARTITION –
+--      tasdiqlangan CHECK tufayli jadval skan qilinmaydi, indekslar tayyorlari ulanadi.
+-- Chegara – migratsiya vaqtidan ~1 kun keyin (soat boshi): 1-2 qadamlar davomida bot
+-- shu jadvalga yozishda davom etadi, yangi qatorlar CHECK dan o'tishi kerak. Shuning uchun
+-- chegara oyining partitsiyasi [chegara, keyingi oy) – qisqa; undan keyingilari to'liq oy.
+-- Chegara oyi + keyingi 2 oy shu yerda, keyingilari bot/partitions.py da yaratiladi.
+-- <name>_default – partitsiya yaratish kechiksa, yozuvlar yo'qolmasin.
+-- Oy chegaralari UTC bo'yicha.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_check_logs_legacy_created_at_idx
+    ON ai_check_logs (created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_check_logs_legacy_group_id_created_at_idx
+    ON ai_check_logs (group_id, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_error_logs_legacy_created_at_idx
+    ON ai_error_logs (created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_error_logs_legacy_group_id_created_at_idx
+    ON ai_error_logs (group_id, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_voice_logs_legacy_created_at_idx
+    ON ai_voice_logs (created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_voice_logs_legacy_group_id_created_at_idx
+    ON ai_voice_logs (group_id, created_at);
+
+-- Har ishga tushishda yangi chegara: oldingi urinish to'xtab qolgan bo'lsa, eski
+-- chegara o'tib ketib, yozishni CHECK bloklamasin
+DO $$
+DECLARE
+    t     TEXT;
+    bound TIMESTAMPTZ := date_trunc('hour', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '1 day';
+BEGIN
+    FOREACH t IN ARRAY ARRAY['ai_check_logs', 'ai_error_logs', 'ai_voice_logs'] LOOP
+        IF (SELECT relkind FROM pg_class WHERE oid = t::regclass) = 'p' THEN
+            CONTINUE;  -- allaqachon partitsiyalangan
+        END IF;
+        EXECUTE format('ALTER TABLE %I DROP CONSTRAINT IF EXISTS %I', t, t || '_legacy_bound');
+        EXECUTE format(
+            'ALTER TABLE %I ADD CONSTRAINT %I CHECK (created_at < %L) NOT VALID',
+            t, t || '_legacy_bound', bound
+        );
+    END LOOP;
+END $$;
+
+-- Butun jadval skani, lekin faqat SHARE UPDATE EXCLUSIVE: o'qish/yozish davom etadi
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['ai_check_logs', 'ai_error_logs', 'ai_voice_logs'] LOOP
+        IF (SELECT relkind FROM pg_class WHERE oid = t::regclass) = 'p' THEN
+            CONTINUE;
+        END IF;
+        EXECUTE format('ALTER TABLE %I VALIDATE CONSTRAINT %I', t, t || '_legacy_bound');
+    END LOOP;
+END $$;
+
+DO $$
+DECLARE
+    t     TEXT;
+    bound TIMESTAMPTZ;
+    lo    TIMESTAMPTZ;
+    hi    TIMESTAMPTZ;
+    i     INTEGER;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['ai_check_logs', 'ai_error_logs', 'ai_voice_logs'] LOOP
+        IF (SELECT relkind FROM pg_class WHERE oid = t::regclass) = 'p' THEN
+            CONTINUE;
+        END IF;
+
+        SELECT (regexp_match(pg_get_constraintdef(oid), '''([^'']+)'''))[1]::TIMESTAMPTZ
+        INTO bound
+        FROM pg_constraint
+        WHERE conrelid = t::regclass AND conname = t || '_legacy_bound';
+
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', t, t || '_legacy');
+        -- Ustunlar, NOT NULL va DEFAULT (id sequence) o'sha-o'sha; PRIMARY KEY yo'q:
+        -- partitsiyalangan jadvalda u created_at ni ham o'z ichiga olishi kerak bo'lardi
+        EXECUTE format(
+            'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)',
+            t, t || '_legacy'
+        );
+        -- Legacy partitsiya DROP qilinganda sequence u bilan birga o'chmasin
+        EXECUTE format('ALTER SEQUENCE %I OWNED BY %I.id', t || '_id_seq', t);
+
+        -- ON ONLY: parent indeksi partitsiyalarni qurmaydi, tayyorlari ulanadi
+        EXECUTE format('CREATE INDEX %I ON ONLY %I (created_at)', t || '_created_at_idx', t);
+        EXECUTE format('CREATE INDEX %I ON ONLY %I (group_id, created_at)', t || '_group_created_idx', t);
+
+        -- CHECK (created_at < bound) tasdiqlangan – bound'ni tekshirish uchun skan yo'q
+        EXECUTE format(
+            'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (MINVALUE) TO (%L)',
+            t, t || '_legacy', bound
+        );
+        EXECUTE format('ALTER INDEX %I ATTACH PARTITION %I', t || '_created_at_idx', t || '_legacy_created_at_idx');
+        EXECUTE format(
+            'ALTER INDEX %I ATTACH PARTITION %I',
+            t || '_group_created_idx', t || '_legacy_group_id_created_at_idx'
+        );
+        -- Partitsiya chegarasi endi shuni kafolatlaydi
+        EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', t || '_legacy', t || '_legacy_bound');
+
+        -- Yangi (bo'sh) partitsiyalarning indekslari CREATE TABLE da quriladi
+        lo := bound;
+        FOR i IN 0..2 LOOP
+            hi := date_trunc('month', lo AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '1 month';
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                t || '_p' || to_char(lo AT TIME ZONE 'UTC', 'YYYYMM'), t, lo, hi
+            );
+            lo := hi;
+        END LOOP;
+
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', t || '_default', t);
+    END LOOP;
+END $$;
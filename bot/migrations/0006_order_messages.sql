@@ -0,0 +1,15 @@
+-- Yuborilgan zakaz xabari -> zakaz: reply-update xabar matnini parslamasdan
+-- (chat_id, message_id) bo'yicha strukturali kartani oladi (bot/order_messages.py).
+
+CREATE TABLE IF NOT EXISTS ai_order_messages (
+    chat_id     BIGINT NOT NULL,        -- zakaz yuborilgan guruh
+    message_id  BIGINT NOT NULL,        -- bot yuborgan xabar
+    order_id    INTEGER NOT NULL,       -- ai_orders.id
+    card        JSONB NOT NULL,         -- OrderCard (bot/handlers/order_card.py)
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (chat_id, message_id)
+);
+
+-- update_order_row: zakaz yangilanganda uning barcha xabarlaridagi karta
+CREATE INDEX IF NOT EXISTS ai_order_messages_order_idx
+    ON ai_order_messages (order_id);
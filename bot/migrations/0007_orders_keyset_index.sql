@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- iter_orders keyset pagination: ORDER BY created_at, id + (created_at, id) < (...).
+-- (created_at, id) indeksi 0004 dagi (created_at) ni to'liq qoplaydi.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_orders_created_id_idx
+    ON ai_orders (created_at, id);
+
+DROP INDEX CONCURRENTLY IF EXISTS ai_orders_created_at_idx;
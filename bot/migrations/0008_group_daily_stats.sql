@@ -0,0 +1,158 @@
+-- (group_id, kun) bo'yicha zakaz/log agregatlari: /stats faqat shu jadvalni o'qiydi.
+--
+-- Statement-level triggerlar (transition table): bitta INSERT/UPDATE statement
+-- uchun har (group_id, kun) ga bitta UPSERT – LogWriter'ning 500 qatorlik
+-- batch'i ham bitta-ikkita UPSERT bo'ladi.
+-- Kun – Asia/Tashkent bo'yicha. group_id NULL bo'lgan loglar 0 ga yoziladi.
+-- Bekor qilish zakaz yaratilgan kunga hisoblanadi (cancelled / orders – o'sha kun ulushi).
+
+CREATE TABLE IF NOT EXISTS ai_group_daily_stats (
+    group_id            BIGINT NOT NULL,
+    day                 DATE NOT NULL,
+    orders              INTEGER NOT NULL DEFAULT 0,
+    orders_with_amount  INTEGER NOT NULL DEFAULT 0,
+    amount_sum          BIGINT NOT NULL DEFAULT 0,
+    cancelled           INTEGER NOT NULL DEFAULT 0,
+    check_logs          INTEGER NOT NULL DEFAULT 0,
+    error_logs          INTEGER NOT NULL DEFAULT 0,
+    voice_logs          INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_id, day)
+);
+
+-- Barcha guruhlar bo'yicha sana oralig'i (/stats umumiy)
+CREATE INDEX IF NOT EXISTS ai_group_daily_stats_day_idx
+    ON ai_group_daily_stats (day);
+
+CREATE OR REPLACE FUNCTION ai_stats_day(ts TIMESTAMPTZ) RETURNS DATE
+    LANGUAGE sql IMMUTABLE
+AS $$ SELECT (ts AT TIME ZONE 'Asia/Tashkent')::date $$;
+
+-- ai_orders INSERT: yangi zakazlar (ON CONFLICT DO NOTHING bilan o'tkazib yuborilganlar kirmaydi)
+CREATE OR REPLACE FUNCTION ai_stats_orders_insert() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO ai_group_daily_stats AS s (group_id, day, orders, orders_with_amount, amount_sum, cancelled)
+    SELECT group_id,
+           ai_stats_day(created_at),
+           COUNT(*),
+           COUNT(amount),
+           COALESCE(SUM(amount), 0),
+           COUNT(*) FILTER (WHERE NOT is_active)
+    FROM new_rows
+    WHERE created_at IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (group_id, day) DO UPDATE SET
+        orders             = s.orders + EXCLUDED.orders,
+        orders_with_amount = s.orders_with_amount + EXCLUDED.orders_with_amount,
+        amount_sum         = s.amount_sum + EXCLUDED.amount_sum,
+        cancelled          = s.cancelled + EXCLUDED.cancelled;
+    RETURN NULL;
+END $$;
+
+-- ai_orders UPDATE: bekor qilish (is_active TRUE -> FALSE) va reply-update'dagi summa o'zgarishi
+CREATE OR REPLACE FUNCTION ai_stats_orders_update() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO ai_group_daily_stats AS s (group_id, day, orders_with_amount, amount_sum, cancelled)
+    SELECT d.group_id, d.day, d.with_amount, d.amount_sum, d.cancelled
+    FROM (
+        SELECT n.group_id,
+               ai_stats_day(n.created_at) AS day,
+               COUNT(n.amount) - COUNT(o.amount) AS with_amount,
+               COALESCE(SUM(n.amount), 0) - COALESCE(SUM(o.amount), 0) AS amount_sum,
+               COUNT(*) FILTER (WHERE o.is_active AND NOT n.is_active)
+                   - COUNT(*) FILTER (WHERE NOT o.is_active AND n.is_active) AS cancelled
+        FROM new_rows n
+        JOIN old_rows o USING (id)
+        WHERE n.created_at IS NOT NULL
+        GROUP BY 1, 2
+    ) d
+    WHERE d.with_amount <> 0 OR d.amount_sum <> 0 OR d.cancelled <> 0
+    ON CONFLICT (group_id, day) DO UPDATE SET
+        orders_with_amount = s.orders_with_amount + EXCLUDED.orders_with_amount,
+        amount_sum         = s.amount_sum + EXCLUDED.amount_sum,
+        cancelled          = s.cancelled + EXCLUDED.cancelled;
+    RETURN NULL;
+END $$;
+
+-- Log jadvallari INSERT: TG_ARGV[0] – ai_group_daily_stats dagi ustun nomi
+CREATE OR REPLACE FUNCTION ai_stats_logs_insert() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    EXECUTE format(
+        'INSERT INTO ai_group_daily_stats AS s (group_id, day, %1$I)
+         SELECT COALESCE(group_id, 0), ai_stats_day(created_at), COUNT(*)
+         FROM new_rows
+         GROUP BY 1, 2
+         ON CONFLICT (group_id, day) DO UPDATE SET %1$I = s.%1$I + EXCLUDED.%1$I',
+        TG_ARGV[0]
+    );
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS ai_orders_stats_insert ON ai_orders;
+CREATE TRIGGER ai_orders_stats_insert
+    AFTER INSERT ON ai_orders
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ai_stats_orders_insert();
+
+DROP TRIGGER IF EXISTS ai_orders_stats_update ON ai_orders;
+CREATE TRIGGER ai_orders_stats_update
+    AFTER UPDATE ON ai_orders
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ai_stats_orders_update();
+
+DROP TRIGGER IF EXISTS ai_check_logs_stats_insert ON ai_check_logs;
+CREATE TRIGGER ai_check_logs_stats_insert
+    AFTER INSERT ON ai_check_logs
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ai_stats_logs_insert('check_logs');
+
+DROP TRIGGER IF EXISTS ai_error_logs_stats_insert ON ai_error_logs;
+CREATE TRIGGER ai_error_logs_stats_insert
+    AFTER INSERT ON ai_error_logs
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ai_stats_logs_insert('error_logs');
+
+DROP TRIGGER IF EXISTS ai_voice_logs_stats_insert ON ai_voice_logs;
+CREATE TRIGGER ai_voice_logs_stats_insert
+    AFTER INSERT ON ai_voice_logs
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ai_stats_logs_insert('voice_logs');
+
+-- Backfill: triggerlar bilan bitta tranzaksiyada (CREATE TRIGGER lock'i commit'gacha
+-- yozishni kutdiradi – oraliqdagi qatorlar ikki marta yoki umuman hisoblanmay qolmaydi).
+-- Bir martalik to'liq scan; keyin faqat triggerlar.
+TRUNCATE ai_group_daily_stats;
+
+INSERT INTO ai_group_daily_stats (group_id, day, orders, orders_with_amount, amount_sum, cancelled)
+SELECT group_id,
+       ai_stats_day(created_at),
+       COUNT(*),
+       COUNT(amount),
+       COALESCE(SUM(amount), 0),
+       COUNT(*) FILTER (WHERE NOT is_active)
+FROM ai_orders
+WHERE created_at IS NOT NULL
+GROUP BY 1, 2;
+
+INSERT INTO ai_group_daily_stats AS s (group_id, day, check_logs)
+SELECT COALESCE(group_id, 0), ai_stats_day(created_at), COUNT(*)
+FROM ai_check_logs
+GROUP BY 1, 2
+ON CONFLICT (group_id, day) DO UPDATE SET check_logs = EXCLUDED.check_logs;
+
+INSERT INTO ai_group_daily_stats AS s (group_id, day, error_logs)
+SELECT COALESCE(group_id, 0), ai_stats_day(created_at), COUNT(*)
+FROM ai_error_logs
+GROUP BY 1, 2
+ON CONFLICT (group_id, day) DO UPDATE SET error_logs = EXCLUDED.error_logs;
+
+INSERT INTO ai_group_daily_stats AS s (group_id, day, voice_logs)
+SELECT COALESCE(group_id, 0), ai_stats_day(created_at), COUNT(*)
+FROM ai_voice_logs
+GROUP BY 1, 2
+ON CONFLICT (group_id, day) DO UPDATE SET voice_logs = EXCLUDED.voice_logs;
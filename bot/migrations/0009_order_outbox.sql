@@ -0,0 +1,25 @@
+-- Zakazni guruh(lar)ga yuborish outbox'i: qatorlar zakaz bilan BITTA tranzaksiyada
+-- (save_finalized_order CTE) yoziladi, yuborishni bot/handlers/order_outbox.py qiladi.
+-- Crash / Telegram xatosi bo'lsa ham zakaz yo'qolmaydi: lease tugagach qayta yuboriladi.
+
+CREATE TABLE IF NOT EXISTS ai_order_outbox (
+    id               BIGSERIAL PRIMARY KEY,
+    order_id         INTEGER NOT NULL,                -- ai_orders.id
+    chat_id          BIGINT NOT NULL,                 -- maqsad guruh
+    fallback_chat_id BIGINT,                          -- maqsadga yuborib bo'lmasa (manba guruh)
+    card             JSONB NOT NULL,                  -- OrderCard (bot/handlers/order_card.py)
+    status           TEXT NOT NULL DEFAULT 'pending', -- pending | sent | failed
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at  TIMESTAMPTZ NOT NULL DEFAULT now(), -- pending: keyingi urinish / lease tugashi
+    last_error       TEXT,
+    sent_chat_id     BIGINT,
+    sent_message_id  BIGINT,
+    created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+    sent_at          TIMESTAMPTZ,
+    UNIQUE (order_id, chat_id)
+);
+
+-- Worker faqat navbatdagi pending qatorlarni ko'radi; sent/failed indeksga kirmaydi
+CREATE INDEX IF NOT EXISTS ai_order_outbox_due_idx
+    ON ai_order_outbox (next_attempt_at)
+    WHERE status = 'pending';
@@ -0,0 +1,39 @@
+-- Eski JSON/JSONL fayllarni import qilish (bot/legacy_import.py).
+
+-- Import qilingan yozuvlarning kontent hash'i: bir yozuv ikki marta kirmaydi
+-- (fayl qayta import qilinsa, nusxalangan/rotatsiya qilingan bo'lsa ham)
+CREATE TABLE IF NOT EXISTS ai_import_hashes (
+    content_hash TEXT PRIMARY KEY,
+    source       TEXT NOT NULL,
+    imported_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Fayl bo'yicha checkpoint: batch bilan bitta tranzaksiyada yangilanadi
+CREATE TABLE IF NOT EXISTS ai_import_checkpoints (
+    path         TEXT PRIMARY KEY,
+    head_hash    TEXT NOT NULL,          -- faylning birinchi bloki: fayl almashsa – boshidan
+    byte_offset  BIGINT NOT NULL,
+    records      BIGINT NOT NULL DEFAULT 0,
+    inserted     BIGINT NOT NULL DEFAULT 0,
+    updated_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- order_updates.txt (reply orqali zakaz yangilanishlari) tarixi
+CREATE TABLE IF NOT EXISTS ai_order_updates (
+    id               SERIAL PRIMARY KEY,
+    order_id         INTEGER,
+    group_id         BIGINT,
+    user_id          BIGINT,
+    location         JSONB,
+    phones_old       TEXT[],
+    phones_new       TEXT[],
+    amount_old       BIGINT,
+    amount_new       BIGINT,
+    location_updated BOOLEAN,
+    phones_updated   BOOLEAN,
+    amount_updated   BOOLEAN,
+    created_at       TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ai_order_updates_order_idx
+    ON ai_order_updates (order_id);
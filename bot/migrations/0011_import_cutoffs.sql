@@ -0,0 +1,10 @@
+-- Legacy import (bot/legacy_import.py): "jonli" yozuvlar chegarasi jadval bo'yicha bir marta
+-- hisoblanadi va saqlanadi. Har safar min(created_at) olinsa, import qilingan eski qatorlar
+-- uni pastga suradi va davom etganda qolgan yozuvlar "jonli" deb tashlab ketiladi.
+
+CREATE TABLE IF NOT EXISTS ai_import_cutoffs (
+    target_table TEXT PRIMARY KEY,
+    live_cutoff  TIMESTAMPTZ NOT NULL,      -- shundan yangi yozuvlar import qilinmaydi
+    source       TEXT NOT NULL,             -- 'min(created_at)' | '--before'
+    created_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
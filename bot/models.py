@@ -1,10 +1,53 @@
 # bot/models.py
+import time
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List, Set
+from typing import Optional, Dict, Any, Iterable, List, Set
 
+# Bitta sessiyada saqlanadigan xabarlar chegarasi (eng eskilari tushib qoladi)
+MAX_SESSION_MESSAGES = 50
+MAX_SESSION_BYTES = 16 * 1024
 
-@dataclass
+# Sessiya bo'yicha summa kandidati (kalit so'z) – add_session_text ichida tekshiriladi
+SESSION_MONEY_KEYWORDS = ("summa", "ming", "min", "мин", "минг", "сум", "сом", "тыс", "so'm", "som")
+
+
+class MessageRing(list):
+    """
+    raw_messages uchun chegaralangan ro'yxat: MAX_SESSION_MESSAGES ta xabar va
+    MAX_SESSION_BYTES (UTF-8) dan oshsa, eng eski xabarlar tashlab yuboriladi.
+    Oddiy list kabi ishlaydi (join, slice, json.dumps).
+    """
+    __slots__ = ("nbytes",)
+
+    def __init__(self, items: Iterable[str] = ()):
+        super().__init__()
+        self.nbytes = 0
+        self.extend(items)
+
+    def append(self, text: str) -> None:
+        super().append(text)
+        self.nbytes += len(text.encode("utf-8"))
+        while len(self) > 1 and (len(self) > MAX_SESSION_MESSAGES or self.nbytes > MAX_SESSION_BYTES):
+            self.nbytes -= len(self.pop(0).encode("utf-8"))
+
+    def extend(self, items: Iterable[str]) -> None:
+        for text in items:
+            self.append(text)
+
+
+def monotonic_to_datetime(ts: float) -> datetime:
+    """
+    time.monotonic() qiymatini (shu process ichida) UTC datetime ga o'giradi.
+    """
+    return datetime.fromtimestamp(time.time() - (time.monotonic() - ts), tz=timezone.utc)
+
+
+def datetime_to_monotonic(dt: datetime) -> float:
+    return time.monotonic() - (time.time() - dt.timestamp())
+
+
+@dataclass(slots=True)
 class OrderSession:
     user_id: int
     chat_id: int
@@ -12,7 +55,29 @@ class OrderSession:
     location: Optional[Dict[str, Any]] = None
     comments: List[str] = field(default_factory=list)
     product_texts: List[str] = field(default_factory=list)
-    raw_messages: List[str] = field(default_factory=list)
-    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    raw_messages: MessageRing = field(default_factory=MessageRing)
+    amount: Optional[int] = None
+    # time.monotonic() qiymatlari (soat o'zgarishiga bog'liq emas)
+    created_at: float = field(default_factory=time.monotonic)
+    updated_at: float = field(default_factory=time.monotonic)
     is_completed: bool = False
+    # Oxirgi structured extraction natijasi va u qaysi matndan olingani (fingerprint)
+    last_struct: Optional[Any] = None
+    last_struct_fp: Optional[str] = None
+    llm_calls: int = 0  # shu sessiya uchun extract_order_structured chaqiruvlari
+    # Inkremental belgilar: har xabarda bir marta yangilanadi (butun sessiya qayta skan qilinmaydi)
+    has_digits: bool = False
+    has_money_kw: bool = False
+
+
+def add_session_text(session: OrderSession, text: str) -> None:
+    """
+    Xabarni sessiyaga qo'shadi va belgilarni faqat shu xabar bo'yicha yangilaydi – O(len(text)).
+    """
+    session.raw_messages.append(text)
+    if not session.has_digits and any(ch.isdigit() for ch in text):
+        session.has_digits = True
+    if not session.has_money_kw:
+        low = text.lower()
+        if any(kw in low for kw in SESSION_MONEY_KEYWORDS):
+            session.has_money_kw = True
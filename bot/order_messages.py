@@ -0,0 +1,95 @@
+# bot/order_messages.py
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .config import Settings
+from .db import get_order_message, run_db, save_order_messages
+
+logger = logging.getLogger(__name__)
+
+MessageRef = Tuple[int, int]  # (chat_id, message_id)
+
+CACHE_SIZE = 5000  # reply odatda yaqinda yuborilgan zakazlarga bo'ladi
+
+
+class OrderMessageIndex:
+    """
+    Yuborilgan zakaz xabari (chat_id, message_id) -> (order_id, karta).
+
+    - remember(): finalize yuborgandan keyin – LRU + ai_order_messages
+    - lookup(): reply-update uchun – avval LRU, bo'lmasa bitta PK SELECT
+    - update_card(): reply-update kartani yamaganda LRU ham yangilanadi
+      (DB tomoni update_order_row ichida, o'sha so'rovda)
+    """
+
+    def __init__(self, capacity: int = CACHE_SIZE):
+        self._capacity = capacity
+        self._entries: "OrderedDict[MessageRef, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._by_order: Dict[int, Set[MessageRef]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _put(self, ref: MessageRef, order_id: int, card: Dict[str, Any]) -> None:
+        self._entries[ref] = (order_id, card)
+        self._entries.move_to_end(ref)
+        self._by_order.setdefault(order_id, set()).add(ref)
+        while len(self._entries) > self._capacity:
+            old_ref, (old_order_id, _) = self._entries.popitem(last=False)
+            refs = self._by_order.get(old_order_id)
+            if refs is not None:
+                refs.discard(old_ref)
+                if not refs:
+                    del self._by_order[old_order_id]
+
+    async def remember(
+            self,
+            settings: Settings,
+            order_id: int,
+            card: Dict[str, Any],
+            messages: List[MessageRef],
+            persist: bool = True,
+    ) -> None:
+        """
+        persist=False – ai_order_messages ga chaqiruvchi o'zi yozgan (outbox mark_outbox_sent).
+        """
+        for ref in messages:
+            self._put(ref, order_id, card)
+        if not persist or not settings.db_dsn:
+            return
+        try:
+            await run_db(save_order_messages, settings, order_id, card, messages)
+        except Exception as e:
+            # Kesh baribir bor; restartdan keyin esa reply-update eski (parslash) yo'lga tushadi
+            logger.error("ai_order_messages ga yozib bo'lmadi (order_id=%s): %s", order_id, e)
+
+    async def lookup(
+            self,
+            settings: Settings,
+            chat_id: int,
+            message_id: int,
+    ) -> Optional[Tuple[int, Dict[str, Any]]]:
+        ref = (chat_id, message_id)
+        entry = self._entries.get(ref)
+        if entry is not None:
+            self._entries.move_to_end(ref)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        if not settings.db_dsn:
+            return None
+        entry = await run_db(get_order_message, settings, chat_id, message_id)
+        if entry is not None:
+            self._put(ref, entry[0], entry[1])
+        return entry
+
+    def update_card(self, order_id: int, card: Dict[str, Any]) -> None:
+        for ref in self._by_order.get(order_id, ()):
+            self._entries[ref] = (order_id, card)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+ORDER_MESSAGES = OrderMessageIndex()
@@ -0,0 +1,190 @@
+# bot/partitions.py
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .config import Settings
+from .db import LOG_TABLE_COLUMNS, db_cursor, run_db
+
+logger = logging.getLogger(__name__)
+
+# Oylik partitsiyalangan log jadvallari (bot/migrations/0005_log_partitions.sql)
+PARTITIONED_TABLES = tuple(LOG_TABLE_COLUMNS)
+MONTHS_AHEAD = 2  # joriy oydan tashqari oldindan yaratiladigan oylar
+MAINTENANCE_INTERVAL_SECONDS = 6 * 3600
+
+
+def month_start(dt: datetime, add_months: int = 0) -> datetime:
+    """
+    dt oyining boshi (UTC) + add_months oy.
+    """
+    dt = dt.astimezone(timezone.utc)
+    index = dt.year * 12 + (dt.month - 1) + add_months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y%m}"
+
+
+def legacy_upper_bound(cur, table: str) -> Optional[datetime]:
+    """
+    <table>_legacy partitsiyasining TO (...) chegarasi (migratsiya vaqtidan ~1 kun keyin,
+    oy boshi bo'lishi shart emas). Legacy DROP qilingan bo'lsa – None.
+    """
+    cur.execute(
+        """
+        SELECT (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([^'']+)''\\)'))[1]::timestamptz
+        FROM pg_class c
+        WHERE c.oid = to_regclass(%s) AND c.relispartition;
+        """,
+        (f"{table}_legacy",),
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def ensure_log_partitions(settings: Settings, months_ahead: int = MONTHS_AHEAD) -> List[str]:
+    """
+    Joriy va keyingi months_ahead oy partitsiyalari bor bo'lishini ta'minlaydi.
+    Bor partitsiya uchun faqat to_regclass – parent jadvalga lock olinmaydi.
+    Legacy partitsiya to'liq qamragan oylar o'tkazib yuboriladi (chegara oyining
+    qisqa partitsiyasini migratsiya yaratgan).
+    """
+    now = datetime.now(timezone.utc)
+    created = []
+    with db_cursor(settings) as cur:
+        for table in PARTITIONED_TABLES:
+            legacy_bound = legacy_upper_bound(cur, table)
+            for i in range(months_ahead + 1):
+                lo = month_start(now, i)
+                hi = month_start(now, i + 1)
+                if legacy_bound is not None and hi <= legacy_bound:
+                    continue
+                name = partition_name(table, lo)
+                cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (name,))
+                if cur.fetchone()[0]:
+                    continue
+                try:
+                    cur.execute(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM (%s) TO (%s);",
+                        (lo, hi),
+                    )
+                    created.append(name)
+                except Exception as e:
+                    # Masalan: default partitsiyada shu oraliqdagi qatorlar bor
+                    logger.error("Partitsiya %s yaratilmadi: %s", name, e)
+    return created
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def partitions_before(cur, table: str, cutoff: datetime) -> List[str]:
+    """
+    Yuqori chegarasi <= cutoff bo'lgan partitsiyalar (eskisi birinchi).
+    DEFAULT partitsiyada TO (...) yo'q – regexp NULL qaytaradi, u kirmaydi.
+    """
+    cur.execute(
+        """
+        SELECT relname
+        FROM (
+            SELECT c.relname,
+                   (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([^'']+)''\\)'))[1]::timestamptz AS upper_bound
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        ) p
+        WHERE upper_bound <= %s
+        ORDER BY upper_bound;
+        """,
+        (table, cutoff),
+    )
+    return [name for (name,) in cur.fetchall()]
+
+
+def drop_expired_partitions(settings: Settings, retention_months: int) -> List[str]:
+    """
+    Yuqori chegarasi (joriy oy - retention_months) dan oldin bo'lgan partitsiyalarni
+    DROP qiladi (legacy partitsiya ham). DELETE emas – VACUUM/bloat yo'q.
+    Default partitsiyani DROP qilib bo'lmaydi: undagi shu davr qatorlari DELETE qilinadi.
+    retention_months <= 0 – hech narsa o'chirilmaydi.
+    """
+    if retention_months <= 0:
+        return []
+
+    cutoff = month_start(datetime.now(timezone.utc), -retention_months)
+    dropped = []
+    with db_cursor(settings) as cur:
+        for table in PARTITIONED_TABLES:
+            for name in partitions_before(cur, table, cutoff):
+                cur.execute(f"DROP TABLE IF EXISTS {name};")
+                dropped.append(name)
+
+            default = default_partition_name(table)
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (default,))
+            if cur.fetchone()[0]:
+                cur.execute(f"DELETE FROM {default} WHERE created_at < %s;", (cutoff,))
+                if cur.rowcount:
+                    logger.info("%s: %s ta muddati o'tgan qator o'chirildi", default, cur.rowcount)
+                    dropped.append(default)
+    return dropped
+
+
+def default_partition_rows(settings: Settings) -> Dict[str, bool]:
+    """
+    Default partitsiyaga qator tushgan bo'lsa – oylik partitsiya o'z vaqtida yaratilmagan.
+    """
+    result = {}
+    with db_cursor(settings) as cur:
+        for table in PARTITIONED_TABLES:
+            name = default_partition_name(table)
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (name,))
+            if not cur.fetchone()[0]:
+                continue
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {name});")
+            result[table] = bool(cur.fetchone()[0])
+    return result
+
+
+def maintain_log_partitions(settings: Settings) -> Dict[str, Any]:
+    created = ensure_log_partitions(settings)
+    if settings.log_archive_dir:
+        # Arxiv yoqilgan: eski partitsiyalarni archiver avval zstd ga yozib, keyin o'zi DROP qiladi
+        from .log_archive import archive_expired_partitions
+
+        archived = archive_expired_partitions(settings)
+        dropped = [name for name, _ in archived]
+    else:
+        dropped = drop_expired_partitions(settings, settings.log_retention_months)
+    for table, has_rows in default_partition_rows(settings).items():
+        if has_rows:
+            logger.warning("%s_default partitsiyasida qatorlar bor – oylik partitsiya kechikkan.", table)
+    if created or dropped:
+        logger.info("Log partitsiyalar: yaratildi=%s, o'chirildi=%s", created, dropped)
+    return {"created": created, "dropped": dropped}
+
+
+async def run_partition_maintenance(settings: Settings) -> None:
+    while True:
+        try:
+            await run_db(maintain_log_partitions, settings)
+        except Exception as e:
+            logger.error("Log partitsiya maintenance xatolik: %s", e)
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+
+_MAINTENANCE_TASK: Optional[asyncio.Task] = None
+
+
+def start_partition_maintenance(settings: Settings) -> None:
+    """
+    Event loop ichida chaqiriladi (dp.startup). Sharding'da har bir worker ishga
+    tushiradi – operatsiyalar idempotent (IF NOT EXISTS / IF EXISTS).
+    """
+    global _MAINTENANCE_TASK
+    if _MAINTENANCE_TASK is None or _MAINTENANCE_TASK.done():
+        _MAINTENANCE_TASK = asyncio.get_running_loop().create_task(run_partition_maintenance(settings))
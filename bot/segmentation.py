@@ -0,0 +1,213 @@
+# bot/segmentation.py
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from aiogram.types import Message
+
+from .utils.amounts import extract_amount_from_text
+from .utils.phones import extract_phones
+
+logger = logging.getLogger(__name__)
+
+SessionKey = Tuple[int, int]
+
+MAX_OPEN_SEGMENTS = 1000  # bitta guruhda bir vaqtda ochiq zakazlar chegarasi
+MAX_ASSIGNED_CACHE = 20000  # (chat_id, message_id) -> key memo
+MIN_INDEXED_AMOUNT = 1000  # kichik sonlar (soni, vaqt) bo'yicha bog'lamaymiz
+
+
+class _Segment:
+    __slots__ = ("key", "users", "last_ts", "phones", "amounts", "has_location", "message_ids")
+
+    def __init__(self, key: SessionKey, now: float):
+        self.key = key
+        self.users: Set[int] = set()
+        self.last_ts = now
+        self.phones: Set[str] = set()
+        self.amounts: Set[int] = set()
+        self.has_location = False
+        self.message_ids: Set[int] = set()
+
+
+class _GroupSegments:
+    """
+    Bitta guruhdagi ochiq zakazlar va ularning indekslari.
+    Har bir lookup dict orqali – guruhda yuzlab ochiq zakaz bo'lsa ham O(1).
+    """
+
+    def __init__(self) -> None:
+        # Faollik tartibida (eng eskisi boshida) – expire uchun
+        self.segments: "OrderedDict[SessionKey, _Segment]" = OrderedDict()
+        self.by_message: Dict[int, SessionKey] = {}
+        self.by_phone: Dict[str, SessionKey] = {}
+        self.by_amount: Dict[int, SessionKey] = {}
+        self.by_user: Dict[int, SessionKey] = {}
+        # Telefon/summa bor, lekin lokatsiya hali kelmagan zakazlar
+        self.awaiting_location: "OrderedDict[SessionKey, None]" = OrderedDict()
+
+    def get(self, key: Optional[SessionKey]) -> Optional[_Segment]:
+        return self.segments.get(key) if key is not None else None
+
+    def add(self, seg: _Segment, message_id: int, user_id: int, phones: Set[str],
+            amount: Optional[int], is_location: bool, now: float) -> None:
+        self.segments[seg.key] = seg
+        self.segments.move_to_end(seg.key)
+        seg.last_ts = now
+        seg.users.add(user_id)
+        seg.message_ids.add(message_id)
+        self.by_message[message_id] = seg.key
+        self.by_user[user_id] = seg.key
+        for p in phones:
+            seg.phones.add(p)
+            self.by_phone[p] = seg.key
+        if amount is not None:
+            seg.amounts.add(amount)
+            self.by_amount[amount] = seg.key
+        if is_location:
+            seg.has_location = True
+            self.awaiting_location.pop(seg.key, None)
+        elif seg.phones or seg.amounts:
+            self.awaiting_location[seg.key] = None
+            self.awaiting_location.move_to_end(seg.key)
+
+    def remove(self, key: SessionKey) -> None:
+        seg = self.segments.pop(key, None)
+        if seg is None:
+            return
+        self.awaiting_location.pop(key, None)
+        for index, values in (
+                (self.by_message, seg.message_ids),
+                (self.by_phone, seg.phones),
+                (self.by_amount, seg.amounts),
+                (self.by_user, seg.users),
+        ):
+            for v in values:
+                if index.get(v) == key:
+                    del index[v]
+
+    def expire(self, older_than: float) -> int:
+        removed = 0
+        while self.segments:
+            key, seg = next(iter(self.segments.items()))
+            if seg.last_ts >= older_than and len(self.segments) <= MAX_OPEN_SEGMENTS:
+                break
+            self.remove(key)
+            removed += 1
+        return removed
+
+
+class ConversationSegmenter:
+    """
+    Guruhdagi har bir xabarni ochiq zakazlardan biriga biriktiradi.
+
+    (chat_id, user_id) kaliti o'rniga zakaz (segment) kaliti qaytariladi:
+    (chat_id, -birinchi_message_id). Shakli o'sha-o'sha (int, int), shuning uchun
+    SESSIONS, mailbox, session store va sharding o'zgarishsiz ishlaydi.
+
+    Tartib (birinchi mos kelgani):
+      1. reply – javob berilgan xabar qaysi zakazda bo'lsa, o'sha
+      2. telefon – xabardagi raqam ochiq zakazda bor bo'lsa, o'sha
+      3. shu operatorning oxirgi ochiq zakazi (max_gap ichida), agar xabar unga
+         zid bo'lmasa: boshqa telefon yoki ikkinchi lokatsiya – yangi mijoz
+      4. summa – boshqa operator shu summani yozgan zakaz
+      5. lokatsiya – guruhda lokatsiyasini kutayotgan eng oxirgi zakaz
+      6. aks holda – yangi zakaz
+
+    Eslatma: indekslar faqat xotirada; restartdan keyin sessiyalar store'dan
+    tiklanadi, lekin segment indekslari yangi xabarlardan qayta quriladi.
+    """
+
+    def __init__(self, max_gap_seconds: float):
+        self._max_gap = max_gap_seconds
+        self._groups: Dict[int, _GroupSegments] = {}
+        self._assigned: "OrderedDict[Tuple[int, int], SessionKey]" = OrderedDict()
+        self.stats: Counter = Counter()
+
+    def assign(self, message: Message) -> SessionKey:
+        chat_id = message.chat.id
+        memo_key = (chat_id, message.message_id)
+        cached = self._assigned.get(memo_key)
+        if cached is not None:
+            return cached
+
+        now = time.monotonic()
+        group = self._groups.get(chat_id)
+        if group is None:
+            group = self._groups[chat_id] = _GroupSegments()
+        group.expire(now - self._max_gap)
+
+        user_id = message.from_user.id  # type: ignore[union-attr]
+        text = message.text or message.caption or ""
+        phones = set(extract_phones(text)) if text else set()
+        amount = extract_amount_from_text(text) if text else None
+        if amount is not None and amount < MIN_INDEXED_AMOUNT:
+            amount = None
+        is_location = message.location is not None or message.venue is not None
+
+        seg, reason = self._match(group, message, user_id, phones, amount, is_location)
+        if seg is None:
+            seg = _Segment((chat_id, -message.message_id), now)
+
+        group.add(seg, message.message_id, user_id, phones, amount, is_location, now)
+        self.stats[reason] += 1
+
+        self._assigned[memo_key] = seg.key
+        if len(self._assigned) > MAX_ASSIGNED_CACHE:
+            self._assigned.popitem(last=False)
+
+        logger.debug("Segment: chat=%s msg=%s -> %s (%s)", chat_id, message.message_id, seg.key, reason)
+        return seg.key
+
+    def _match(self, group: _GroupSegments, message: Message, user_id: int,
+               phones: Set[str], amount: Optional[int],
+               is_location: bool) -> Tuple[Optional[_Segment], str]:
+        reply = message.reply_to_message
+        if reply is not None:
+            seg = group.get(group.by_message.get(reply.message_id))
+            if seg is not None:
+                return seg, "reply"
+
+        for p in phones:
+            seg = group.get(group.by_phone.get(p))
+            if seg is not None:
+                return seg, "phone"
+
+        seg = group.get(group.by_user.get(user_id))
+        if seg is not None:
+            other_customer = bool(phones and seg.phones and not (phones & seg.phones))
+            second_location = is_location and seg.has_location
+            if other_customer or second_location:
+                return None, "split"
+            return seg, "user"
+
+        if amount is not None:
+            seg = group.get(group.by_amount.get(amount))
+            if seg is not None:
+                return seg, "amount"
+
+        if is_location and group.awaiting_location:
+            seg = group.get(next(reversed(group.awaiting_location)))
+            if seg is not None:
+                return seg, "location"
+
+        return None, "new"
+
+    def close(self, key: SessionKey) -> None:
+        group = self._groups.get(key[0])
+        if group is None:
+            return
+        group.remove(key)
+        if not group.segments:
+            del self._groups[key[0]]
+
+    def forget_chat(self, chat_id: int) -> None:
+        self._groups.pop(chat_id, None)
+
+    def chats(self) -> Set[int]:
+        return set(self._groups)
+
+    def open_segments(self, chat_id: int) -> int:
+        group = self._groups.get(chat_id)
+        return len(group.segments) if group else 0
@@ -0,0 +1,377 @@
+# bot/session_store.py
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from psycopg2.extras import Json
+
+from .config import Settings
+from .models import (
+    MessageRing,
+    OrderSession,
+    add_session_text,
+    datetime_to_monotonic,
+    monotonic_to_datetime,
+)
+
+logger = logging.getLogger(__name__)
+
+SessionKey = Tuple[int, int]
+
+# Event loop'dagi har bir xabar xarajati budjeti: mark_dirty (set.add) + flush'dagi
+# payload qurish ulushi (bitta sessiyaga ketma-ket xabarlar – bitta yozuv). Backend
+# I/O thread'da, budjetga kirmaydi. tests/test_session_store.py tekshiradi.
+PER_MESSAGE_BUDGET_US = 20
+
+
+def session_to_payload(session: OrderSession) -> Dict[str, Any]:
+    return {
+        "user_id": session.user_id,
+        "chat_id": session.chat_id,
+        "phones": sorted(session.phones),
+        "location": session.location,
+        "comments": list(session.comments),
+        "product_texts": list(session.product_texts),
+        "raw_messages": list(session.raw_messages),
+        "amount": session.amount,
+        "created_at": monotonic_to_datetime(session.created_at).isoformat(),
+        "updated_at": monotonic_to_datetime(session.updated_at).isoformat(),
+        "is_completed": session.is_completed,
+        "llm_calls": session.llm_calls,
+        "has_digits": session.has_digits,
+        "has_money_kw": session.has_money_kw,
+    }
+
+
+def session_from_payload(payload: Dict[str, Any]) -> OrderSession:
+    session = OrderSession(
+        user_id=payload["user_id"],
+        chat_id=payload["chat_id"],
+        phones=set(payload.get("phones") or []),
+        location=payload.get("location"),
+        comments=list(payload.get("comments") or []),
+        product_texts=list(payload.get("product_texts") or []),
+        raw_messages=MessageRing(payload.get("raw_messages") or []),
+        amount=int(payload["amount"]) if payload.get("amount") is not None else None,
+        created_at=datetime_to_monotonic(datetime.fromisoformat(payload["created_at"])),
+        updated_at=datetime_to_monotonic(datetime.fromisoformat(payload["updated_at"])),
+        is_completed=bool(payload.get("is_completed")),
+        llm_calls=int(payload.get("llm_calls") or 0),
+    )
+    if "has_digits" in payload:
+        session.has_digits = bool(payload["has_digits"])
+        session.has_money_kw = bool(payload.get("has_money_kw"))
+    else:
+        # Eski payload: belgilarni xabarlardan bir marta tiklaymiz
+        messages = list(session.raw_messages)
+        session.raw_messages = MessageRing()
+        for text in messages:
+            add_session_text(session, text)
+    return session
+
+
+class SessionBackend:
+    """
+    Sessiyalarni saqlovchi backend interfeysi (sinxron, thread ichida chaqiriladi).
+    """
+
+    def load_keys(self, newer_than: datetime) -> Set[SessionKey]:
+        raise NotImplementedError
+
+    def load(self, key: SessionKey) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_many(self, rows: Dict[SessionKey, Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, keys: Iterable[SessionKey]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Lokal ishlash uchun: SQLite WAL rejimida.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS order_sessions (
+                chat_id     INTEGER NOT NULL,
+                session_key INTEGER NOT NULL,
+                payload     TEXT NOT NULL,
+                updated_at  TEXT NOT NULL,
+                PRIMARY KEY (chat_id, session_key)
+            );
+            """
+        )
+
+    def load_keys(self, newer_than: datetime) -> Set[SessionKey]:
+        self._conn.execute(
+            "DELETE FROM order_sessions WHERE updated_at < ?;",
+            (newer_than.isoformat(),),
+        )
+        rows = self._conn.execute("SELECT chat_id, session_key FROM order_sessions;").fetchall()
+        return {(r[0], r[1]) for r in rows}
+
+    def load(self, key: SessionKey) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT payload FROM order_sessions WHERE chat_id = ? AND session_key = ?;",
+            key,
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_many(self, rows: Dict[SessionKey, Dict[str, Any]]) -> None:
+        with self._conn:
+            self._conn.execute("BEGIN;")
+            self._conn.executemany(
+                """
+                INSERT INTO order_sessions (chat_id, session_key, payload, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (chat_id, session_key)
+                DO UPDATE SET payload = excluded.payload, updated_at = excluded.updated_at;
+                """,
+                [
+                    (k[0], k[1], json.dumps(p, ensure_ascii=False), p["updated_at"])
+                    for k, p in rows.items()
+                ],
+            )
+
+    def delete_many(self, keys: Iterable[SessionKey]) -> None:
+        with self._conn:
+            self._conn.execute("BEGIN;")
+            self._conn.executemany(
+                "DELETE FROM order_sessions WHERE chat_id = ? AND session_key = ?;",
+                list(keys),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class PostgresSessionBackend(SessionBackend):
+    """
+    Production uchun: ai_order_sessions jadvali (mavjud DB_DSN orqali).
+    Jadval bot/migrations/0003_order_sessions.sql da yaratiladi.
+    """
+
+    def __init__(self, settings: Settings):
+        from .db import db_cursor
+
+        self._settings = settings
+        self._db_cursor = db_cursor
+
+    def load_keys(self, newer_than: datetime) -> Set[SessionKey]:
+        with self._db_cursor(self._settings) as cur:
+            cur.execute("DELETE FROM ai_order_sessions WHERE updated_at < %s;", (newer_than,))
+            cur.execute("SELECT chat_id, session_key FROM ai_order_sessions;")
+            return {(r[0], r[1]) for r in cur.fetchall()}
+
+    def load(self, key: SessionKey) -> Optional[Dict[str, Any]]:
+        with self._db_cursor(self._settings) as cur:
+            cur.execute(
+                "SELECT payload FROM ai_order_sessions WHERE chat_id = %s AND session_key = %s;",
+                key,
+            )
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    def save_many(self, rows: Dict[SessionKey, Dict[str, Any]]) -> None:
+        with self._db_cursor(self._settings) as cur:
+            cur.executemany(
+                """
+                INSERT INTO ai_order_sessions (chat_id, session_key, payload, updated_at)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (chat_id, session_key)
+                DO UPDATE SET payload = EXCLUDED.payload, updated_at = EXCLUDED.updated_at;
+                """,
+                [(k[0], k[1], Json(p), p["updated_at"]) for k, p in rows.items()],
+            )
+
+    def delete_many(self, keys: Iterable[SessionKey]) -> None:
+        with self._db_cursor(self._settings) as cur:
+            cur.executemany(
+                "DELETE FROM ai_order_sessions WHERE chat_id = %s AND session_key = %s;",
+                list(keys),
+            )
+
+
+class SessionStore:
+    """
+    OrderSession'larni persistent backendga yozib boradi.
+
+    - mark_dirty(): hot-path, faqat set.add (I/O yo'q).
+    - run(): har flush_interval da dirty sessiyalarni BITTA batch bilan yozadi,
+      ya'ni bir nechta ketma-ket xabar = bitta yozuv.
+    - load(): restartdan keyin sessiya birinchi marta so'ralganda o'qiladi
+      (faqat persistent kalitlar ro'yxatida bo'lsa, aks holda I/O yo'q;
+      o'qish thread'da – event loop to'xtamaydi).
+    - adopt(): sharding ring o'zgardi – boshqa worker'dan o'tgan kalitlar
+      _persisted da yo'q, shuning uchun load() noma'lum kalitni ham backenddan so'raydi.
+    - forget(): sessiya boshqa worker'ga o'tdi – backenddagi qator o'chirilmaydi.
+    - start()/stop(): flush loop; stop() joriy flush tugashini kutadi (cancel emas),
+      shundan keyingina graceful_shutdown oxirgi flush va close() qiladi.
+    """
+
+    def __init__(
+            self,
+            backend: SessionBackend,
+            sessions: Dict[SessionKey, OrderSession],
+            flush_interval: float = 1.0,
+    ):
+        self._backend = backend
+        self._sessions = sessions
+        self._flush_interval = flush_interval
+        self._dirty: Set[SessionKey] = set()
+        self._deleted: Set[SessionKey] = set()
+        self._persisted: Set[SessionKey] = set()
+        self._probe_unknown = False
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def warm_up(self, max_age_seconds: int) -> None:
+        newer_than = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+        self._persisted = self._backend.load_keys(newer_than)
+        logger.info("SessionStore: %s ta persistent sessiya kaliti topildi.", len(self._persisted))
+
+    def mark_dirty(self, key: SessionKey) -> None:
+        self._dirty.add(key)
+        self._deleted.discard(key)
+
+    def mark_deleted(self, key: SessionKey) -> None:
+        self._dirty.discard(key)
+        if key in self._persisted:
+            self._deleted.add(key)
+
+    def adopt(self) -> None:
+        self._probe_unknown = True
+
+    def forget(self, keys: Iterable[SessionKey]) -> None:
+        for key in keys:
+            self._dirty.discard(key)
+            self._deleted.discard(key)
+            self._persisted.discard(key)
+
+    async def load(self, key: SessionKey) -> Optional[OrderSession]:
+        if key not in self._persisted and not self._probe_unknown:
+            return None
+        try:
+            payload = await asyncio.to_thread(self._backend.load, key)
+        except Exception as e:
+            logger.error("SessionStore: %s ni o'qishda xatolik: %s", key, e)
+            return None
+        if not payload:
+            self._persisted.discard(key)
+            return None
+        return session_from_payload(payload)
+
+    async def flush(self) -> None:
+        if not self._dirty and not self._deleted:
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        deleted, self._deleted = self._deleted, set()
+
+        rows: Dict[SessionKey, Dict[str, Any]] = {}
+        for key in dirty:
+            session = self._sessions.get(key)
+            if session is None or session.is_completed:
+                if key in self._persisted:
+                    deleted.add(key)
+                continue
+            rows[key] = session_to_payload(session)
+
+        started = time.perf_counter()
+        try:
+            if rows:
+                await asyncio.to_thread(self._backend.save_many, rows)
+                self._persisted.update(rows.keys())
+            if deleted:
+                await asyncio.to_thread(self._backend.delete_many, deleted)
+                self._persisted.difference_update(deleted)
+        except BaseException as e:
+            # Keyingi flush'da qayta urinamiz. CancelledError ham: kalitlar _dirty dan
+            # allaqachon olingan – qaytarilmasa yo'qoladi (upsert, qayta yozish zararsiz)
+            self._dirty.update(rows.keys())
+            self._deleted.update(deleted)
+            if not isinstance(e, Exception):
+                raise
+            logger.error("SessionStore flush xatolik: %s", e)
+            return
+
+        self.flushes += 1
+        self.rows_written += len(rows)
+        logger.debug(
+            "SessionStore flush: saved=%s deleted=%s took=%.1fms",
+            len(rows),
+            len(deleted),
+            (time.perf_counter() - started) * 1000,
+        )
+
+    def pending(self) -> int:
+        """
+        Hali yozilmagan (dirty + o'chirilishi kerak) kalitlar soni.
+        """
+        return len(self._dirty) + len(self._deleted)
+
+    async def run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stop.clear()
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Loop'ni to'xtatadi va (thread'dagi yozuv bilan) joriy flush tugashini kutadi.
+        """
+        self._stop.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def close(self) -> None:
+        self._backend.close()
+
+
+def create_session_store(
+        settings: Settings,
+        sessions: Dict[SessionKey, OrderSession],
+) -> Optional[SessionStore]:
+    """
+    SESSION_STORE qiymatiga qarab backend tanlaydi:
+      - "sqlite:<path>" -> SQLite WAL
+      - "postgres"      -> ai_order_sessions jadvali
+      - bo'sh           -> None (faqat xotirada)
+    """
+    spec = (settings.session_store or "").strip()
+    if not spec:
+        return None
+
+    if spec.startswith("sqlite:"):
+        backend: SessionBackend = SQLiteSessionBackend(spec[len("sqlite:"):] or "sessions.db")
+    elif spec == "postgres":
+        backend = PostgresSessionBackend(settings)
+    else:
+        raise RuntimeError(f"Noma'lum SESSION_STORE qiymati: {spec!r}")
+
+    store = SessionStore(backend, sessions, flush_interval=settings.session_flush_seconds)
+    store.warm_up(settings.max_diff_seconds)
+    return store
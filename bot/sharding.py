@@ -0,0 +1,343 @@
+# bot/sharding.py
+import asyncio
+import bisect
+import logging
+import multiprocessing as mp
+import signal
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import xxhash
+
+from .config import Settings
+from .timers import TIMERS
+
+logger = logging.getLogger(__name__)
+
+VNODES = 64
+CONTROL_KEY = "_control"
+STATS_EVERY_SECONDS = 60
+
+
+class HashRing:
+    """
+    chat_id -> worker_id consistent hashing (virtual node'lar bilan).
+    Worker qo'shilsa/chiqsa faqat ~1/N chatlar egasini almashtiradi.
+    """
+
+    def __init__(self, nodes: Iterable[int] = (), vnodes: int = VNODES):
+        self._vnodes = vnodes
+        self._hashes: List[int] = []
+        self._owners: List[int] = []
+        self._nodes: set[int] = set()
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return xxhash.xxh64_intdigest(value.encode())
+
+    @property
+    def nodes(self) -> List[int]:
+        return sorted(self._nodes)
+
+    def add(self, node: int) -> None:
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self._vnodes):
+            h = self._hash(f"worker-{node}#{i}")
+            idx = bisect.bisect(self._hashes, h)
+            self._hashes.insert(idx, h)
+            self._owners.insert(idx, node)
+
+    def remove(self, node: int) -> None:
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        keep = [(h, o) for h, o in zip(self._hashes, self._owners) if o != node]
+        self._hashes = [h for h, _ in keep]
+        self._owners = [o for _, o in keep]
+
+    def owner(self, chat_id: int) -> int:
+        if not self._hashes:
+            raise RuntimeError("HashRing bo'sh: birorta ham worker yo'q.")
+        h = self._hash(str(chat_id))
+        idx = bisect.bisect(self._hashes, h) % len(self._hashes)
+        return self._owners[idx]
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """
+    Raw Telegram update (dict, alias'lar bilan) dan chat_id ni topadi.
+    """
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post",
+                  "my_chat_member", "chat_member", "chat_join_request"):
+        obj = update.get(field)
+        if obj and obj.get("chat"):
+            return obj["chat"]["id"]
+
+    cq = update.get("callback_query")
+    if cq:
+        msg = cq.get("message")
+        if msg and msg.get("chat"):
+            return msg["chat"]["id"]
+        return (cq.get("from") or {}).get("id")
+
+    for field in ("inline_query", "chosen_inline_result", "shipping_query",
+                  "pre_checkout_query", "poll_answer"):
+        obj = update.get(field)
+        if obj:
+            return (obj.get("from") or obj.get("user") or {}).get("id")
+
+    return None
+
+
+# ======================================================================
+# WORKER
+# ======================================================================
+
+def _worker_entry(worker_id: int, inbox, settings: Settings) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s [%(levelname)s] w{worker_id} %(name)s: %(message)s",
+    )
+    # Ctrl+C butun process guruhiga keladi: worker ingress'dan None kelishini kutib,
+    # in-flight ishlarni tugatib chiqadi
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        asyncio.run(_worker_main(worker_id, inbox, settings))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _evict_foreign_sessions(
+        worker_id: int,
+        ring: HashRing,
+        in_flight: set[asyncio.Task],
+        timeout: float,
+) -> int:
+    """
+    Ring o'zgarganda endi boshqa worker'ga tegishli sessiyalarni xotiradan olib tashlaymiz:
+
+    1. Ishlanayotgan update'lar tugashini kutamiz (sessiya yarim holatda qolmasin).
+    2. Finalize timeri kutayotgan sessiyalar shu yerda darhol finalize qilinadi –
+       timer yangi egasiga o'tmaydi, tashlab yuborilsa zakaz yo'qoladi.
+    3. Qolganlari store'ga flush qilinadi; yangi egasi ularni load() orqali tiklaydi.
+    """
+    from .storage import SESSIONS, get_segmenter, get_session_store
+
+    if in_flight:
+        await asyncio.wait(set(in_flight), timeout=timeout)
+
+    foreign = [key for key in SESSIONS if ring.owner(key[0]) != worker_id]
+    fired = sum(1 for key in foreign if TIMERS.fire_now(("finalize", key)))
+    if fired:
+        done, abandoned = await TIMERS.wait_running(timeout)
+        logger.info("Worker %s: handoff oldidan finalize: fired=%s done=%s abandoned=%s",
+                    worker_id, fired, done, abandoned)
+
+    store = get_session_store()
+    if store is not None:
+        await store.flush()
+        store.forget(foreign)
+        store.adopt()
+
+    for key in foreign:
+        SESSIONS.pop(key, None)
+
+    segmenter = get_segmenter()
+    if segmenter is not None:
+        for chat_id in segmenter.chats():
+            if ring.owner(chat_id) != worker_id:
+                segmenter.forget_chat(chat_id)
+    return len(foreign)
+
+
+async def _worker_main(worker_id: int, inbox, settings: Settings) -> None:
+    from .app import build_dispatcher, create_bot
+    from .db_pool import close_pool
+    from .session_store import create_session_store
+    from .shutdown import graceful_shutdown
+    from .storage import SESSIONS, set_session_store
+
+    store = create_session_store(settings, SESSIONS)
+    set_session_store(store)
+
+    bot = create_bot(settings)
+    dp = build_dispatcher(settings)
+    await dp.emit_startup(bot=bot)
+
+    if store is not None:
+        store.start()
+    in_flight: set[asyncio.Task] = set()
+    handled = 0
+
+    logger.info("Worker %s ishga tushdi.", worker_id)
+    try:
+        while True:
+            item = await asyncio.to_thread(inbox.get)
+            if item is None:
+                break
+
+            if CONTROL_KEY in item:
+                ring = HashRing(item["workers"])
+                evicted = await _evict_foreign_sessions(
+                    worker_id, ring, in_flight, settings.shutdown_timeout_seconds
+                )
+                logger.info("Worker %s: ring=%s, evicted_sessions=%s", worker_id, ring.nodes, evicted)
+                continue
+
+            task = asyncio.create_task(dp.feed_raw_update(bot, item))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            handled += 1
+    finally:
+        if in_flight:
+            await asyncio.wait(in_flight, timeout=settings.shutdown_timeout_seconds)
+        if store is not None:
+            await store.stop()
+        await graceful_shutdown(settings.shutdown_timeout_seconds, store)
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        close_pool()
+        logger.info("Worker %s to'xtadi. handled=%s", worker_id, handled)
+
+
+# ======================================================================
+# INGRESS
+# ======================================================================
+
+class ShardIngress:
+    """
+    Bitta process Telegram'dan update oladi va chat_id bo'yicha
+    N ta worker process'ga taqsimlaydi. Har bir guruhning sessiyasi
+    (get_session_key) faqat bitta worker xotirasida yashaydi.
+
+    SIGUSR1 -> worker qo'shish, SIGUSR2 -> oxirgi worker'ni chiqarish.
+    """
+
+    def __init__(self, settings: Settings):
+        self._settings = settings
+        self._ctx = mp.get_context("spawn")
+        self._ring = HashRing()
+        self._workers: Dict[int, Tuple[Any, Any]] = {}
+        self._routed: Dict[int, int] = {}
+        self._stopping = False
+
+    def _spawn(self, worker_id: int) -> None:
+        inbox = self._ctx.Queue()
+        proc = self._ctx.Process(
+            target=_worker_entry,
+            args=(worker_id, inbox, self._settings),
+            name=f"bot-worker-{worker_id}",
+        )
+        proc.start()
+        self._workers[worker_id] = (proc, inbox)
+        self._routed.setdefault(worker_id, 0)
+
+    def _broadcast_ring(self) -> None:
+        for _, inbox in self._workers.values():
+            inbox.put({CONTROL_KEY: "ring", "workers": self._ring.nodes})
+
+    def add_worker(self) -> int:
+        worker_id = max(self._workers, default=-1) + 1
+        self._spawn(worker_id)
+        self._ring.add(worker_id)
+        self._broadcast_ring()
+        logger.info("Worker qo'shildi: %s, ring=%s", worker_id, self._ring.nodes)
+        return worker_id
+
+    def remove_worker(self, worker_id: Optional[int] = None) -> None:
+        if len(self._workers) <= 1:
+            logger.warning("Oxirgi worker'ni chiqarib bo'lmaydi.")
+            return
+        worker_id = max(self._workers) if worker_id is None else worker_id
+        proc, inbox = self._workers.pop(worker_id)
+        self._ring.remove(worker_id)
+        self._broadcast_ring()
+        # Worker navbatidagi update'larni tugatib, sessiyalarni flush qilib chiqadi
+        inbox.put(None)
+        asyncio.get_running_loop().run_in_executor(None, proc.join, 30)
+        logger.info("Worker chiqarildi: %s, ring=%s", worker_id, self._ring.nodes)
+
+    def _respawn_dead(self) -> None:
+        for worker_id, (proc, _) in list(self._workers.items()):
+            if not proc.is_alive():
+                logger.error("Worker %s to'xtab qolgan (exitcode=%s), qayta ishga tushiramiz.",
+                             worker_id, proc.exitcode)
+                self._spawn(worker_id)
+                self._workers[worker_id][1].put({CONTROL_KEY: "ring", "workers": self._ring.nodes})
+
+    def _log_stats(self, started: float) -> None:
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        total = sum(self._routed.values())
+        logger.info(
+            "Ingress: routed=%s (%.1f upd/s), per_worker=%s",
+            total,
+            total / elapsed,
+            self._routed,
+        )
+
+    def stop(self) -> None:
+        self._stopping = True
+
+    async def run(self) -> None:
+        from .app import create_bot
+
+        for _ in range(max(self._settings.workers, 1)):
+            self.add_worker()
+
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self.stop)
+        loop.add_signal_handler(signal.SIGINT, self.stop)
+        loop.add_signal_handler(signal.SIGUSR1, self.add_worker)
+        loop.add_signal_handler(signal.SIGUSR2, self.remove_worker)
+
+        bot = create_bot(self._settings)
+        offset: Optional[int] = None
+        started = time.perf_counter()
+        last_stats = started
+        backoff = 1.0
+
+        try:
+            while not self._stopping:
+                self._respawn_dead()
+                try:
+                    updates = await bot.get_updates(offset=offset, timeout=10)
+                    backoff = 1.0
+                except Exception as e:
+                    logger.error("get_updates xatolik: %s (retry %.0fs)", e, backoff)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+                    continue
+
+                for update in updates:
+                    offset = update.update_id + 1
+                    data = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+                    chat_id = update_chat_id(data)
+                    worker_id = self._ring.owner(chat_id if chat_id is not None else update.update_id)
+                    self._workers[worker_id][1].put(data)
+                    self._routed[worker_id] = self._routed.get(worker_id, 0) + 1
+
+                now = time.perf_counter()
+                if now - last_stats >= STATS_EVERY_SECONDS:
+                    self._log_stats(started)
+                    last_stats = now
+        finally:
+            self._log_stats(started)
+            if offset is not None:
+                # Oxirgi yo'naltirilgan update'larni Telegram'da tasdiqlab qo'yamiz
+                try:
+                    await bot.get_updates(offset=offset, limit=1, timeout=0)
+                except Exception as e:
+                    logger.warning("Offsetni tasdiqlab bo'lmadi: %s", e)
+            for proc, inbox in self._workers.values():
+                inbox.put(None)
+            for proc, _ in self._workers.values():
+                proc.join(timeout=self._settings.shutdown_timeout_seconds + 10)
+            await bot.session.close()
+
+
+async def run_sharded(settings: Settings) -> None:
+    await ShardIngress(settings).run()
@@ -0,0 +1,128 @@
+# bot/shutdown.py
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from .mailbox import MAILBOXES
+from .timers import TIMERS
+
+logger = logging.getLogger(__name__)
+
+# Buferlangan writerlar (log writer va h.k.) shu ro'yxatga flush funksiyasini qo'shadi
+Flusher = Callable[[], Awaitable[None]]
+_FLUSHERS: List[Tuple[str, Flusher]] = []
+
+
+def register_flusher(name: str, flush: Flusher) -> None:
+    _FLUSHERS.append((name, flush))
+
+
+@dataclass
+class ShutdownReport:
+    mailboxes_drained: int = 0
+    mailboxes_abandoned: int = 0
+    timers_fired: int = 0
+    timers_abandoned: int = 0
+    callbacks_done: int = 0
+    callbacks_abandoned: int = 0
+    sessions_persisted: int = 0
+    sessions_lost: int = 0
+    flushed: List[str] = field(default_factory=list)
+    flush_errors: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def clean(self) -> bool:
+        return not (
+            self.mailboxes_abandoned
+            or self.callbacks_abandoned
+            or self.timers_abandoned
+            or self.sessions_lost
+            or self.flush_errors
+        )
+
+
+def _remaining(deadline: float) -> float:
+    return max(0.0, deadline - time.monotonic())
+
+
+async def graceful_shutdown(timeout: float, store=None) -> ShutdownReport:
+    """
+    Intake to'xtagandan keyin (polling tugadi / worker inbox yopildi) chaqiriladi:
+
+    1. Ishlayotgan handlerlar (LLM/STT chaqiruvlari) mailboxlari bo'shashini kutadi.
+    2. Kutilayotgan finalize timerlarini darhol ishga tushiradi va ularning
+       DB yozuvlari, dataset va Telegram yuborishlari tugashini kutadi.
+    3. Buferlangan writerlarni flush qiladi.
+    4. Qolgan sessiyalarni store'ga yozadi.
+
+    Hammasi bitta `timeout` ichida; nima tugadi, nima tashlab ketildi – hisobot.
+    """
+    from .storage import SESSIONS
+
+    started = time.monotonic()
+    deadline = started + timeout
+    report = ShutdownReport()
+
+    # Osilib qolgan bitta handler finalize'larni to'sib qo'ymasin: muddatning yarmi
+    busy = len(MAILBOXES)
+    if await MAILBOXES.wait_idle(timeout / 2):
+        report.mailboxes_drained = busy
+    else:
+        report.mailboxes_abandoned = len(MAILBOXES)
+        report.mailboxes_drained = max(0, busy - report.mailboxes_abandoned)
+        logger.warning("Shutdown: tugamagan mailboxlar: %s", list(MAILBOXES.pending()))
+
+    # finalize_and_send o'zi yangi timer (cancel keyboard) qo'yadi – ular ham shu siklda
+    while _remaining(deadline) > 0:
+        fired = TIMERS.fire_all_now()
+        report.timers_fired += fired
+        done, not_done = await TIMERS.wait_running(_remaining(deadline))
+        report.callbacks_done += done
+        if not_done:
+            report.callbacks_abandoned = not_done
+            break
+        if not len(TIMERS):
+            break
+    report.timers_abandoned = len(TIMERS)
+
+    for name, flush in _FLUSHERS:
+        try:
+            await asyncio.wait_for(flush(), max(_remaining(deadline), 1.0))
+            report.flushed.append(name)
+        except Exception as e:
+            logger.error("Shutdown: %s flush xatolik: %r", name, e)
+            report.flush_errors.append(name)
+
+    live = sum(1 for s in SESSIONS.values() if not s.is_completed)
+    if store is not None:
+        await store.flush()
+        if store.pending():
+            # flush xatoni o'zi loglaydi va kalitlarni qayta navbatga qo'yadi
+            report.sessions_lost = live
+        else:
+            report.sessions_persisted = live
+        store.close()
+    else:
+        report.sessions_lost = live
+
+    report.elapsed = time.monotonic() - started
+    log = logger.info if report.clean else logger.warning
+    log(
+        "Shutdown: mailboxes=%s/%s timers_fired=%s timers_abandoned=%s callbacks=%s/%s "
+        "sessions_persisted=%s sessions_lost=%s flushed=%s flush_errors=%s took=%.1fs",
+        report.mailboxes_drained,
+        report.mailboxes_drained + report.mailboxes_abandoned,
+        report.timers_fired,
+        report.timers_abandoned,
+        report.callbacks_done,
+        report.callbacks_done + report.callbacks_abandoned,
+        report.sessions_persisted,
+        report.sessions_lost,
+        report.flushed,
+        report.flush_errors,
+        report.elapsed,
+    )
+    return report
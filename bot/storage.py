@@ -1,32 +1,100 @@
 # bot/storage.py
 import json
 import os
+import time
 from datetime import datetime, timezone
 from typing import Dict, Tuple, Optional
 
 from aiogram.types import Message
 
 from .config import Settings
+from .mailbox import MAILBOXES
 from .models import OrderSession
+from .segmentation import ConversationSegmenter
+from .session_store import SessionStore
+from .timers import TIMERS
 
 SESSIONS: Dict[Tuple[int, int], OrderSession] = {}
 
+# Persistent backend (ixtiyoriy). main.py da set_session_store() orqali ulanadi.
+_STORE: Optional[SessionStore] = None
+
+# GROUP_SEGMENTATION yoqilgan bo'lsa: kalit (chat_id, user_id) emas, zakaz segmenti
+_SEGMENTER: Optional[ConversationSegmenter] = None
+
 LOG_FILE = "ai_bot.json"
 
+# Muddati o'tgan sessiyalar shu oraliqda bir marta tozalanadi (get_or_create_session ichida)
+SESSION_SWEEP_SECONDS = 60.0
+_last_sweep = 0.0
+
+
+def set_segmenter(segmenter: Optional[ConversationSegmenter]) -> None:
+    global _SEGMENTER
+    _SEGMENTER = segmenter
+
+
+def get_segmenter() -> Optional[ConversationSegmenter]:
+    return _SEGMENTER
+
 
 def get_session_key(message: Message) -> Tuple[int, int]:
+    if _SEGMENTER is not None:
+        return _SEGMENTER.assign(message)
     return message.chat.id, message.from_user.id  # type: ignore[union-attr]
 
 
-def get_or_create_session(settings: Settings, message: Message) -> OrderSession:
-    from datetime import datetime, timezone
+def set_session_store(store: Optional[SessionStore]) -> None:
+    global _STORE
+    _STORE = store
+
+
+def get_session_store() -> Optional[SessionStore]:
+    return _STORE
 
+
+def mark_session_dirty(key: Tuple[int, int]) -> None:
+    if _STORE is not None:
+        _STORE.mark_dirty(key)
+
+
+def expire_sessions(max_age_seconds: float) -> int:
+    """
+    max_age_seconds dan beri yangilanmagan sessiyalarni SESSIONS, store va segment
+    indekslaridan olib tashlaydi. Finalize kutayotgan yoki hozir ishlanayotganlari qoladi.
+    """
+    now = time.monotonic()
+    busy = MAILBOXES.pending()
+    expired = [
+        key for key, session in SESSIONS.items()
+        if now - session.updated_at > max_age_seconds
+        and key not in busy
+        and not TIMERS.is_pending(("finalize", key))
+    ]
+    for key in expired:
+        clear_session(key)
+    return len(expired)
+
+
+async def get_or_create_session(settings: Settings, message: Message) -> OrderSession:
+    global _last_sweep
     key = get_session_key(message)
-    now = datetime.now(timezone.utc)
+    now = time.monotonic()
+    if now - _last_sweep > SESSION_SWEEP_SECONDS:
+        _last_sweep = now
+        expire_sessions(settings.max_diff_seconds)
     session = SESSIONS.get(key)
 
+    # Restartdan keyin: sessiya birinchi so'ralganda backenddan tiklanadi
+    if session is None and _STORE is not None:
+        loaded = await _STORE.load(key)
+        # await paytida boshqa handler shu kalitga sessiya yaratgan bo'lishi mumkin
+        session = SESSIONS.get(key)
+        if session is None and loaded is not None:
+            session = SESSIONS[key] = loaded
+
     if session:
-        if (now - session.updated_at).total_seconds() > settings.max_diff_seconds:
+        if now - session.updated_at > settings.max_diff_seconds:
             SESSIONS[key] = OrderSession(
                 user_id=message.from_user.id,  # type: ignore[union-attr]
                 chat_id=message.chat.id,
@@ -37,6 +105,7 @@ def get_or_create_session(settings: Settings, message: Message) -> OrderSession:
             chat_id=message.chat.id,
         )
 
+    mark_session_dirty(key)
     return SESSIONS[key]
 
 
@@ -44,6 +113,13 @@ def is_session_ready(session: OrderSession) -> bool:
     return bool(session.phones and session.location)
 
 
+def has_amount_candidate(session: OrderSession) -> bool:
+    """
+    Sessiyada summa bo'lishi mumkinmi – faqat inkremental belgilardan o'qiladi.
+    """
+    return session.has_digits or session.has_money_kw or session.amount not in (None, 0)
+
+
 def finalize_session(key: Tuple[int, int]) -> Optional[OrderSession]:
     session = SESSIONS.get(key)
     if not session:
@@ -51,12 +127,24 @@ def finalize_session(key: Tuple[int, int]) -> Optional[OrderSession]:
     if session.is_completed:
         return None
     session.is_completed = True
+    if _STORE is not None:
+        _STORE.mark_deleted(key)
+    if _SEGMENTER is not None:
+        # Segment kaliti qayta ishlatilmaydi – tugallangan sessiya xotirada qolmaydi.
+        # (chat, user) rejimida esa u max_diff_seconds davomida "tugallangan" belgisi
+        # bo'lib qoladi va expire_sessions() bilan tozalanadi.
+        _SEGMENTER.close(key)
+        SESSIONS.pop(key, None)
     return session
 
 
 def clear_session(key: Tuple[int, int]) -> None:
     if key in SESSIONS:
         del SESSIONS[key]
+    if _STORE is not None:
+        _STORE.mark_deleted(key)
+    if _SEGMENTER is not None:
+        _SEGMENTER.close(key)
 
 
 def save_order_to_json(order: OrderSession) -> None:
@@ -66,9 +154,9 @@ def save_order_to_json(order: OrderSession) -> None:
         "user_id": order.user_id,
         "phones": list(order.phones),
         "location": order.location,
-        "comments": order.comments,
-        "product_texts": order.product_texts,
-        "raw_messages": order.raw_messages,
+        "comments": list(order.comments),
+        "product_texts": list(order.product_texts),
+        "raw_messages": list(order.raw_messages),
     }
 
     data = []
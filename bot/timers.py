@@ -0,0 +1,165 @@
+# bot/timers.py
+import asyncio
+import logging
+import math
+from typing import Any, Callable, Coroutine, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TimerCallback = Callable[..., Coroutine[Any, Any, Any]]
+
+
+class _Timer:
+    __slots__ = ("key", "deadline", "rounds", "slot", "callback", "args")
+
+    def __init__(self, key, deadline, rounds, slot, callback, args):
+        self.key = key
+        self.deadline = deadline
+        self.rounds = rounds
+        self.slot = slot
+        self.callback = callback
+        self.args = args
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel: minglab sleep qilayotgan coroutine o'rniga
+    BITTA asyncio task va `slots` ta bucket.
+
+    - schedule(key, delay, cb, *args): yangi timer yoki mavjudini qayta boshlash (debounce)
+    - touch(key, delay): faqat mavjud timer bo'lsa muddatini uzaytiradi
+    - cancel(key): timerni bekor qiladi
+    - pending(): kutilayotgan timerlar ro'yxati (introspection)
+
+    Timer yozuvida faqat callback va uning argumentlari (id'lar) saqlanadi.
+    """
+
+    def __init__(self, tick: float = 0.25, slots: int = 512):
+        self._tick = tick
+        self._slots: List[Dict[Hashable, _Timer]] = [{} for _ in range(slots)]
+        self._timers: Dict[Hashable, _Timer] = {}
+        self._cursor = 0
+        self._runner: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+        self.fired = 0
+
+    # ------------------------------------------------------------------
+    def _ensure_running(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _insert(self, timer: _Timer, delay: float) -> None:
+        ticks = max(1, math.ceil(delay / self._tick))
+        size = len(self._slots)
+        timer.slot = (self._cursor + ticks) % size
+        timer.rounds = (ticks - 1) // size
+        self._slots[timer.slot][timer.key] = timer
+        self._timers[timer.key] = timer
+
+    def _remove(self, key: Hashable) -> Optional[_Timer]:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            self._slots[timer.slot].pop(key, None)
+        return timer
+
+    # ------------------------------------------------------------------
+    def schedule(self, key: Hashable, delay: float, callback: TimerCallback, *args: Any) -> None:
+        self._remove(key)
+        timer = _Timer(key, self._now() + delay, 0, 0, callback, args)
+        self._insert(timer, delay)
+        self._ensure_running()
+
+    def touch(self, key: Hashable, delay: float) -> bool:
+        timer = self._remove(key)
+        if timer is None:
+            return False
+        timer.deadline = self._now() + delay
+        self._insert(timer, delay)
+        return True
+
+    def cancel(self, key: Hashable) -> bool:
+        return self._remove(key) is not None
+
+    def is_pending(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def pending(self) -> List[Tuple[Hashable, float, str]]:
+        """
+        [(key, qolgan_soniya, callback_nomi), ...] – eng yaqini birinchi.
+        """
+        now = self._now()
+        items = [
+            (t.key, max(0.0, t.deadline - now), getattr(t.callback, "__name__", "?"))
+            for t in self._timers.values()
+        ]
+        return sorted(items, key=lambda x: x[1])
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    # ------------------------------------------------------------------
+    def _fire(self, timer: _Timer) -> None:
+        self.fired += 1
+        task = asyncio.get_running_loop().create_task(timer.callback(*timer.args))
+        self._running.add(task)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Timer callback xatolik: %r", task.exception(), exc_info=task.exception())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self._timers:
+            next_tick += self._tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            bucket = self._slots[self._cursor]
+            if not bucket:
+                continue
+
+            for key, timer in list(bucket.items()):
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                    continue
+                del bucket[key]
+                del self._timers[key]
+                self._fire(timer)
+
+    def fire_now(self, key: Hashable) -> bool:
+        """
+        Bitta timerni muddatini kutmasdan ishga tushiradi (sharding: sessiya boshqa worker'ga o'tmoqda).
+        """
+        timer = self._remove(key)
+        if timer is None:
+            return False
+        self._fire(timer)
+        return True
+
+    def fire_all_now(self) -> int:
+        """
+        Shutdown uchun: barcha kutilayotgan timerlarni darhol ishga tushiradi.
+        """
+        timers = list(self._timers.values())
+        for timer in timers:
+            self._remove(timer.key)
+            self._fire(timer)
+        return len(timers)
+
+    async def wait_running(self, timeout: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Ishlayotgan callback'lar tugashini kutadi. (tugaganlar, tugamaganlar) qaytaradi.
+        """
+        if not self._running:
+            return 0, 0
+        done, not_done = await asyncio.wait(set(self._running), timeout=timeout)
+        return len(done), len(not_done)
+
+
+TIMERS = TimerWheel()
@@ -22,7 +22,13 @@ def extract_location_from_message(message: Message) -> Optional[Dict[str, Any]]:
         }
 
     # 2) Matndan link qidiramiz
-    text = message.text or message.caption or ""
+    return extract_location_from_text(message.text or message.caption or "")
+
+
+def extract_location_from_text(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Matndagi Google/Yandex/2GIS link (bulk xabar bloklari uchun ham).
+    """
     links = LINK_REGEX.findall(text)
     for link in links:
         lower = link.lower()
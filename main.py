@@ -2,18 +2,15 @@
 import asyncio
 import logging
 
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
-
+from bot.app import build_dispatcher, create_bot
 from bot.config import load_settings
 from bot.db import init_db
-from bot.prompt.admin_prompt import register_admin_prompt_handlers
-from bot.handlers.orders import register_order_handlers
-from bot.handlers.status_checker import router as status_router
-from bot.handlers.voice_stt import register_voice_handlers
-from bot.order_dataset_db import init_order_dataset_table
+from bot.db_pool import close_pool
 from bot.prompt_seed import seed_prompt_if_needed
+from bot.session_store import create_session_store
+from bot.sharding import run_sharded
+from bot.shutdown import graceful_shutdown
+from bot.storage import SESSIONS, set_session_store
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,22 +22,34 @@ async def main():
     settings = load_settings()
 
     if settings.db_dsn:
-        init_db(settings)
-        init_order_dataset_table(settings)
-
-    bot = Bot(
-        token=settings.tg_bot_token,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
-    )
-
-    dp = Dispatcher()
-    dp.include_router(status_router)
-    register_voice_handlers(dp, settings)
-    register_order_handlers(dp, settings)
-    register_admin_prompt_handlers(dp, settings)
+        init_db(settings)  # migratsiyalar (oxirgi versiyada bo'lsa – bitta SELECT)
+
+    if settings.workers > 1:
+        # Ingress + N ta worker process (chat_id bo'yicha consistent hashing)
+        seed_prompt_if_needed(settings)
+        close_pool()  # ingress DB ishlatmaydi, worker'lar o'z poolini ochadi
+        await run_sharded(settings)
+        return
+
+    session_store = create_session_store(settings, SESSIONS)
+    set_session_store(session_store)
+
+    bot = create_bot(settings)
+    dp = build_dispatcher(settings)
     seed_prompt_if_needed(settings)
 
-    await dp.start_polling(bot)
+    if session_store is not None:
+        session_store.start()
+    try:
+        # SIGTERM/SIGINT da polling to'xtaydi (yangi update olinmaydi),
+        # bot session esa finalize yuborishlari uchun ochiq qoladi
+        await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        if session_store is not None:
+            await session_store.stop()
+        await graceful_shutdown(settings.shutdown_timeout_seconds, session_store)
+        await bot.session.close()
+        close_pool()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,33 @@
+# tests/test_db_pool.py
+import threading
+import time
+
+import pytest
+
+from bot.db_pool import DBPool
+
+pytestmark = pytest.mark.db
+
+
+def test_concurrent_checkouts_do_not_exceed_max_size(settings):
+    pool = DBPool(settings.db_dsn, min_size=0, max_size=3, timeout=10)
+    peak = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal peak
+        with pool.connection():
+            with lock:
+                peak = max(peak, pool._size)
+            time.sleep(0.02)
+
+    # run_db: default executor'da 32 tagacha thread
+    threads = [threading.Thread(target=work) for _ in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+
+    assert peak <= 3
+    assert pool.created <= 3
@@ -0,0 +1,33 @@
+# tests/test_duplicates.py
+import time
+
+from bot.duplicates import DuplicateIndex, duplicate_keys
+
+PHONES = ["+998901234567"]
+AMOUNT = 45000
+LOCATION = {"type": "text", "raw": "Chilonzor 9"}
+WINDOW = 1800
+
+
+def test_find_ignores_out_of_order_rows_outside_window():
+    index = DuplicateIndex(WINDOW)
+    now = time.time()
+    # Navbat boshida yangi qator: eski (oynadan tashqari) qator _expire'da o'chmaydi
+    index.add(1, -100, ["+998900000000"], AMOUNT, LOCATION, created_at=now)
+    index.add(2, -100, PHONES, AMOUNT, LOCATION, created_at=now - WINDOW - 60)
+
+    assert index.find(duplicate_keys(PHONES, AMOUNT, LOCATION)) is None
+
+
+def test_readding_known_order_does_not_grow_expiry():
+    index = DuplicateIndex(WINDOW)
+    now = time.time()
+    index.add(1, -100, PHONES, AMOUNT, LOCATION, created_at=now)
+    size = len(index._expiry)
+    for _ in range(3):
+        index.add(1, -100, PHONES, AMOUNT, LOCATION, created_at=now)
+    assert len(index._expiry) == size
+
+    # DB dan kelgan bekor qilish belgisi saqlanadi
+    index.add(1, -100, PHONES, AMOUNT, LOCATION, created_at=now, active=False)
+    assert index.find(duplicate_keys(PHONES, AMOUNT, LOCATION)).active is False
@@ -0,0 +1,76 @@
+# tests/test_log_archive.py
+"""
+Default partitsiyadagi muddati o'tgan qatorlar arxivga ko'chishi (bot/log_archive.py).
+"""
+from datetime import datetime, timezone
+
+import psycopg2
+import pytest
+
+from bot.log_archive import archive_default_partition, query_archive
+from bot.partitions import ensure_log_partitions
+
+pytestmark = pytest.mark.db
+
+TABLE = "ai_error_logs"
+GROUP_ID = -990045
+# Hech qaysi oylik partitsiya qamramaydigan sana – qator <table>_default ga tushadi
+DAY = datetime(2099, 3, 7, tzinfo=timezone.utc)
+CUTOFF = datetime(2099, 4, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def default_rows(settings):
+    ensure_log_partitions(settings)
+    conn = psycopg2.connect(settings.db_dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO {TABLE} (user_message_id, user_id, group_id, group_title, created_at)
+                SELECT g, 1, %s, 'test', %s + make_interval(secs => g::DOUBLE PRECISION)
+                FROM generate_series(1, 3) AS g;
+                """,
+                (GROUP_ID, DAY),
+            )
+        yield conn
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DELETE FROM {TABLE} WHERE group_id = %s;", (GROUP_ID,))
+            # Statement trigger'lari yozgan kunlik statistika ham qolib ketmasin
+            cur.execute("DELETE FROM ai_group_daily_stats WHERE group_id = %s;", (GROUP_ID,))
+        conn.close()
+
+
+def _default_count(cur) -> int:
+    cur.execute(f"SELECT count(*) FROM {TABLE}_default WHERE group_id = %s;", (GROUP_ID,))
+    return cur.fetchone()[0]
+
+
+def test_default_partition_rows_are_archived(default_rows, tmp_path):
+    with default_rows.cursor() as cur:
+        assert _default_count(cur) == 3
+        totals = archive_default_partition(default_rows, cur, str(tmp_path), TABLE, CUTOFF)
+        assert totals["rows"] == 3
+        assert _default_count(cur) == 0
+
+    rows = list(query_archive(str(tmp_path), TABLE, DAY, CUTOFF, group_id=GROUP_ID))
+    assert [row["user_message_id"] for row in rows] == [1, 2, 3]
+
+
+def test_default_partition_merges_into_existing_segment(default_rows, tmp_path):
+    with default_rows.cursor() as cur:
+        archive_default_partition(default_rows, cur, str(tmp_path), TABLE, CUTOFF)
+        cur.execute(
+            f"""
+            INSERT INTO {TABLE} (user_message_id, user_id, group_id, group_title, created_at)
+            VALUES (4, 1, %s, 'test', %s);
+            """,
+            (GROUP_ID, DAY),
+        )
+        totals = archive_default_partition(default_rows, cur, str(tmp_path), TABLE, CUTOFF)
+        assert totals["rows"] == 1
+
+    rows = list(query_archive(str(tmp_path), TABLE, DAY, CUTOFF, group_id=GROUP_ID))
+    assert [row["user_message_id"] for row in rows] == [4, 1, 2, 3]
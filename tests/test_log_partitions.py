@@ -0,0 +1,108 @@
+# tests/test_log_partitions.py
+"""
+Log jadvallari partitsiyalari (bot/migrations/0005_log_partitions.sql, bot/partitions.py):
+issiq so'rovlar faqat kerakli oylik partitsiyani o'qishi EXPLAIN bilan tekshiriladi.
+
+Ma'lumot hajmi: TEST_EXPLAIN_ROWS (default 50 000; masalan 10 000 000 bilan ham ishlaydi).
+
+Legacy partitsiya migratsiya vaqtidan ~1 kun keyingacha, chegara oyining partitsiyasi
+qisqa – shuning uchun "issiq" oy sifatida 2 oy keyingi (har doim to'liq) partitsiya olinadi.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import pytest
+
+from bot.partitions import PARTITIONED_TABLES, ensure_log_partitions, month_start, partition_name
+
+pytestmark = pytest.mark.db
+
+EXPLAIN_ROWS = int(os.getenv("TEST_EXPLAIN_ROWS", "50000"))
+GROUPS = 50
+HOT_MONTH = month_start(datetime.now(timezone.utc), 2)
+
+
+def _walk(node: Dict[str, Any]):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _walk(child)
+
+
+def explain(cur, sql: str, params=None) -> List[Dict[str, Any]]:
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    return list(_walk(cur.fetchone()[0][0]["Plan"]))
+
+
+def scanned_relations(nodes: List[Dict[str, Any]]) -> set:
+    return {node["Relation Name"] for node in nodes if "Relation Name" in node}
+
+
+@pytest.fixture
+def log_rows(settings, db_conn):
+    """
+    Har bir log jadvaliga EXPLAIN_ROWS qator, GROUPS ta guruh: yarmi so'nggi ~60 kun
+    (legacy partitsiya), yarmi HOT_MONTH ichida. Rollback bilan o'chadi.
+    """
+    ensure_log_partitions(settings)
+    with db_conn.cursor() as cur:
+        for table in PARTITIONED_TABLES:
+            cur.execute(
+                f"""
+                INSERT INTO {table} (user_message_id, user_id, group_id, group_title, created_at)
+                SELECT g, g %% 1000, -(g %% %(groups)s) - 1, 'test',
+                       CASE WHEN g %% 2 = 0
+                           THEN now() - make_interval(secs => (g %% (86400 * 60))::DOUBLE PRECISION)
+                           ELSE %(hot)s + make_interval(secs => (g %% (86400 * 28))::DOUBLE PRECISION)
+                       END
+                FROM generate_series(1, %(rows)s) AS g;
+                """,
+                {"rows": EXPLAIN_ROWS, "groups": GROUPS, "hot": HOT_MONTH},
+            )
+            cur.execute(f"ANALYZE {table};")
+    return db_conn
+
+
+@pytest.mark.parametrize("table", PARTITIONED_TABLES)
+def test_month_window_scans_one_partition(log_rows, table):
+    lo = HOT_MONTH
+    hi = month_start(lo, 1)
+    with log_rows.cursor() as cur:
+        nodes = explain(
+            cur,
+            f"SELECT count(*) FROM {table} WHERE created_at >= %s AND created_at < %s",
+            (lo, hi),
+        )
+    assert scanned_relations(nodes) == {partition_name(table, lo)}
+
+
+@pytest.mark.parametrize("table", PARTITIONED_TABLES)
+def test_recent_window_skips_legacy_partition(log_rows, table):
+    # now() – planda emas, executor startup'da pruning ("Subplans Removed").
+    # Oyna legacy chegarasidan (migratsiya + ~1 kun) keyin boshlanadi
+    with log_rows.cursor() as cur:
+        nodes = explain(cur, f"SELECT * FROM {table} WHERE created_at >= now() + interval '40 days'")
+    assert f"{table}_legacy" not in scanned_relations(nodes)
+    assert sum(node.get("Subplans Removed", 0) for node in nodes) >= 1
+
+
+@pytest.mark.parametrize("table", PARTITIONED_TABLES)
+def test_group_recent_rows_use_group_index(log_rows, table):
+    lo = HOT_MONTH
+    with log_rows.cursor() as cur:
+        nodes = explain(
+            cur,
+            f"""
+            SELECT * FROM {table}
+            WHERE group_id = %s AND created_at >= %s
+            ORDER BY created_at DESC
+            LIMIT 50
+            """,
+            (-7, lo),
+        )
+    current = partition_name(table, lo)
+    current_scans = [node for node in nodes if node.get("Relation Name") == current]
+    assert current_scans, nodes
+    assert all(node["Node Type"] != "Seq Scan" for node in current_scans)
+    assert any("group_id_created_at_idx" in node.get("Index Name", "") for node in current_scans)
+    assert f"{table}_legacy" not in scanned_relations(nodes)
@@ -0,0 +1,138 @@
+# tests/test_order_outbox.py
+"""
+Zakaz outbox'i (bot/db.py, bot/handlers/order_outbox.py): lease tugashi va qayta claim,
+mark_outbox_sent idempotentligi, yuborish va belgilash orasidagi crash.
+"""
+import asyncio
+import dataclasses
+import itertools
+from types import SimpleNamespace
+
+import psycopg2
+from psycopg2.extras import Json
+import pytest
+
+from bot.db import claim_due_outbox, mark_outbox_sent, renew_outbox_lease
+from bot.handlers.order_card import OrderCard
+from bot.handlers.order_outbox import OrderOutbox
+
+pytestmark = pytest.mark.db
+
+ORDER_ID = -47001
+CHAT_ID = -1004700
+LEASE = 120
+CARD = OrderCard(chat_title="test", user_id=1, full_name="Test", phones=["+998901234567"]).to_dict()
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self._ids = itertools.count(1)
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append(chat_id)
+        return SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=next(self._ids))
+
+
+@pytest.fixture
+def conn(settings):
+    conn = psycopg2.connect(settings.db_dsn)
+    conn.autocommit = True
+    cleanup = "DELETE FROM {} WHERE order_id = %s;"
+    try:
+        with conn.cursor() as cur:
+            # finalize'dagi kabi: qator band (lease) holatda yoziladi
+            cur.execute(
+                """
+                INSERT INTO ai_order_outbox (order_id, chat_id, fallback_chat_id, card, attempts, next_attempt_at)
+                VALUES (%s, %s, NULL, %s, 1, now() + make_interval(secs => %s));
+                """,
+                (ORDER_ID, CHAT_ID, Json(CARD), LEASE),
+            )
+        yield conn
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(cleanup.format("ai_order_outbox"), (ORDER_ID,))
+            cur.execute(cleanup.format("ai_order_messages"), (ORDER_ID,))
+        conn.close()
+
+
+def expire_lease(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE ai_order_outbox SET next_attempt_at = now() - interval '1 second' WHERE order_id = %s;",
+            (ORDER_ID,),
+        )
+
+
+def outbox_row(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT status, attempts, sent_message_id, sent_at FROM ai_order_outbox WHERE order_id = %s;",
+            (ORDER_ID,),
+        )
+        return cur.fetchone()
+
+
+def claim_ours(settings):
+    return [row for row in claim_due_outbox(settings, 100, LEASE) if row["order_id"] == ORDER_ID]
+
+
+def test_leased_row_is_reclaimed_only_after_expiry(settings, conn):
+    assert claim_ours(settings) == []
+
+    expire_lease(conn)
+    rows = claim_ours(settings)
+    assert [row["attempts"] for row in rows] == [2]
+    # Yangi lease – boshqa worker yana ololmaydi
+    assert claim_ours(settings) == []
+
+
+def test_mark_outbox_sent_is_idempotent(settings, conn):
+    assert mark_outbox_sent(settings, [(ORDER_ID, CHAT_ID, 1, CHAT_ID, 11)]) == 1
+    first = outbox_row(conn)
+    assert mark_outbox_sent(settings, [(ORDER_ID, CHAT_ID, 1, CHAT_ID, 11)]) == 0
+    assert outbox_row(conn) == first
+    assert first[:3] == ("sent", 1, 11)
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT chat_id, message_id FROM ai_order_messages WHERE order_id = %s;", (ORDER_ID,))
+        assert cur.fetchall() == [(CHAT_ID, 11)]
+
+
+def test_crash_between_send_and_mark(settings, conn):
+    # Birinchi worker yubordi (message_id=11), lekin belgilashdan oldin yiqildi
+    expire_lease(conn)
+    rows = claim_ours(settings)
+    bot = FakeBot()
+    sent = asyncio.run(OrderOutbox().deliver(bot, settings, rows))
+    assert bot.sent == [CHAT_ID]
+    assert len(sent) == 1
+
+    # Eski worker'ning kechikkan belgilashi (attempts=1) yangi natijani buzmaydi
+    assert mark_outbox_sent(settings, [(ORDER_ID, CHAT_ID, 1, CHAT_ID, 11)]) == 0
+    assert outbox_row(conn)[:3] == ("sent", 2, sent[0].message_id)
+    assert claim_ours(settings) == []
+
+
+def test_stale_lease_does_not_send_after_reclaim(settings, conn):
+    # Worker A qatorni oldi (attempts=1), limiter kutishida lease tugadi, B qayta oldi (attempts=2)
+    stale = {"order_id": ORDER_ID, "chat_id": CHAT_ID, "fallback_chat_id": None, "card": CARD, "attempts": 1}
+    expire_lease(conn)
+    assert [row["attempts"] for row in claim_ours(settings)] == [2]
+
+    # lease=0: A yuborishdan oldin lease'ni DB da tekshirishga majbur
+    no_time_left = dataclasses.replace(settings, outbox_lease_seconds=0)
+    outbox = OrderOutbox()
+    bot = FakeBot()
+    assert asyncio.run(outbox.deliver(bot, no_time_left, [stale])) == []
+    assert bot.sent == []
+    assert outbox.lease_lost == 1
+    assert outbox_row(conn)[:2] == ("pending", 2)
+
+
+def test_renew_lease_requires_current_claim(settings, conn):
+    assert renew_outbox_lease(settings, ORDER_ID, CHAT_ID, 1, LEASE)
+    assert not renew_outbox_lease(settings, ORDER_ID, CHAT_ID, 2, LEASE)
+    mark_outbox_sent(settings, [(ORDER_ID, CHAT_ID, 1, CHAT_ID, 11)])
+    assert not renew_outbox_lease(settings, ORDER_ID, CHAT_ID, 1, LEASE)
@@ -0,0 +1,99 @@
+# tests/test_session_store.py
+import asyncio
+import threading
+import time
+
+from bot.models import OrderSession, add_session_text
+from bot.session_store import PER_MESSAGE_BUDGET_US, SessionBackend, SessionStore
+
+
+class SlowBackend(SessionBackend):
+    """
+    save_many thread'da sekin ishlaydi – flush to'xtatish paytida "yo'lda" bo'ladi.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.saved = {}
+        self.writing = threading.Event()
+
+    def save_many(self, rows):
+        self.writing.set()
+        time.sleep(self.delay)
+        self.saved.update(rows)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.saved.pop(key, None)
+
+
+def test_stop_waits_for_in_flight_flush():
+    async def scenario():
+        backend = SlowBackend(delay=0.2)
+        sessions = {(1, 1): OrderSession(user_id=1, chat_id=1)}
+        store = SessionStore(backend, sessions, flush_interval=0.01)
+        store.mark_dirty((1, 1))
+        store.start()
+        await asyncio.to_thread(backend.writing.wait, 1)
+        await store.stop()
+        return backend, store
+
+    backend, store = asyncio.run(scenario())
+    assert (1, 1) in backend.saved
+    assert store.pending() == 0
+
+
+def test_cancelled_flush_requeues_keys():
+    async def scenario():
+        backend = SlowBackend(delay=0.2)
+        sessions = {(1, 1): OrderSession(user_id=1, chat_id=1)}
+        store = SessionStore(backend, sessions)
+        store.mark_dirty((1, 1))
+        task = asyncio.create_task(store.flush())
+        await asyncio.to_thread(backend.writing.wait, 1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return store
+
+    store = asyncio.run(scenario())
+    assert store.pending() == 1
+
+
+class MemoryBackend(SessionBackend):
+    def __init__(self):
+        self.saved = {}
+
+    def save_many(self, rows):
+        self.saved.update(rows)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.saved.pop(key, None)
+
+
+def test_per_message_overhead_within_budget():
+    sessions_count = 1000
+    messages_per_session = 5  # odatiy zakaz: telefon, manzil, summa, mahsulot, izoh
+    messages = sessions_count * messages_per_session
+
+    def one_run() -> float:
+        sessions = {}
+        for i in range(sessions_count):
+            session = OrderSession(user_id=i, chat_id=-1)
+            for j in range(messages_per_session):
+                add_session_text(session, f"xabar {j}: +99890123{i:04d}, 45 000 so'm")
+            sessions[(-1, i)] = session
+        store = SessionStore(MemoryBackend(), sessions)
+
+        started = time.perf_counter()
+        for _ in range(messages_per_session):
+            for key in sessions:
+                store.mark_dirty(key)
+        asyncio.run(store.flush())
+        took = time.perf_counter() - started
+        assert store.rows_written == sessions_count
+        return took
+
+    best = min(one_run() for _ in range(3))
+    per_message_us = best / messages * 1e6
+    assert per_message_us < PER_MESSAGE_BUDGET_US, f"{per_message_us:.1f}us/xabar"